@@ -4,6 +4,7 @@ import argparse
 from pathlib import Path
 
 import cmake_clang_tools_helpers
+from cmake_clang_tools_settings import SettingsIndex
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -25,13 +26,14 @@ def parse_arguments() -> argparse.Namespace:
 def main():
     args = parse_arguments()
 
-    settings = cmake_clang_tools_helpers.load_yaml(args.settings_file)
-    cached_settings = cmake_clang_tools_helpers.load_yaml(args.settings_file_cached)
+    # Nothing changes if the cached settings are a copy of the settings, skip reading them.
+    if cmake_clang_tools_helpers.is_cache_up_to_date(args.settings_file, args.settings_file_cached):
+        return
 
-    should_run = cmake_clang_tools_helpers.should_tool_run_for_project(args.project_name, args.tool_name, settings)
-    cached_should_run = False
-    if cached_settings:
-        cached_should_run = cmake_clang_tools_helpers.should_tool_run_for_project(args.project_name, args.tool_name, cached_settings)
+    # The compiled indices are shared by all projects, the settings are only parsed by the first project after a change.
+    # The cached settings were compiled when they were current, since the index is keyed by the content.
+    should_run = SettingsIndex.open(args.settings_file).should_run(args.project_name, args.tool_name)
+    cached_should_run = SettingsIndex.open(args.settings_file_cached).should_run(args.project_name, args.tool_name)
 
     if should_run and not cached_should_run:
         cmake_clang_tools_helpers.write_trigger(args.trigger_file, True)
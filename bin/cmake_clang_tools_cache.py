@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from shutil import which
+import subprocess
+import tempfile
+import time
+from typing import Any, List, Optional, Tuple, Union
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "cmake_clang_tools"
+DEFAULT_MAX_SIZE_MB = 256
+# Fraction of the maximum size the cache is trimmed to, such that eviction does not run on every store.
+TRIM_RATIO = 0.8
+# Minimum time between two scans of the cache directory for eviction.
+TRIM_INTERVAL_S = 60.0
+RESULTS_DIR = "results"
+# Suffix of the results copied from the shared store, which are kept apart from the results computed on this machine.
+SHARED_ENTRY_SUFFIX = ".shared.json"
+TOOL_VERSIONS_FILE = "tool_versions.json"
+TRIM_STAMP_FILE = ".last_trim"
+# Placeholder of the base directory in the stored results, see ResultCache.
+BASE_DIR_PLACEHOLDER = "${CMAKE_CLANG_TOOLS_BASE_DIR}"
+
+
+def hash_parts(*parts: Union[str, bytes, None]) -> str:
+    """
+    Create a hash over multiple parts.
+    Every part is length-prefixed, such that the boundaries of the parts are part of the hash.
+    :param parts: Parts to hash. Strings are UTF-8 encoded, None is hashed as an empty part.
+    :return: Hexadecimal SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def write_atomic(path: Path, data: bytes, mode: Optional[int] = None) -> None:
+    """
+    Write a file atomically by writing to a temporary file in the same directory and renaming it.
+    :param path: Path of the file to write.
+    :param data: Content of the file.
+    :param mode: Permissions of the file, e.g. those of the replaced file. Defaults to read and write for the owner.
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp-")
+    try:
+        if mode is not None:
+            os.fchmod(file_descriptor, mode)
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, str(path))
+    except BaseException:
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+        raise
+
+
+def executable_signature(executable: str) -> Tuple[str, str]:
+    """
+    Get a signature of an executable that changes if the executable is replaced, e.g. by an update.
+    :param executable: Name or path of the executable.
+    :return: Tuple of the resolved path of the executable and its signature, the signature is empty if the executable is not found.
+    """
+    try:
+        resolved = (Path(executable) if os.sep in executable else Path(which(executable))).resolve()
+        stat = resolved.stat()
+    except (OSError, TypeError):
+        return executable, ""
+    return str(resolved), f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class ResultCache:
+    """
+    Persistent on-disk cache for the results of the clang tools.
+    Entries are stored as JSON files named by their key. Reading an entry updates its modification time,
+    which is used for least recently used eviction once the size of the cache exceeds its limit.
+    Results missing locally are looked up in the shared store and results are stored in both. The results of the shared store are
+    not verified, anyone able to write the store can change them. They are therefore copied to separate entries, which are
+    skipped by lookups of results that are applied to the sources (see get). With a base directory, e.g. the
+    root of the workspace, the results of different checkouts can be shared: The tools pass their paths through normalize when
+    computing the keys and the base directory in the results is replaced by a placeholder.
+    """
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, max_size_mb: float = DEFAULT_MAX_SIZE_MB, shared_store=None,
+                 base_dir: Optional[str] = None):
+        """
+        :param directory: Directory of the cache.
+        :param max_size_mb: Maximum size of the cached results in megabytes.
+        :param shared_store: Store shared with other machines, see cmake_clang_tools_shared_store.
+        :param base_dir: Directory whose paths are stored relative to it.
+        """
+        self.directory = Path(directory)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.shared_store = shared_store
+        self.base_dir = os.path.normpath(os.path.abspath(base_dir)) + os.sep if base_dir else None
+        # Keys already looked up in the shared store by prefetch.
+        self._prefetched_keys = set()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _entry_path(self, key: str, shared: bool = False) -> Path:
+        return self.directory / RESULTS_DIR / key[:2] / f"{key[2:]}{SHARED_ENTRY_SUFFIX if shared else '.json'}"
+
+    def normalize(self, text: str) -> str:
+        """
+        Make the paths in a part of a key relative to the base directory.
+        :param text: Part of a key, e.g. a path or the compile command.
+        :return: The text without the base directory.
+        """
+        return text.replace(self.base_dir, "") if self.base_dir else text
+
+    def _serialize(self, value: Any) -> bytes:
+        text = json.dumps(value, separators=(",", ":"))
+        if self.base_dir:
+            text = text.replace(json.dumps(self.base_dir)[1:-1], BASE_DIR_PLACEHOLDER + "/")
+        return text.encode("utf-8")
+
+    def _deserialize(self, data: bytes) -> Any:
+        text = data.decode("utf-8")
+        if self.base_dir:
+            text = text.replace(BASE_DIR_PLACEHOLDER + "/", json.dumps(self.base_dir)[1:-1])
+        return json.loads(text)
+
+    def _store_locally(self, key: str, data: bytes, shared: bool = False) -> None:
+        path = self._entry_path(key, shared)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, data)
+        except OSError:
+            return
+        self.stores += 1
+
+    def get(self, key: str, local_only: bool = False) -> Optional[Any]:
+        """
+        Look up a cached result.
+        :param key: Key of the entry, see hash_parts.
+        :param local_only: Only return results computed on this machine, e.g. if the result is applied to the sources.
+        :return: The cached result or None if the key is not cached.
+        """
+        value = self._read_entry(self._entry_path(key))
+        if value is None and not local_only:
+            value = self._read_entry(self._entry_path(key, shared=True))
+            data = self.shared_store.get(key) if value is None and self.shared_store and key not in self._prefetched_keys else None
+            if data is not None:
+                try:
+                    value = self._deserialize(data)
+                    self._store_locally(key, data, shared=True)
+                except ValueError:
+                    value = None
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def _read_entry(self, path: Path) -> Optional[Any]:
+        try:
+            with open(path, "rb") as file:
+                value = self._deserialize(file.read())
+            # Mark the entry as recently used.
+            os.utime(str(path))
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def prefetch(self, keys: List[str]) -> None:
+        """
+        Copy the results missing locally from the shared store with a bulk lookup, such that they are found by get.
+        :param keys: Keys of the entries looked up next.
+        """
+        if not self.shared_store:
+            return
+        missing_keys = [key for key in keys if not self._entry_path(key).exists() and not self._entry_path(key, shared=True).exists()]
+        self._prefetched_keys.update(missing_keys)
+        for key, data in self.shared_store.get_many(missing_keys).items():
+            self._store_locally(key, data, shared=True)
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        Store a result in the cache. Failures to write the cache are ignored, the cache is only an optimization.
+        :param key: Key of the entry, see hash_parts.
+        :param value: JSON serializable result.
+        """
+        data = self._serialize(value)
+        self._store_locally(key, data)
+        if self.shared_store:
+            self.shared_store.put(key, data)
+
+    def trim(self, force: bool = False) -> None:
+        """
+        Evict the least recently used entries until the cache is below its size limit.
+        The scan of the cache directory is rate limited, unless force is set.
+        :param force: Scan the cache even if it was recently trimmed.
+        """
+        stamp = self.directory / TRIM_STAMP_FILE
+        try:
+            if not force and time.time() - stamp.stat().st_mtime < TRIM_INTERVAL_S:
+                return
+        except OSError:
+            pass
+
+        entries = list()
+        total_size = 0
+        results_dir = self.directory / RESULTS_DIR
+        try:
+            for shard in os.scandir(str(results_dir)):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        except OSError:
+            return
+
+        if total_size > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    continue
+                total_size -= size
+                if total_size <= self.max_size * TRIM_RATIO:
+                    break
+
+        try:
+            stamp.touch()
+        except OSError:
+            pass
+
+    def tool_version(self, executable: str) -> str:
+        """
+        Get the version string of a clang tool.
+        The version is cached by the path, size and modification time of the executable, to avoid running the tool.
+        :param executable: The executable of the tool.
+        :return: Output of 'executable --version'.
+        """
+        path, signature = executable_signature(executable)
+        versions_file = self.directory / TOOL_VERSIONS_FILE
+        versions = dict()
+        try:
+            with open(versions_file, "rb") as file:
+                versions = json.loads(file.read().decode("utf-8"))
+        except (OSError, ValueError):
+            pass
+
+        cached = versions.get(path)
+        if signature and cached and cached.get("signature") == signature:
+            return cached["version"]
+
+        version = subprocess.check_output([executable, "--version"], universal_newlines=True)
+        if signature:
+            versions[path] = {"signature": signature, "version": version}
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                write_atomic(versions_file, json.dumps(versions).encode("utf-8"))
+            except OSError:
+                pass
+        return version
+
@@ -0,0 +1,202 @@
+import json
+import os
+from pathlib import Path
+import re
+import shlex
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+COMPILE_COMMANDS_FILE = "compile_commands.json"
+# Compiler arguments that take a value and only influence the output, not the preprocessing.
+OUTPUT_ARGUMENTS_WITH_VALUE = {"-o", "-MF", "-MT", "-MQ"}
+OUTPUT_ARGUMENTS = {"-c", "-M", "-MM", "-MD", "-MMD", "-MP", "-MG"}
+
+
+def parse_make_dependencies(text: str) -> List[str]:
+    """
+    Parse the dependencies of a make rule, as written by the compiler with '-M' or to a depfile.
+    :param text: Make rule text 'target: dependency1 dependency2 ...'.
+    :return: List of dependencies in order of appearance, without duplicates.
+    """
+    # Join continuation lines and drop the targets.
+    text = text.replace("\\\n", " ").replace("\\\r\n", " ")
+    dependencies = list()
+    seen = set()
+    for rule in text.splitlines():
+        match = re.match(r"^(?:[^:\\]|\\.)*?:(?:\s|$)", rule)
+        if not match:
+            continue
+        # Split on unescaped whitespace.
+        for dependency in re.findall(r"(?:\\.|[^\s\\])+", rule[match.end():]):
+            dependency = re.sub(r"\\(.)", r"\1", dependency).replace("$$", "$")
+            if dependency not in seen:
+                seen.add(dependency)
+                dependencies.append(dependency)
+    return dependencies
+
+
+class CompileDatabase:
+    """
+    Lookup of the compile commands of a build directory, as written by CMake with CMAKE_EXPORT_COMPILE_COMMANDS.
+    """
+
+    def __init__(self, entries: List[dict]):
+        """
+        :param entries: Entries of the compile_commands.json file.
+        """
+        self.entries = dict()
+        self._dependencies = dict()
+        for entry in entries:
+            directory = entry.get("directory", "")
+            file = os.path.normpath(os.path.join(directory, entry["file"]))
+            self.entries[file] = entry
+
+    @classmethod
+    def load(cls, build_directory: str) -> "CompileDatabase":
+        """
+        Load the compile database of a build directory.
+        A missing database results in an empty lookup, since clang-tidy reports that error itself.
+        :param build_directory: Directory containing the compile_commands.json file.
+        :return: The compile database.
+        """
+        path = Path(build_directory or ".") / COMPILE_COMMANDS_FILE
+        try:
+            with open(path, "rb") as file:
+                return cls(json.loads(file.read().decode("utf-8")))
+        except OSError:
+            return cls(list())
+        except ValueError as json_error:
+            sys.exit(f"Compile database '{path}' can not be parsed: {json_error}")
+
+    def get(self, file: Path) -> Optional[dict]:
+        """
+        Get the compile database entry of a file.
+        :param file: Source file.
+        :return: The entry or None if the file is not part of the database.
+        """
+        return self.entries.get(os.path.normpath(os.path.abspath(str(file))))
+
+    def arguments(self, file: Path) -> List[str]:
+        """
+        Get the compiler arguments of a file.
+        :param file: Source file.
+        :return: List of arguments including the compiler, empty if the file is not part of the database.
+        """
+        entry = self.get(file)
+        if entry is None:
+            return list()
+        if "arguments" in entry:
+            return list(entry["arguments"])
+        return shlex.split(entry.get("command", ""))
+
+    def depfile(self, file: Path) -> Optional[Path]:
+        """
+        Get the dependency file the compiler writes for a source file (see the '-MF' option).
+        :param file: Source file.
+        :return: Path of the dependency file or None if the compile command does not write one.
+        """
+        entry = self.get(file)
+        arguments = self.arguments(file)
+        for index, argument in enumerate(arguments):
+            if argument == "-MF" and index + 1 < len(arguments):
+                depfile = arguments[index + 1]
+            elif argument.startswith("-MF") and argument != "-MF":
+                depfile = argument[3:]
+            else:
+                continue
+            return Path(os.path.normpath(os.path.join(entry.get("directory", ""), depfile)))
+        return None
+
+    def dependencies(self, file: Path) -> Optional[List[str]]:
+        """
+        Get the files included by a source file (transitively).
+        The dependency file written by the compiler is used if it is up to date. Otherwise the preprocessor of the compile
+        command is run.
+        :param file: Source file.
+        :return: List of absolute paths of the source file and its dependencies or None if they can not be determined.
+        """
+        return self._get_dependencies(file)[1]
+
+    def dependency_spellings(self, file: Path) -> Optional[List[str]]:
+        """
+        Get the files included by a source file as written by the compiler, e.g. relative to the directory of the compile command
+        for relative include directories. This is the name clang-tidy matches the header filter with.
+        :param file: Source file.
+        :return: List of the dependencies in the order of the paths of dependencies or None if they can not be determined.
+        """
+        return self._get_dependencies(file)[0]
+
+    def _get_dependencies(self, file: Path) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+        key = os.path.normpath(os.path.abspath(str(file)))
+        if key not in self._dependencies:
+            spellings = self._read_depfile(file) or self._run_preprocessor(file)
+            dependencies = None
+            if spellings is not None:
+                directory = self.get(file).get("directory") or os.getcwd()
+                dependencies = [os.path.normpath(os.path.join(directory, dependency)) for dependency in spellings]
+            self._dependencies[key] = (spellings, dependencies)
+        return self._dependencies[key]
+
+    def invalidate(self, file: Path) -> None:
+        """
+        Forget the dependencies of a source file, e.g. after it was edited, such that they are determined again.
+        :param file: Source file.
+        """
+        self._dependencies.pop(os.path.normpath(os.path.abspath(str(file))), None)
+
+    def _read_depfile(self, file: Path) -> Optional[List[str]]:
+        depfile = self.depfile(file)
+        if depfile is None:
+            return None
+        directory = self.get(file).get("directory") or os.getcwd()
+        try:
+            depfile_mtime = depfile.stat().st_mtime_ns
+            with open(depfile, 'r') as dependency_file:
+                dependencies = parse_make_dependencies(dependency_file.read())
+            # The dependency file is outdated if any of its dependencies changed after the last compilation.
+            if not dependencies or any(os.stat(os.path.join(directory, dependency)).st_mtime_ns > depfile_mtime
+                                       for dependency in dependencies):
+                return None
+        except (OSError, IOError):
+            return None
+        return dependencies
+
+    def _run_preprocessor(self, file: Path) -> Optional[List[str]]:
+        entry = self.get(file)
+        arguments = self.arguments(file)
+        if entry is None or not arguments:
+            return None
+
+        # Remove the output options and ask the preprocessor for the dependencies instead.
+        command = list()
+        skip_next = False
+        for argument in arguments:
+            if skip_next:
+                skip_next = False
+            elif argument in OUTPUT_ARGUMENTS_WITH_VALUE:
+                skip_next = True
+            elif argument in OUTPUT_ARGUMENTS or any(argument.startswith(prefix) and argument != prefix
+                                                     for prefix in OUTPUT_ARGUMENTS_WITH_VALUE):
+                continue
+            else:
+                command.append(argument)
+        # The headers of system include directories are listed as well, e.g. of other packages included with '-isystem'.
+        command += ["-M", "-w"]
+
+        directory = entry.get("directory") or None
+        try:
+            output = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    universal_newlines=True)
+        except OSError:
+            return None
+        if output.returncode != 0:
+            return None
+        return parse_make_dependencies(output.stdout)
+
+    def files(self) -> List[str]:
+        """
+        :return: Sorted list of the absolute paths of all files in the database.
+        """
+        return sorted(self.entries)
+
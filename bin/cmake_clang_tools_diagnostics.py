@@ -0,0 +1,148 @@
+from collections import namedtuple
+import json
+import os
+from pathlib import Path
+import re
+import sys
+from typing import Dict, List, TextIO, Tuple
+
+from cmake_clang_tools_cache import write_atomic
+
+"""
+Diagnostic type.
+   Attributes:
+        file        Normalized path of the file.
+        line        Line of the diagnostic, starting at 1.
+        column      Column of the diagnostic, starting at 1.
+        level       Either 'warning', 'error' or 'remark'.
+        message     Message of the diagnostic.
+        check       Names of the checks reporting the diagnostic, separated by commas, without '-warnings-as-errors'. Empty for compiler
+                    diagnostics without a name.
+        notes       Tuple of the lines of the notes attached to the diagnostic.
+"""
+Diagnostic = namedtuple("Diagnostic", "file line column level message check notes")
+
+DIAGNOSTIC_REGEX = re.compile(r"^(?P<file>.+?):(?P<line>\d+):(?P<column>\d+): (?P<level>warning|error|note|remark): "
+                              r"(?P<message>.*?)(?: \[(?P<check>[^\]\s]+)\])?$")
+# Suffix of the check group of the warnings promoted to errors by '-warnings-as-errors', which is no check.
+WARNINGS_AS_ERRORS = "-warnings-as-errors"
+# Messages of clang-tidy, which are reported unlike the source excerpts following the diagnostics.
+MESSAGE_REGEX = re.compile(r"^(?:Error while processing |Found compiler errors?|Error: |error: )")
+# Check name of the diagnostics without one in the summary.
+UNNAMED_CHECK = "clang-diagnostic"
+
+
+def parse_clang_tidy_output(output: str) -> Tuple[List[Diagnostic], List[str]]:
+    """
+    Parse the output of clang-tidy for a translation unit.
+    The source excerpts and fix-it hints following the diagnostics and the statistics of clang-tidy, like 'N warnings
+    generated.', are dropped.
+    :param output: Standard output and error of clang-tidy.
+    :return: Tuple of the diagnostics, in the order of the output, and the other messages of clang-tidy, e.g. the errors of
+             failed runs.
+    """
+    diagnostics = list()
+    messages = list()
+    diagnostic = None
+    notes = list()
+    for line in output.splitlines():
+        match = DIAGNOSTIC_REGEX.match(line)
+        if match and match.group("level") == "note" and diagnostic:
+            notes.append(line)
+            continue
+        if match:
+            if diagnostic:
+                diagnostics.append(diagnostic._replace(notes=tuple(notes)))
+            checks = [check for check in (match.group("check") or "").split(",") if check != WARNINGS_AS_ERRORS]
+            diagnostic = Diagnostic(os.path.normpath(match.group("file")), int(match.group("line")), int(match.group("column")),
+                                    match.group("level"), match.group("message"), ",".join(checks), ())
+            notes = list()
+        elif MESSAGE_REGEX.match(line):
+            messages.append(line)
+    if diagnostic:
+        diagnostics.append(diagnostic._replace(notes=tuple(notes)))
+    return diagnostics, messages
+
+
+def format_diagnostic(diagnostic: Diagnostic) -> str:
+    """
+    :param diagnostic: The diagnostic.
+    :return: The diagnostic and its notes in the format of clang-tidy, without the source excerpts.
+    """
+    check = f" [{diagnostic.check}]" if diagnostic.check else ""
+    text = f"{diagnostic.file}:{diagnostic.line}:{diagnostic.column}: {diagnostic.level}: {diagnostic.message}{check}"
+    return "\n".join([text, *diagnostic.notes])
+
+
+class DiagnosticCollector:
+    """
+    Collects the diagnostics of the translation units of a run. Diagnostics reported by multiple translation units, e.g. in
+    headers, are only kept once.
+    """
+
+    def __init__(self):
+        self.diagnostics = list()
+        self.duplicates = 0
+        self._seen_diagnostics = set()
+
+    def add_output(self, output: str) -> List[str]:
+        """
+        Add the diagnostics of a translation unit.
+        :param output: Output of clang-tidy for the translation unit, see parse_clang_tidy_output.
+        :return: The other messages of clang-tidy, which are not collected.
+        """
+        diagnostics, messages = parse_clang_tidy_output(output)
+        for diagnostic in diagnostics:
+            # The notes are part of the identity, e.g. the locations of the duplicated code.
+            if diagnostic in self._seen_diagnostics:
+                self.duplicates += 1
+            else:
+                self._seen_diagnostics.add(diagnostic)
+                self.diagnostics.append(diagnostic)
+        return messages
+
+    def get_check_counts(self) -> Dict[str, int]:
+        """
+        :return: Dictionary mapping the check names to the number of their diagnostics, sorted by name. Diagnostics reported
+                 under multiple names count for each of them.
+        """
+        counts = dict()
+        for diagnostic in self.diagnostics:
+            for check in (diagnostic.check or UNNAMED_CHECK).split(","):
+                counts[check] = counts.get(check, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def print_report(self, tool_label: str, stream: TextIO = sys.stdout) -> None:
+        """
+        Print the diagnostics sorted by their location, followed by the number of diagnostics per check.
+        :param tool_label: Name of the tool in the summary, e.g. 'clang-tidy'.
+        :param stream: Stream to print to.
+        """
+        for diagnostic in sorted(self.diagnostics):
+            print(format_diagnostic(diagnostic), file=stream)
+        if self.diagnostics:
+            files = len({diagnostic.file for diagnostic in self.diagnostics})
+            checks = ", ".join(f"{check}: {count}" for check, count in self.get_check_counts().items())
+            text = f"[{tool_label}] {len(self.diagnostics)} diagnostics in {files} files"
+            if self.duplicates:
+                text += f" ({self.duplicates} duplicates omitted)"
+            print(f"{text}, {checks}.", file=stream)
+        stream.flush()
+
+    def write_summary(self, summary_file: Path, tool_name: str) -> None:
+        """
+        Write the number of diagnostics per check and level as JSON, such that the summaries of runs can be compared.
+        :param summary_file: Path of the summary file.
+        :param tool_name: Name of the tool reporting the diagnostics, e.g. 'clang-tidy'.
+        """
+        levels = dict()
+        for diagnostic in self.diagnostics:
+            levels[diagnostic.level] = levels.get(diagnostic.level, 0) + 1
+        summary = {"tool": tool_name, "diagnostics": len(self.diagnostics), "duplicates": self.duplicates,
+                   "files": len({diagnostic.file for diagnostic in self.diagnostics}), "levels": dict(sorted(levels.items())),
+                   "checks": self.get_check_counts()}
+        try:
+            Path(summary_file).parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(Path(summary_file), (json.dumps(summary, indent=2) + "\n").encode("utf-8"))
+        except (OSError, IOError) as file_error:
+            sys.exit(f"Summary file '{summary_file}' could not be written: {file_error}")
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import namedtuple
+import json
+import os
+from pathlib import Path
+import re
+import sys
+from typing import Dict, List, Optional, Pattern
+
+from cmake_clang_tools_cache import write_atomic
+
+# File categories of the CMake macros and their extensions, matching the former file(GLOB_RECURSE) patterns.
+FILE_CATEGORIES = {
+    "CXX_SOURCE_FILES": ["cpp", "cxx", "cc", "c"],
+    "HXX_SOURCE_FILES": ["hpp", "tpp", "hxx", "txx", "hh", "h", "t"],
+    "PROTO_FILES": ["proto"],
+}
+# Categories the excluded directories apply to, the header exclude directories of clang-tidy.
+EXCLUDABLE_CATEGORIES = {"HXX_SOURCE_FILES"}
+# Prefix of the CMake variables written with '--cmake-output'.
+CMAKE_VARIABLE_PREFIX = "CLANG_TOOLING_"
+GITIGNORE_FILE = ".gitignore"
+# Directories that are never searched.
+SKIPPED_DIRECTORIES = {".git", ".hg", ".svn"}
+
+"""
+Ignore rule of a .gitignore file.
+   Attributes:
+        regex           Compiled pattern matching the path relative to the directory of the .gitignore file.
+        negated         The rule re-includes the matched paths ('!pattern').
+        directory_only  The rule only matches directories ('pattern/').
+"""
+IgnoreRule = namedtuple("IgnoreRule", "regex negated directory_only")
+
+"""
+Cached listing of a directory.
+   Attributes:
+        mtime_ns    Modification time of the directory, changes if entries are added, removed or renamed.
+        files       Names of the files in the directory.
+        directories Names of the subdirectories.
+        gitignore   Modification time and lines of the .gitignore file of the directory or None.
+"""
+DirectoryListing = namedtuple("DirectoryListing", "mtime_ns files directories gitignore")
+
+
+def translate_gitignore_pattern(pattern: str) -> str:
+    """
+    Translate a .gitignore pattern to a regular expression matching the paths relative to the directory of the .gitignore file.
+    :param pattern: Pattern without negation and trailing slash.
+    :return: The regular expression.
+    """
+    # Patterns containing a slash are relative to the directory of the .gitignore file, others match at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = list()
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            regex.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("**", index):
+            regex.append(".*")
+            index += 2
+        elif pattern[index] == "*":
+            regex.append("[^/]*")
+            index += 1
+        elif pattern[index] == "?":
+            regex.append("[^/]")
+            index += 1
+        elif pattern[index] == "[" and "]" in pattern[index + 2:]:
+            end = pattern.index("]", index + 2)
+            characters = pattern[index + 1:end]
+            regex.append("[" + ("^" + characters[1:] if characters[0] == "!" else characters).replace("\\", "\\\\") + "]")
+            index = end + 1
+        elif pattern[index] == "\\" and index + 1 < len(pattern):
+            regex.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            regex.append(re.escape(pattern[index]))
+            index += 1
+    return ("" if anchored else "(?:.*/)?") + "".join(regex)
+
+
+def parse_gitignore(lines: List[str]) -> List[IgnoreRule]:
+    """
+    Parse the lines of a .gitignore file.
+    :param lines: Lines of the file.
+    :return: List of ignore rules in the order of the file.
+    """
+    rules = list()
+    for line in lines:
+        # Trailing spaces are ignored unless they are escaped.
+        line = line.rstrip("\n")
+        if not line.endswith("\\ "):
+            line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        if line:
+            rules.append(IgnoreRule(re.compile(translate_gitignore_pattern(line)), negated, directory_only))
+    return rules
+
+
+def is_ignored(path: str, is_directory: bool, gitignores: List[tuple]) -> bool:
+    """
+    Check whether a path is ignored by the .gitignore files of its parent directories.
+    :param path: Absolute path.
+    :param is_directory: The path is a directory.
+    :param gitignores: Tuples of the directory and the ignore rules of the applying .gitignore files, outermost first.
+    :return: True if the last matching rule ignores the path.
+    """
+    ignored = False
+    for directory, rules in gitignores:
+        relative_path = path[len(directory) + 1:]
+        for rule in rules:
+            if (is_directory or not rule.directory_only) and rule.regex.fullmatch(relative_path):
+                ignored = not rule.negated
+    return ignored
+
+
+def create_matcher(categories: Dict[str, List[str]], excludes: List[str]) -> Pattern:
+    """
+    Create one regular expression matching the files of all categories and the excluded paths.
+    The name of the matched category is the last group of a match, the group 'excluded' is set if the path contains an exclude.
+    :param categories: Dictionary mapping the category names to their file extensions.
+    :param excludes: Substrings of the excluded paths, e.g. directories.
+    :return: The compiled regular expression.
+    """
+    exclude_regex = f"(?P<excluded>(?=.*(?:{'|'.join(re.escape(exclude) for exclude in excludes)})))?" if excludes else ""
+    category_regex = "|".join(f"(?P<{name}>{'|'.join(re.escape(extension) for extension in extensions)})"
+                              for name, extensions in categories.items())
+    return re.compile(f"^{exclude_regex}.*\\.(?:{category_regex})$")
+
+
+def find_gitignore_root(directory: str) -> str:
+    """
+    Find the root of the repository containing a directory, whose .gitignore files apply to the directory.
+    :param directory: Absolute path of the directory.
+    :return: Root directory of the repository or the directory itself if it is not in a repository.
+    """
+    parent = directory
+    while True:
+        if os.path.exists(os.path.join(parent, ".git")):
+            return parent
+        next_parent = os.path.dirname(parent)
+        if next_parent == parent:
+            return directory
+        parent = next_parent
+
+
+class FileDiscovery:
+    """
+    Recursive file discovery in a single pass over every directory with os.scandir.
+    The files of all categories are matched by one regular expression and the .gitignore files are honored. The listings of
+    the directories can be cached in a file, such that unchanged directories (same modification time) are not read again,
+    e.g. between the configuration and the build.
+    """
+
+    def __init__(self, categories: Optional[Dict[str, List[str]]] = None, excludes: Optional[List[str]] = None, gitignore: bool = True,
+                 listing_cache_file: Optional[Path] = None):
+        """
+        :param categories: Dictionary mapping the category names to their file extensions, defaults to FILE_CATEGORIES.
+        :param excludes: Substrings of the paths excluded from the EXCLUDABLE_CATEGORIES.
+        :param gitignore: Skip the files and directories ignored by .gitignore files.
+        :param listing_cache_file: JSON file to cache the directory listings in.
+        """
+        self.categories = categories or FILE_CATEGORIES
+        self.matcher = create_matcher(self.categories, excludes or list())
+        self.gitignore = gitignore
+        self.listing_cache_file = listing_cache_file
+        self._listings = dict()
+        self._listings_changed = False
+        self._gitignore_rules = dict()
+        if listing_cache_file:
+            try:
+                with open(listing_cache_file, 'r') as cache_file:
+                    self._listings = {directory: DirectoryListing(*listing) for directory, listing in json.load(cache_file).items()}
+            except (OSError, IOError, ValueError, TypeError):
+                self._listings = dict()
+
+    def list_directory(self, directory: str) -> Optional[DirectoryListing]:
+        """
+        List a directory or take the listing from the cache if the directory did not change.
+        :param directory: Absolute path of the directory.
+        :return: The listing or None if the directory can not be read.
+        """
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        listing = self._listings.get(directory)
+        if listing and listing.mtime_ns == mtime_ns:
+            if listing.gitignore is None or not self.gitignore:
+                return listing
+            # The .gitignore file can change without changing the directory.
+            try:
+                if os.stat(os.path.join(directory, GITIGNORE_FILE)).st_mtime_ns == listing.gitignore[0]:
+                    return listing
+            except OSError:
+                pass
+
+        files = list()
+        directories = list()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    # Symbolic links to directories are not followed, like file(GLOB_RECURSE).
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.name)
+                    elif entry.is_file():
+                        files.append(entry.name)
+        except OSError:
+            return None
+        gitignore = None
+        if GITIGNORE_FILE in files:
+            gitignore_path = os.path.join(directory, GITIGNORE_FILE)
+            try:
+                with open(gitignore_path, 'r', errors="replace") as gitignore_file:
+                    gitignore = [os.stat(gitignore_path).st_mtime_ns, gitignore_file.readlines()]
+            except (OSError, IOError):
+                gitignore = None
+        listing = DirectoryListing(mtime_ns, sorted(files), sorted(directories), gitignore)
+        self._listings[directory] = listing
+        self._listings_changed = True
+        return listing
+
+    def _get_gitignore_rules(self, directory: str, listing: Optional[DirectoryListing]) -> List[IgnoreRule]:
+        if listing is None or listing.gitignore is None:
+            return list()
+        cache_key = (directory, listing.gitignore[0])
+        if cache_key not in self._gitignore_rules:
+            self._gitignore_rules[cache_key] = parse_gitignore(listing.gitignore[1])
+        return self._gitignore_rules[cache_key]
+
+    def _get_parent_gitignores(self, directory: str) -> Optional[List[tuple]]:
+        # The .gitignore files between the repository root and the searched directory apply too.
+        # Returns None if the directory or one of its parents is ignored.
+        gitignores = list()
+        if not self.gitignore:
+            return gitignores
+        root = find_gitignore_root(directory)
+        parents = list()
+        parent = directory
+        while parent != root:
+            parent = os.path.dirname(parent)
+            parents.insert(0, parent)
+        for index, parent in enumerate(parents):
+            rules = self._get_gitignore_rules(parent, self.list_directory(parent))
+            if rules:
+                gitignores.append((parent, rules))
+            child = parents[index + 1] if index + 1 < len(parents) else directory
+            if gitignores and is_ignored(child, True, gitignores):
+                return None
+        return gitignores
+
+    def discover(self, directories: List[str]) -> Dict[str, List[str]]:
+        """
+        Find the files of all categories in the directories and their subdirectories.
+        Missing and ignored directories are skipped.
+        :param directories: Directories to search.
+        :return: Dictionary mapping every category to the sorted list of absolute file paths.
+        """
+        found_files = {category: set() for category in self.categories}
+        for root_directory in directories:
+            root_directory = os.path.normpath(os.path.abspath(root_directory))
+            if not os.path.isdir(root_directory):
+                continue
+            parent_gitignores = self._get_parent_gitignores(root_directory)
+            if parent_gitignores is None:
+                continue
+            stack = [(root_directory, parent_gitignores)]
+            while stack:
+                directory, gitignores = stack.pop()
+                listing = self.list_directory(directory)
+                if listing is None:
+                    continue
+                rules = self._get_gitignore_rules(directory, listing) if self.gitignore else list()
+                if rules:
+                    gitignores = gitignores + [(directory, rules)]
+                for name in listing.files:
+                    path = os.path.join(directory, name)
+                    match = self.matcher.match(path)
+                    if not match or (gitignores and is_ignored(path, False, gitignores)):
+                        continue
+                    category = match.lastgroup
+                    excluded = "excluded" in self.matcher.groupindex and match.group("excluded") is not None
+                    if not excluded or category not in EXCLUDABLE_CATEGORIES:
+                        found_files[category].add(path)
+                for name in reversed(listing.directories):
+                    path = os.path.join(directory, name)
+                    if name not in SKIPPED_DIRECTORIES and not (gitignores and is_ignored(path, True, gitignores)):
+                        stack.append((path, gitignores))
+        return {category: sorted(files) for category, files in found_files.items()}
+
+    def save(self) -> None:
+        """
+        Write the directory listings to the cache file, if they changed.
+        """
+        if not self.listing_cache_file or not self._listings_changed:
+            return
+        try:
+            Path(self.listing_cache_file).parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(Path(self.listing_cache_file), json.dumps({directory: list(listing)
+                                                                    for directory, listing in self._listings.items()}).encode("utf-8"))
+        except (OSError, IOError) as file_error:
+            print(f"Listing cache '{self.listing_cache_file}' could not be written: {file_error}", file=sys.stderr)
+
+
+def format_cmake_lists(files: Dict[str, List[str]]) -> str:
+    """
+    Format the discovered files as CMake script, that sets one list variable per category.
+    :param files: Dictionary mapping the categories to their files.
+    :return: The CMake script.
+    """
+    def quote(path: str) -> str:
+        return '"' + path.replace("\\", "\\\\").replace('"', '\\"').replace("$", "\\$").replace(";", "\\;") + '"'
+
+    return "".join(f"set({CMAKE_VARIABLE_PREFIX}{category}\n" + "".join(f"  {quote(file)}\n" for file in category_files) + ")\n"
+                   for category, category_files in files.items())
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :return: Namespace object that contains the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Find the sources, headers and proto files in directories, honoring .gitignore.")
+    parser.add_argument("--cmake-output", default=None, type=Path,
+                        help=f"Write the files as CMake script setting the variables {CMAKE_VARIABLE_PREFIX}<category>. The file "
+                             f"is only written if the files changed, such that it can be a dependency of the configuration.")
+    parser.add_argument("--listing-cache", default=None, type=Path, help="JSON file caching the directory listings.")
+    parser.add_argument("--exclude", action="append", default=[], help="Exclude the headers whose path contains the string.")
+    parser.add_argument("--no-gitignore", action="store_true", help="Do not skip the files ignored by .gitignore files.")
+    parser.add_argument("directories", nargs="*", help="Directories to search recursively.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    discovery = FileDiscovery(excludes=args.exclude, gitignore=not args.no_gitignore, listing_cache_file=args.listing_cache)
+    files = discovery.discover(args.directories)
+    discovery.save()
+
+    if not args.cmake_output:
+        for category_files in files.values():
+            for file in category_files:
+                print(file)
+        return
+    content = format_cmake_lists(files).encode("utf-8")
+    try:
+        if args.cmake_output.read_bytes() == content:
+            return
+    except (OSError, IOError):
+        pass
+    try:
+        args.cmake_output.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(args.cmake_output, content)
+    except (OSError, IOError) as file_error:
+        sys.exit(f"File list '{args.cmake_output}' could not be written: {file_error}")
+
+
+if __name__ == "__main__":
+    main()
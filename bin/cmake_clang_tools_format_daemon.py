@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import OrderedDict, deque
+import fcntl
+import json
+import os
+from pathlib import Path
+from shutil import which
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+import cmake_clang_tools_helpers
+
+CONFIG_FILE_SEARCH = "file"
+STYLE_FILE_NAMES = [".clang-format", "_clang-format"]
+DEFAULT_SOCKET_PATH = Path(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()) / \
+                      f"cmake_clang_tools-{os.getuid()}" / "clang-format.sock"
+# Time without requests after which the daemon shuts down.
+DEFAULT_IDLE_TIMEOUT_S = 300.0
+# Time the client waits for a newly started daemon, before falling back to running clang-format itself.
+START_TIMEOUT_S = 5.0
+# Number of clang-format processes kept waiting for input per style and file type.
+WARM_WORKERS = 2
+# Maximum number of styles and file types with warm processes, the least recently used ones are stopped.
+MAX_POOLS = 16
+HEADER_FORMAT = "!I"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+# Layout of the peer credentials of a Unix socket (struct ucred: pid, uid, gid).
+PEER_CREDENTIALS_FORMAT = "3i"
+
+
+def create_private_directory(directory: Path) -> None:
+    """
+    Create the directory of the daemon socket, which must only be accessible by the current user.
+    Otherwise another user could serve the socket and inject replacements, or request to run any executable as this user.
+    :param directory: Directory of the socket.
+    :raises PermissionError: If the directory exists but is not a directory owned by and only accessible to the current user.
+    """
+    directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # The directory is checked without following symbolic links, since a link may point to a directory of another user.
+    directory_stat = os.lstat(str(directory))
+    if not stat.S_ISDIR(directory_stat.st_mode) or directory_stat.st_uid != os.getuid() or \
+            stat.S_IMODE(directory_stat.st_mode) != 0o700:
+        raise PermissionError(f"Daemon directory '{directory}' is not a private directory of the current user.")
+
+
+def is_same_user(connection: socket.socket) -> bool:
+    """
+    Check that the peer of a Unix socket runs as the current user.
+    Without SO_PEERCRED (other systems than Linux) only the private directory of the socket protects it.
+    :param connection: Connected Unix socket.
+    :return: True if the peer runs as the current user.
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    try:
+        credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize(PEER_CREDENTIALS_FORMAT))
+    except OSError:
+        return False
+    _, uid, _ = struct.unpack(PEER_CREDENTIALS_FORMAT, credentials)
+    return uid == os.getuid()
+
+
+def send_message(connection: socket.socket, header: dict, payload: bytes = bytes()) -> None:
+    """
+    Send a message consisting of a JSON header and a binary payload.
+    :param connection: Connected socket.
+    :param header: JSON serializable header. The size of the payload is added to it.
+    :param payload: Binary payload, e.g. the content of a file.
+    """
+    header = json.dumps(dict(header, size=len(payload))).encode("utf-8")
+    connection.sendall(struct.pack(HEADER_FORMAT, len(header)) + header + payload)
+
+
+def receive_exactly(connection: socket.socket, size: int) -> bytes:
+    """
+    Receive a given number of bytes.
+    :param connection: Connected socket.
+    :param size: Number of bytes to receive.
+    :return: The received bytes.
+    """
+    chunks = list()
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed during a message.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def receive_message(connection: socket.socket) -> Tuple[dict, bytes]:
+    """
+    Receive a message sent with send_message.
+    :param connection: Connected socket.
+    :return: Tuple of the header and the payload.
+    """
+    header_size, = struct.unpack(HEADER_FORMAT, receive_exactly(connection, HEADER_SIZE))
+    header = json.loads(receive_exactly(connection, header_size).decode("utf-8"))
+    return header, receive_exactly(connection, header.get("size", 0))
+
+
+def find_style_directory(file: Path) -> Tuple[Path, str]:
+    """
+    Find the directory of the style file clang-format uses for a file, when searching the parent directories.
+    :param file: Absolute path of the formatted file.
+    :return: Tuple of the directory of the style file, or the root directory if there is none, and a signature of the style file.
+    """
+    for parent in file.parents:
+        for style_file_name in STYLE_FILE_NAMES:
+            try:
+                stat = (parent / style_file_name).stat()
+            except OSError:
+                continue
+            return parent, f"{style_file_name}:{stat.st_size}:{stat.st_mtime_ns}"
+    return Path(file.anchor), ""
+
+
+class ClangFormatPool:
+    """
+    Pools of clang-format processes that are started ahead of time and wait for the content to format on stdin.
+    A pool exists per executable, style and file type, since clang-format takes these as command line arguments.
+    """
+
+    def __init__(self, warm_workers: int = WARM_WORKERS, max_pools: int = MAX_POOLS):
+        """
+        :param warm_workers: Number of waiting processes per pool.
+        :param max_pools: Maximum number of pools.
+        """
+        self.warm_workers = warm_workers
+        self.max_pools = max_pools
+        self._pools = OrderedDict()
+        # Number of processes per pool that are being started, such that concurrent refills do not exceed warm_workers.
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def command(self, executable: str, file: Path, config_file: str) -> Tuple[tuple, list]:
+        """
+        Create the clang-format command for a file, reading the content from stdin.
+        :param executable: The clang-format executable.
+        :param file: Absolute path of the formatted file.
+        :param config_file: Configuration file to run clang-format with or 'file' to search the parent directories.
+        :return: Tuple of the key of the pool and the command.
+        """
+        # Processes of a replaced executable are not reused.
+        stat = os.stat(which(executable) or executable)
+        executable_key = (executable, stat.st_size, stat.st_mtime_ns)
+        if config_file != CONFIG_FILE_SEARCH:
+            # The parsed style is reused until the configuration file changes.
+            style = cmake_clang_tools_helpers.load_config_string(Path(config_file))
+            key = (executable_key, style, file.suffix)
+            assume_filename = f"stdin{file.suffix}"
+        else:
+            # clang-format searches the style file starting at the assumed file name, which is shared by all files of the style.
+            style = CONFIG_FILE_SEARCH
+            style_directory, signature = find_style_directory(file)
+            key = (executable_key, str(style_directory), signature, file.suffix)
+            assume_filename = str(style_directory / f"stdin{file.suffix}")
+        return key, [executable, f"--style={style}", f"--assume-filename={assume_filename}", "--output-replacements-xml"]
+
+    def _spawn(self, command: list) -> subprocess.Popen:
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _refill(self, key: tuple, command: list) -> None:
+        with self._lock:
+            missing = self.warm_workers - len(self._pools.get(key, ())) - self._pending.get(key, 0)
+            if missing <= 0:
+                return
+            self._pending[key] = self._pending.get(key, 0) + missing
+        processes = list()
+        try:
+            for _ in range(missing):
+                processes.append(self._spawn(command))
+        except OSError:
+            pass
+        with self._lock:
+            self._pending[key] -= missing
+            if not self._pending[key]:
+                del self._pending[key]
+            if key in self._pools:
+                self._pools[key].extend(processes)
+                processes = list()
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    def run(self, executable: str, file: Path, config_file: str, content: bytes) -> Tuple[int, bytes, bytes]:
+        """
+        Run clang-format on the content of a file with a waiting process and start a new process for the next file.
+        :param executable: The clang-format executable.
+        :param file: Absolute path of the formatted file.
+        :param config_file: Configuration file to run clang-format with or 'file' to search the parent directories.
+        :param content: Content of the file.
+        :return: Tuple of the return code, the XML output and the error output of clang-format.
+        """
+        key, command = self.command(executable, file, config_file)
+        process = None
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = deque()
+            self._pools.move_to_end(key)
+            if self._pools[key]:
+                process = self._pools[key].popleft()
+            stopped_pools = list()
+            while len(self._pools) > self.max_pools:
+                stopped_pools.append(self._pools.popitem(last=False)[1])
+        for pool in stopped_pools:
+            for stopped_process in pool:
+                stopped_process.kill()
+                stopped_process.wait()
+
+        if process is None:
+            process = self._spawn(command)
+        threading.Thread(target=self._refill, args=(key, command), daemon=True).start()
+        output, error_output = process.communicate(content)
+        return process.returncode, output, error_output
+
+    def close(self) -> None:
+        """
+        Stop all waiting processes.
+        """
+        with self._lock:
+            pools, self._pools = self._pools, OrderedDict()
+        for pool in pools.values():
+            for process in pool:
+                process.kill()
+                process.wait()
+
+
+class FormatDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Server running clang-format for the requests of the clients, see FormatDaemonClient.
+    The daemon shuts down after the idle timeout passed without requests.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, idle_timeout: float):
+        """
+        :param socket_path: Path of the Unix socket to listen on.
+        :param idle_timeout: Time without requests in seconds after which the daemon shuts down.
+        """
+        self.idle_timeout = idle_timeout
+        self.last_request = time.monotonic()
+        self.pool = ClangFormatPool()
+        super().__init__(str(socket_path), FormatRequestHandler)
+
+    def verify_request(self, request, client_address) -> bool:
+        # Only the current user may run executables through the daemon.
+        return is_same_user(request)
+
+    def watch_idle_timeout(self) -> None:
+        """
+        Shut down the daemon once it is idle. Has to run in a separate thread from serve_forever.
+        """
+        while time.monotonic() - self.last_request < self.idle_timeout:
+            time.sleep(min(1.0, self.idle_timeout))
+        self.shutdown()
+
+
+class FormatRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.last_request = time.monotonic()
+        try:
+            request, content = receive_message(self.request)
+            returncode, output, error_output = self.server.pool.run(request["executable"], Path(request["file"]),
+                                                                    request["config_file"], content)
+            send_message(self.request, {"returncode": returncode, "error": error_output.decode("utf-8", errors="replace")}, output)
+        except (OSError, ValueError, KeyError, SystemExit) as error:
+            try:
+                send_message(self.request, {"returncode": None, "error": str(error)})
+            except OSError:
+                pass
+        self.server.last_request = time.monotonic()
+
+
+def serve(socket_path: Path, idle_timeout: float) -> None:
+    """
+    Run the daemon until it is idle, unless another daemon is already serving the socket.
+    :param socket_path: Path of the Unix socket to listen on.
+    :param idle_timeout: Time without requests in seconds after which the daemon shuts down.
+    """
+    try:
+        create_private_directory(socket_path.parent)
+    except PermissionError as permission_error:
+        sys.exit(str(permission_error))
+    with open(f"{socket_path}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        # The socket of a daemon that did not shut down cleanly is left behind.
+        try:
+            socket_path.unlink()
+        except OSError:
+            pass
+        daemon = FormatDaemon(socket_path, idle_timeout)
+        threading.Thread(target=daemon.watch_idle_timeout, daemon=True).start()
+        try:
+            daemon.serve_forever()
+        finally:
+            daemon.server_close()
+            daemon.pool.close()
+            try:
+                socket_path.unlink()
+            except OSError:
+                pass
+
+
+class FormatDaemonClient:
+    """
+    Client of the clang-format daemon, which starts the daemon if it is not running.
+    """
+
+    def __init__(self, socket_path: Path = DEFAULT_SOCKET_PATH, idle_timeout: float = DEFAULT_IDLE_TIMEOUT_S):
+        """
+        :param socket_path: Path of the Unix socket of the daemon.
+        :param idle_timeout: Idle timeout in seconds of a daemon started by the client.
+        """
+        self.socket_path = Path(socket_path)
+        self.idle_timeout = idle_timeout
+        self.available = True
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Optional[socket.socket]:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(str(self.socket_path))
+        except OSError:
+            connection.close()
+            return None
+        # A socket served by another user could inject replacements, which are written to the sources when fixing.
+        if not is_same_user(connection):
+            connection.close()
+            self.available = False
+            return None
+        return connection
+
+    def _start_daemon(self) -> None:
+        create_private_directory(self.socket_path.parent)
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), f"--socket={self.socket_path}",
+                          f"--idle-timeout={self.idle_timeout}"], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, start_new_session=True)
+
+    def connect(self) -> Optional[socket.socket]:
+        """
+        Connect to the daemon, starting it if necessary.
+        :return: The connected socket or None if the daemon is not available.
+        """
+        connection = self._connect() if self.available else None
+        if connection is not None or not self.available:
+            return connection
+        with self._lock:
+            if not self._started:
+                self._started = True
+                try:
+                    self._start_daemon()
+                except OSError:
+                    self.available = False
+                    return None
+            deadline = time.monotonic() + START_TIMEOUT_S
+            while connection is None and time.monotonic() < deadline:
+                time.sleep(0.02)
+                connection = self._connect()
+            if connection is None:
+                self.available = False
+        return connection
+
+    def format(self, executable: str, file: Path, config_file: str, content: bytes) -> Optional[bytes]:
+        """
+        Get the replacements of clang-format for the content of a file from the daemon.
+        :param executable: The clang-format executable.
+        :param file: File to run clang-format on.
+        :param config_file: Configuration file to run clang-format with or 'file' to search the parent directories.
+        :param content: Content of the file.
+        :return: XML output of clang-format or None if the daemon is not available.
+        """
+        connection = self.connect()
+        if connection is None:
+            return None
+        # Relative config and executable paths are resolved by the client, the daemon runs in a different directory.
+        if config_file != CONFIG_FILE_SEARCH:
+            config_file = os.path.abspath(config_file)
+        if os.sep in executable:
+            executable = os.path.abspath(executable)
+        try:
+            with connection:
+                send_message(connection, {"executable": executable, "file": str(file.resolve()), "config_file": config_file},
+                             content)
+                response, output = receive_message(connection)
+        except (OSError, ValueError):
+            return None
+        if response.get("returncode") is None:
+            return None
+        if response["returncode"] != 0:
+            raise subprocess.CalledProcessError(response["returncode"], executable, output, response.get("error", ""))
+        return output
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :return: Namespace object that contains the parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(description="Daemon keeping clang-format processes ready for run_clang_format_tool.py.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, type=Path, help="Path of the Unix socket to listen on.")
+    parser.add_argument("--idle-timeout", default=DEFAULT_IDLE_TIMEOUT_S, type=float,
+                        help="Time in seconds without requests after which the daemon shuts down.")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    serve(args.socket, args.idle_timeout)
+
+
+if __name__ == "__main__":
+    main()
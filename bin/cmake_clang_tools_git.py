@@ -0,0 +1,118 @@
+from functools import lru_cache
+import json
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# Header of a hunk of a diff without context, only the lines of the new version are needed.
+HUNK_REGEX = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+# Suffix of a reference to compare against the merge base with HEAD, like 'git diff ref...'.
+MERGE_BASE_SUFFIX = "..."
+
+
+def run_git(directory: str, arguments: List[str]) -> subprocess.CompletedProcess:
+    """
+    Run a git command in a directory.
+    :param directory: Working directory of git.
+    :param arguments: Arguments of git.
+    :return: The completed process with the output as text.
+    """
+    return subprocess.run(["git", "-C", directory, "-c", "core.quotePath=false", *arguments], stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+
+
+@lru_cache(maxsize=None)
+def get_repository_root(directory: str) -> Optional[str]:
+    """
+    Get the root of the git repository containing a directory.
+    :param directory: Absolute path of the directory.
+    :return: Root of the working tree or None if the directory is not in a git repository.
+    """
+    try:
+        output = run_git(directory, ["rev-parse", "--show-toplevel"])
+    except OSError:
+        return None
+    return os.path.normpath(output.stdout.strip()) if output.returncode == 0 else None
+
+
+def parse_diff_line_ranges(diff: str, root: str) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Parse the changed line ranges of the new versions of the files from a diff without context and prefixes
+    ('git diff -U0 --no-prefix').
+    :param diff: The diff.
+    :param root: Root of the repository the paths of the diff are relative to.
+    :return: Dictionary mapping the absolute paths of the changed files to their changed line ranges (first and last line,
+             starting at 1). Files with only removed lines have no ranges.
+    """
+    changed_lines = dict()
+    ranges = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:].rstrip("\t")
+            ranges = None if path == "/dev/null" else changed_lines.setdefault(os.path.normpath(os.path.join(root, path)), list())
+        elif line.startswith("@@") and ranges is not None:
+            match = HUNK_REGEX.match(line)
+            if match:
+                start = int(match.group(1))
+                count = int(match.group(2)) if match.group(2) is not None else 1
+                if count:
+                    ranges.append((start, start + count - 1))
+    return changed_lines
+
+
+def get_changed_lines(files: List[Path], ref: str) -> Dict[str, Optional[List[Tuple[int, int]]]]:
+    """
+    Get the lines changed against a git reference in the repositories containing the files, including the changes of the
+    working tree. A reference ending with '...' is compared at its merge base with HEAD.
+    Exits the program if the changes can not be determined, e.g. for an unknown reference.
+    :param files: Files whose repositories are compared.
+    :param ref: The git reference, e.g. 'origin/master' or 'origin/master...'.
+    :return: Dictionary mapping the absolute paths of all changed files to their changed line ranges, see parse_diff_line_ranges.
+             Untracked files are entirely changed, their ranges are None.
+    """
+    roots = {get_repository_root(os.path.dirname(os.path.abspath(file))) for file in files}
+    changed_lines = dict()
+    for root in sorted(root for root in roots if root):
+        base = ref
+        if ref.endswith(MERGE_BASE_SUFFIX):
+            output = run_git(root, ["merge-base", ref[:-len(MERGE_BASE_SUFFIX)], "HEAD"])
+            if output.returncode != 0:
+                sys.exit(f"Merge base of '{ref[:-len(MERGE_BASE_SUFFIX)]}' can not be determined in '{root}': {output.stderr.strip()}")
+            base = output.stdout.strip()
+        output = run_git(root, ["diff", "-U0", "--no-color", "--no-ext-diff", "--no-prefix", "--diff-filter=d", base, "--"])
+        if output.returncode != 0:
+            sys.exit(f"Changes since '{ref}' can not be determined in '{root}': {output.stderr.strip()}")
+        changed_lines.update(parse_diff_line_ranges(output.stdout, root))
+        output = run_git(root, ["ls-files", "--others", "--exclude-standard", "-z"])
+        for path in output.stdout.split("\0") if output.returncode == 0 else list():
+            if path:
+                changed_lines[os.path.normpath(os.path.join(root, path))] = None
+    return changed_lines
+
+
+def filter_changed_files(files: List[Path], changed_lines: Dict[str, Optional[List[Tuple[int, int]]]]) -> List[Path]:
+    """
+    Keep the files with changed lines.
+    :param files: The files.
+    :param changed_lines: Changed line ranges, see get_changed_lines.
+    :return: The changed files in the given order.
+    """
+    return [file for file in files if changed_lines.get(os.path.abspath(file), list()) != list()]
+
+
+def create_line_filter(changed_lines: Dict[str, Optional[List[Tuple[int, int]]]]) -> str:
+    """
+    Create the '--line-filter' of clang-tidy, which only reports the diagnostics in the changed lines.
+    :param changed_lines: Changed line ranges, see get_changed_lines.
+    :return: The line filter as JSON string.
+    """
+    line_filter = list()
+    for file, ranges in sorted(changed_lines.items()):
+        if ranges is None:
+            line_filter.append({"name": file})
+        elif ranges:
+            line_filter.append({"name": file, "lines": [list(line_range) for line_range in ranges]})
+    return json.dumps(line_filter, separators=(",", ":"))
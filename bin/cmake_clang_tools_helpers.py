@@ -1,14 +1,20 @@
 import glob
+import hashlib
+import json
+import os
 from pathlib import Path
-from shutil import copyfile
+from shutil import copy2
 import sys
-from typing import List
-import yaml
+from typing import List, Optional
 
-WHITELIST_KEY = 'whitelist'
-BLACKLIST_KEY = 'blacklist'
-RUN_KEY_PREFIX = 'run_'
-TRIGGER_CONTENT = 'RUN'
+from cmake_clang_tools_cache import write_atomic
+from cmake_clang_tools_settings import SettingsIndex, compile_settings
+from cmake_clang_tools_trigger import TRIGGER_CONTENT
+
+# Maximum length of the proxy stamp names, has to match the CMake macros.
+PROXY_NAME_MAX_LENGTH = 127
+# Serialized configurations of this process, see load_config_string.
+_config_strings = dict()
 
 
 def load_yaml(path: Path) -> dict:
@@ -19,31 +25,91 @@ def load_yaml(path: Path) -> dict:
     :return: Dictionary containing the YAML content.
     """
     try:
-        with open(path, 'r') as file:
-            return yaml.safe_load(file)
+        with open(path, 'rb') as file:
+            content = file.read()
     except (OSError, IOError) as file_error:
         sys.exit(f"YAML file '{path}' can not be opened: {file_error}")
+    return parse_yaml(content, path)
+
+
+def parse_yaml(content: bytes, path: Path) -> dict:
+    """
+    Parse the content of a YAML file.
+    Exits the program if the content can not be parsed.
+    :param content: Content of the YAML file.
+    :param path: Path of the YAML file, for the error message.
+    :return: Dictionary containing the YAML content.
+    """
+    # PyYAML is only imported when a file is parsed, the compiled configurations do not need it.
+    import yaml
+    try:
+        return yaml.safe_load(content)
     except yaml.YAMLError as yaml_error:
         sys.exit(f"YAML file '{path}' can not be parsed: {yaml_error}")
 
 
+def load_config_string(path: Path, cache_file: Optional[Path] = None) -> str:
+    """
+    Load a YAML configuration file of a clang tool and serialize it to the JSON string passed to the tool with '--style'/'--config'.
+    The string is computed once per process. If a cache file is given, the string is also stored there keyed by the path,
+    modification time, size and hash of the configuration file, such that other processes skip the YAML parsing.
+    :param path: Path of the YAML configuration file.
+    :param cache_file: JSON file to store the compiled configurations in, e.g. next to the config.yaml copy in the build directory.
+    :return: The configuration as JSON string.
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError as file_error:
+        sys.exit(f"Config file '{path}' can not be opened: {file_error}")
+    signature = [stat.st_size, stat.st_mtime_ns]
+    memoized = _config_strings.get(path)
+    if memoized and memoized[0] == signature:
+        return memoized[1]
+
+    compiled_configs = dict()
+    if cache_file:
+        try:
+            with open(cache_file, 'rb') as file:
+                compiled_configs = json.loads(file.read().decode("utf-8"))
+        except (OSError, ValueError):
+            pass
+    compiled = compiled_configs.get(path)
+
+    if compiled and compiled.get("signature") == signature:
+        config_string = compiled["config"]
+    else:
+        # The content is hashed if the modification time changed, e.g. after a checkout that did not change the file.
+        try:
+            with open(path, 'rb') as file:
+                content_hash = hashlib.sha256(file.read()).hexdigest()
+        except (OSError, IOError) as file_error:
+            sys.exit(f"Config file '{path}' can not be opened: {file_error}")
+        if compiled and compiled.get("hash") == content_hash:
+            config_string = compiled["config"]
+        else:
+            config_string = json.dumps(load_yaml(Path(path)))
+        if cache_file:
+            compiled_configs[path] = {"signature": signature, "hash": content_hash, "config": config_string}
+            try:
+                write_atomic(Path(cache_file), json.dumps(compiled_configs).encode("utf-8"))
+            except OSError:
+                pass
+
+    _config_strings[path] = (signature, config_string)
+    return config_string
+
+
 def should_tool_run_for_project(project_name: str, tool_name: str, settings: dict) -> bool:
     """
     Check if the given tool should be run for the given project.
+    Checks of many projects should compile the settings once, see cmake_clang_tools_settings.SettingsIndex.
     :param project_name: Project name to check.
     :param tool_name: Name of the clang tool.
     :param settings: YAML node containing the current settings.
     :return: True, if the tool should be run.
     """
-    run_tool_key = RUN_KEY_PREFIX + tool_name
-    should_run_tool = settings.get(run_tool_key, True)
-    whitelist = settings.get(WHITELIST_KEY, list())
-    # Empty white list special case, pass all.
-    project_is_whitelisted = (project_name in whitelist) or not whitelist
-    blacklist = settings.get(BLACKLIST_KEY, list())
-    project_is_blacklisted = project_name in blacklist
-    should_run_tool_for_project = should_run_tool and project_is_whitelisted and not project_is_blacklisted
-    return should_run_tool_for_project
+    return SettingsIndex(compile_settings(settings)).should_run(project_name, tool_name)
 
 
 def write_trigger(trigger_path: Path, trigger: bool) -> None:
@@ -76,23 +142,49 @@ def check_trigger(trigger_path: Path) -> bool:
 def update_cache(source_file: str, cache_file: str) -> None:
     """
     Update the cache by copying the source file.
+    The modification time is copied, such that is_cache_up_to_date usually only compares the file sizes and times.
     :param source_file: Original input file.
     :param cache_file: Cache output file.
     """
-    copyfile(source_file, cache_file)
+    copy2(source_file, cache_file)
+
+
+def is_cache_up_to_date(source_file: Path, cache_file: Path) -> bool:
+    """
+    Check if the cache is a copy of the source file. The contents are only compared if the size and modification time copied by
+    update_cache match, since files with the same size and modification time may still differ, e.g. on file systems with coarse
+    modification times.
+    :param source_file: Original input file.
+    :param cache_file: Cache output file.
+    :return: True if the cache is up to date.
+    """
+    try:
+        source_stat = os.stat(source_file)
+        cache_stat = os.stat(cache_file)
+        if (source_stat.st_size, source_stat.st_mtime_ns) != (cache_stat.st_size, cache_stat.st_mtime_ns):
+            return False
+        with open(source_file, 'rb') as source, open(cache_file, 'rb') as cache:
+            return source.read() == cache.read()
+    except OSError:
+        return False
 
 
 def glob_paths(paths: List[str]) -> List[Path]:
     """
-    Glob the input paths for files.
+    Glob the input paths for files, '**' matches any number of directories.
     :param paths: Paths to glob.
-    :return: List of globed files.
+    :return: Sorted list of globed files.
     """
     files = set()
     for pattern in paths:
-        for file in glob.iglob(pattern):
-            files.add(Path(file))
-    return list(files)
+        # The sources passed by CMake are plain paths, which do not need a directory listing.
+        if not glob.has_magic(pattern):
+            if os.path.lexists(pattern):
+                files.add(pattern)
+            continue
+        files.update(glob.iglob(pattern, recursive=True))
+    # Sort to get a deterministic processing and reporting order.
+    return sorted(Path(file) for file in files)
 
 
 def string_to_list(string: str, separator=',') -> List[str]:
@@ -104,3 +196,95 @@ def string_to_list(string: str, separator=',') -> List[str]:
     """
     # The filter ensures that we do not use empty strings.
     return [s.strip() for s in list(filter(None, string.split(separator)))]
+
+
+def proxy_stamp_path(stamp_dir: Path, project_name: str, source: Path, tool_name: str) -> Path:
+    """
+    Get the path of the proxy stamp of a source file.
+    The name matches the proxy files generated by the CMake macros, i.e. '<project>-<source path>-<tool>.proxy' with all
+    slashes replaced by dashes and shortened to the last 127 characters.
+    :param stamp_dir: Directory of the proxy stamps.
+    :param project_name: CMake project name.
+    :param source: Source file.
+    :param tool_name: Name of the clang tool.
+    :return: Path of the proxy stamp.
+    """
+    proxy_name = f"{project_name}-{os.path.abspath(source)}-{tool_name}".replace("/", "-")
+    return Path(stamp_dir) / f"{proxy_name[-PROXY_NAME_MAX_LENGTH:]}.proxy"
+
+
+def get_stale_files(files: List[Path], stamp_dir: Path, project_name: str, tool_name: str,
+                    dependencies: List[Path]) -> List[Path]:
+    """
+    Get the files whose proxy stamp is missing or older than the file or any of the additional dependencies.
+    :param files: Source files.
+    :param stamp_dir: Directory of the proxy stamps.
+    :param project_name: CMake project name.
+    :param tool_name: Name of the clang tool.
+    :param dependencies: Additional dependencies of all files, e.g. the configuration file.
+    :return: List of files that need to be processed.
+    """
+    dependencies_mtime = 0
+    for dependency in dependencies:
+        try:
+            dependencies_mtime = max(dependencies_mtime, os.stat(dependency).st_mtime_ns)
+        except OSError:
+            continue
+
+    stale_files = list()
+    for file in files:
+        try:
+            stamp_mtime = os.stat(proxy_stamp_path(stamp_dir, project_name, file, tool_name)).st_mtime_ns
+            if stamp_mtime >= max(os.stat(file).st_mtime_ns, dependencies_mtime):
+                continue
+        except OSError:
+            pass
+        stale_files.append(file)
+    return stale_files
+
+
+def touch_stamps(files: List[Path], stamp_dir: Path, project_name: str, tool_name: str) -> None:
+    """
+    Create/Update the proxy stamps of the given files.
+    :param files: Source files.
+    :param stamp_dir: Directory of the proxy stamps.
+    :param project_name: CMake project name.
+    :param tool_name: Name of the clang tool.
+    """
+    for file in files:
+        stamp = proxy_stamp_path(stamp_dir, project_name, file, tool_name)
+        try:
+            stamp.touch()
+        except (OSError, IOError) as file_error:
+            sys.exit(f"Proxy stamp '{stamp}' could not be written: {file_error}")
+
+
+def remove_stamps(files: List[Path], stamp_dir: Path, project_name: str, tool_name: str) -> None:
+    """
+    Remove the proxy stamps of the given files, such that they are processed again.
+    :param files: Source files.
+    :param stamp_dir: Directory of the proxy stamps.
+    :param project_name: CMake project name.
+    :param tool_name: Name of the clang tool.
+    """
+    for file in files:
+        stamp = proxy_stamp_path(stamp_dir, project_name, file, tool_name)
+        try:
+            stamp.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as file_error:
+            sys.exit(f"Proxy stamp '{stamp}' could not be removed: {file_error}")
+
+
+def read_list_file(path: Path) -> List[str]:
+    """
+    Read a file containing one entry per line.
+    :param path: Path of the file.
+    :return: List of non-empty lines.
+    """
+    try:
+        with open(path, 'r') as file:
+            return [line.strip() for line in file if line.strip()]
+    except (OSError, IOError) as file_error:
+        sys.exit(f"List file '{path}' could not be read: {file_error}")
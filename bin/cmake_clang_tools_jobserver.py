@@ -0,0 +1,131 @@
+import os
+import re
+import select
+import threading
+from typing import Dict, List, Optional
+
+# Token written to the jobserver pipe, GNU make accepts any byte.
+TOKEN = b"+"
+# Interval in which threads waiting for a token of the jobserver check whether the implicit token was released.
+IMPLICIT_TOKEN_POLL_S = 0.05
+JOBSERVER_AUTH_REGEX = re.compile(r"--jobserver-(?:auth|fds)=(?:fifo:(?P<fifo>\S+)|(?P<read_fd>\d+),(?P<write_fd>\d+))")
+
+
+def parse_makeflags(makeflags: str) -> Optional[dict]:
+    """
+    Parse the jobserver of a parent make from its MAKEFLAGS.
+    :param makeflags: Value of the MAKEFLAGS environment variable.
+    :return: Dictionary with either 'fifo' or 'read_fd' and 'write_fd' or None if no jobserver is given.
+    """
+    match = None
+    # The last jobserver argument is the one of the closest parent.
+    for match in JOBSERVER_AUTH_REGEX.finditer(makeflags or ""):
+        pass
+    if match is None:
+        return None
+    if match.group("fifo"):
+        return {"fifo": match.group("fifo")}
+    return {"read_fd": int(match.group("read_fd")), "write_fd": int(match.group("write_fd"))}
+
+
+class TokenPool:
+    """
+    Pool of job tokens, that limits the concurrency of the jobs and is compatible with the GNU make jobserver.
+    If the process runs under a make jobserver, e.g. 'make -j8', the tokens are taken from the jobserver, such that the jobs
+    share the concurrency limit with the rest of the build. Otherwise the pool creates its own jobserver pipe with the given
+    number of tokens, which child processes can join through the environment.
+    Every process owns one implicit token, hence only the jobs beyond the first one read a token from the jobserver.
+    """
+
+    def __init__(self, jobs: int, makeflags: Optional[str] = None):
+        """
+        :param jobs: Number of concurrent jobs if no parent jobserver is found.
+        :param makeflags: MAKEFLAGS of the parent, defaults to the environment.
+        """
+        self._lock = threading.Lock()
+        self._implicit_token_free = True
+        self._owns_jobserver = False
+        self._opened_fds = list()
+        jobserver = parse_makeflags(os.environ.get("MAKEFLAGS", "") if makeflags is None else makeflags)
+        try:
+            if jobserver and "fifo" in jobserver:
+                self._read_fd = os.open(jobserver["fifo"], os.O_RDWR)
+                self._write_fd = self._read_fd
+                self._opened_fds.append(self._read_fd)
+            elif jobserver:
+                # The descriptors are not inherited, if the parent did not mark this process as a recursive make.
+                os.fstat(jobserver["read_fd"])
+                os.fstat(jobserver["write_fd"])
+                self._read_fd, self._write_fd = jobserver["read_fd"], jobserver["write_fd"]
+            else:
+                jobserver = None
+        except OSError:
+            jobserver = None
+        if jobserver is None:
+            self._read_fd, self._write_fd = os.pipe()
+            self._owns_jobserver = True
+            self._opened_fds.extend([self._read_fd, self._write_fd])
+            os.write(self._write_fd, TOKEN * (max(1, jobs) - 1))
+        self.jobs = max(1, jobs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def acquire(self) -> Optional[bytes]:
+        """
+        Acquire a token, blocks until a token is available.
+        :return: The token read from the jobserver or None for the implicit token. Has to be passed to release.
+        """
+        while True:
+            with self._lock:
+                if self._implicit_token_free:
+                    self._implicit_token_free = False
+                    return None
+            # Threads waiting for the jobserver take the implicit token as well, once another thread releases it.
+            try:
+                readable, _, _ = select.select([self._read_fd], [], [], IMPLICIT_TOKEN_POLL_S)
+                if not readable:
+                    continue
+                token = os.read(self._read_fd, 1)
+            except InterruptedError:
+                continue
+            if token:
+                return token
+
+    def release(self, token: Optional[bytes]) -> None:
+        """
+        Return a token to the pool.
+        :param token: Token returned by acquire.
+        """
+        if token is None:
+            with self._lock:
+                self._implicit_token_free = True
+        else:
+            os.write(self._write_fd, token)
+
+    def environment(self) -> Dict[str, str]:
+        """
+        Get the environment for child processes, such that they join the jobserver of the pool.
+        :return: Copy of the environment with the jobserver in MAKEFLAGS.
+        """
+        environment = dict(os.environ)
+        if self._owns_jobserver:
+            environment["MAKEFLAGS"] = f"-j{self.jobs} --jobserver-auth={self._read_fd},{self._write_fd}"
+        return environment
+
+    def pass_fds(self) -> List[int]:
+        """
+        :return: File descriptors that child processes inherit to join the jobserver.
+        """
+        return sorted({self._read_fd, self._write_fd})
+
+    def close(self) -> None:
+        """
+        Close the jobserver pipe if the pool created it and the jobserver FIFO if the pool opened it.
+        """
+        for fd in self._opened_fds:
+            os.close(fd)
+        self._opened_fds = list()
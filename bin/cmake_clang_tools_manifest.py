@@ -0,0 +1,106 @@
+import json
+import os
+from pathlib import Path
+import sqlite3
+from typing import List, Optional, Tuple
+
+MANIFEST_FILE = "clang-tidy-manifest.sqlite"
+# Time in seconds to wait for another process that writes the manifest.
+LOCK_TIMEOUT_S = 60.0
+
+
+class DependencyManifest:
+    """
+    Record of the translation units that were processed successfully, stored as SQLite database in the build directory.
+    Every translation unit is stored with the key of its command and the modification time and size of all its dependencies,
+    such that a translation unit is only processed again if its command or one of the files it includes changed.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path of the database file.
+        """
+        self.path = Path(path)
+        self._connection = sqlite3.connect(str(self.path), timeout=LOCK_TIMEOUT_S)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS translation_units "
+                                 "(file TEXT PRIMARY KEY, key TEXT NOT NULL, dependencies TEXT NOT NULL)")
+        self._stats = dict()
+
+    @classmethod
+    def open(cls, build_directory: str) -> "DependencyManifest":
+        """
+        Open the manifest of a build directory.
+        :param build_directory: The build directory where the manifest is stored.
+        :return: The manifest.
+        """
+        return cls(Path(build_directory or ".") / MANIFEST_FILE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Commit the updates and close the database.
+        """
+        self._connection.commit()
+        self._connection.close()
+
+    def _stat(self, path: str) -> Optional[Tuple[int, int]]:
+        # Headers are shared by many translation units, every file is only checked once.
+        if path not in self._stats:
+            try:
+                stat = os.stat(path)
+                self._stats[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                self._stats[path] = None
+        return self._stats[path]
+
+    def is_up_to_date(self, file: Path, key: str) -> bool:
+        """
+        Check if a translation unit was processed successfully with the same key and none of its dependencies changed since.
+        :param file: Source file of the translation unit.
+        :param key: Key of the command the translation unit is processed with, e.g. a hash of the arguments.
+        :return: True if the translation unit does not need to be processed.
+        """
+        row = self._connection.execute("SELECT key, dependencies FROM translation_units WHERE file = ?",
+                                       (os.path.abspath(file),)).fetchone()
+        if row is None or row[0] != key:
+            return False
+        return all(self._stat(path) == (mtime, size) for path, mtime, size in json.loads(row[1]))
+
+    def stat_dependencies(self, dependencies: List[str]) -> None:
+        """
+        Read the modification times and sizes of the dependencies of a translation unit before it is processed.
+        The update records these, such that a change during the processing is detected by the next run.
+        :param dependencies: The source file and all the files it includes.
+        """
+        for path in dependencies:
+            self._stat(path)
+
+    def update(self, file: Path, key: str, dependencies: List[str]) -> None:
+        """
+        Record a successfully processed translation unit.
+        :param file: Source file of the translation unit.
+        :param key: Key of the command the translation unit was processed with.
+        :param dependencies: The source file and all the files it includes.
+        """
+        recorded_dependencies = list()
+        for path in dependencies:
+            # Modification times read before the processing are kept (see stat_dependencies).
+            stat = self._stat(path)
+            if stat is None:
+                self.remove(file)
+                return
+            recorded_dependencies.append([path, *stat])
+        self._connection.execute("INSERT OR REPLACE INTO translation_units (file, key, dependencies) VALUES (?, ?, ?)",
+                                 (os.path.abspath(file), key, json.dumps(recorded_dependencies, separators=(",", ":"))))
+
+    def remove(self, file: Path) -> None:
+        """
+        Remove a translation unit, such that it is processed again.
+        :param file: Source file of the translation unit.
+        """
+        self._connection.execute("DELETE FROM translation_units WHERE file = ?", (os.path.abspath(file),))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+import argparse
+import atexit
+from contextlib import contextmanager, nullcontext
+import json
+import os
+from pathlib import Path
+import resource
+import sys
+import threading
+import time
+from typing import List, Optional
+
+from cmake_clang_tools_cache import write_atomic
+from cmake_clang_tools_trigger import SCRIPT_START_TIME, get_argument
+
+PROFILE_ENVIRONMENT_VARIABLE = "CMAKE_CLANG_TOOLS_PROFILE"
+TRACE_SUFFIX = ".trace.json"
+SUMMARY_SUFFIX = ".summary.json"
+# Number of files listed in the summary.
+SLOWEST_FILES_COUNT = 10
+# Number of traces kept in a profile directory, e.g. of the per-source commands of the last builds.
+MAX_PROFILE_FILES = 512
+FILE_CATEGORY = "file"
+PHASE_CATEGORY = "phase"
+
+# Profiler of this process, see start_profiling.
+_profiler = None
+_null_span = nullcontext()
+
+
+def get_process_start_time() -> Optional[float]:
+    """
+    Get the time the process was started, i.e. before the interpreter started up.
+    :return: Start time in seconds since the epoch with the resolution of the clock ticks or None if it is unknown.
+    """
+    try:
+        with open("/proc/self/stat", 'r') as stat_file:
+            # The command name in parentheses can contain spaces, the start time is the 20th field after it.
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", 'r') as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+class Profiler:
+    """
+    Collects timing spans per phase and per file and writes them as Chrome trace events (chrome://tracing, Perfetto) with an
+    aggregated summary of the phases, the slowest files, the CPU time of the clang tools and the cache hit rate.
+    """
+
+    def __init__(self, path: str, tool_name: str):
+        """
+        :param path: Trace file or directory to write '<tool>-<pid>.trace.json' to, such that parallel commands can share it.
+        :param tool_name: Name of the profiled tool, e.g. 'clang-format'.
+        """
+        self.tool_name = tool_name
+        # The traces of the processes accumulate in a profile directory, only the latest are kept.
+        self.profile_dir = None
+        if os.path.isdir(path) or str(path).endswith(os.sep):
+            self.profile_dir = Path(path)
+            path = self.profile_dir / f"{tool_name}-{os.getpid()}{TRACE_SUFFIX}"
+        path = Path(path)
+        self.trace_path = path
+        base_name = path.name[:-len(TRACE_SUFFIX)] if path.name.endswith(TRACE_SUFFIX) else path.stem
+        self.summary_path = path.with_name(base_name + SUMMARY_SUFFIX)
+        self.counters = dict()
+        self._events = list()
+        self._lock = threading.Lock()
+        # Spans are measured with the monotonic clock and placed on the wall clock, such that traces of processes can be merged.
+        self._start_time = time.time()
+        self._start_counter = time.perf_counter()
+        self._children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        process_start_time = get_process_start_time()
+        if process_start_time is not None and process_start_time < SCRIPT_START_TIME:
+            self._add_event("interpreter startup", PHASE_CATEGORY, process_start_time, SCRIPT_START_TIME - process_start_time)
+        if SCRIPT_START_TIME < self._start_time:
+            self._add_event("imports", PHASE_CATEGORY, SCRIPT_START_TIME, self._start_time - SCRIPT_START_TIME)
+
+    def _add_event(self, name: str, category: str, start_time: float, duration: float, args: Optional[dict] = None) -> None:
+        event = {"name": name, "cat": category, "ph": "X", "ts": int(start_time * 1e6), "dur": int(duration * 1e6), "pid": os.getpid(),
+                 "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        self._events.append(event)
+
+    @contextmanager
+    def span(self, name: str, category: str = PHASE_CATEGORY, **args):
+        """
+        Measure the time spent in the context.
+        :param name: Name of the span, spans with the same name are summed up in the summary.
+        :param category: Category of the span, spans of the category 'file' are listed as slowest files.
+        :param args: Additional arguments shown in the trace, e.g. the file.
+        """
+        start_counter = time.perf_counter()
+        try:
+            yield
+        finally:
+            end_counter = time.perf_counter()
+            self._add_event(name, category, self._start_time + start_counter - self._start_counter, end_counter - start_counter, args)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increment a counter of the summary, e.g. the cache hits.
+        :param name: Name of the counter.
+        :param value: Value to add.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """
+        Aggregate the spans.
+        :return: Dictionary with the wall time, the time per phase, the slowest files, the tool CPU time and the cache hit rate.
+        """
+        phases = dict()
+        files = list()
+        for event in self._events:
+            if event["cat"] == FILE_CATEGORY:
+                files.append({"file": event["args"]["file"], "seconds": event["dur"] / 1e6})
+            else:
+                phases[event["name"]] = phases.get(event["name"], 0.0) + event["dur"] / 1e6
+        files.sort(key=lambda file: file["seconds"], reverse=True)
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        tool_cpu_time = children_usage.ru_utime - self._children_usage.ru_utime + children_usage.ru_stime - self._children_usage.ru_stime
+        hits, misses = self.counters.get("cache hits", 0), self.counters.get("cache misses", 0)
+        first_event_time = min([event["ts"] / 1e6 for event in self._events] + [self._start_time])
+        return {"tool": self.tool_name, "wall_time_s": time.time() - first_event_time, "files": len(files), "phases_s": phases,
+                "slowest_files": files[:SLOWEST_FILES_COUNT], "tool_cpu_time_s": tool_cpu_time,
+                "cache": {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None},
+                "counters": self.counters}
+
+    def write(self) -> None:
+        """
+        Write the trace and the summary and print the summary.
+        """
+        summary = self.summary()
+        try:
+            self.trace_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(self.trace_path, json.dumps({"traceEvents": self._events, "displayTimeUnit": "ms"}).encode("utf-8"))
+            write_atomic(self.summary_path, json.dumps(summary, indent=2).encode("utf-8"))
+        except (OSError, IOError) as file_error:
+            print(f"[{self.tool_name}] Profile '{self.trace_path}' could not be written: {file_error}", file=sys.stderr)
+            return
+        if self.profile_dir:
+            trim_profiles(self.profile_dir)
+        print(f"[{self.tool_name}] {format_summary(summary)}, trace written to {self.trace_path}", file=sys.stderr)
+
+
+def trim_profiles(profile_dir: Path, max_files: int = MAX_PROFILE_FILES) -> None:
+    """
+    Remove the oldest traces of a profile directory and their summaries, such that the profiles of old builds do not accumulate.
+    Failures are ignored.
+    :param profile_dir: Directory of the traces.
+    :param max_files: Number of traces to keep.
+    """
+    entries = list()
+    try:
+        for entry in os.scandir(str(profile_dir)):
+            if entry.name.endswith(TRACE_SUFFIX):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    for _, path in entries[max_files:]:
+        for file in [path, path[:-len(TRACE_SUFFIX)] + SUMMARY_SUFFIX]:
+            try:
+                os.unlink(file)
+            except OSError:
+                continue
+
+
+def format_summary(summary: dict) -> str:
+    """
+    Format a summary in one line.
+    :param summary: Summary of a profile, see Profiler.summary.
+    :return: The formatted summary.
+    """
+    text = f"Profile: {summary['wall_time_s']:.2f} s wall clock time for {summary['files']} files, " \
+           f"tool CPU time {summary['tool_cpu_time_s']:.2f} s"
+    if summary["cache"]["hit_rate"] is not None:
+        text += f", cache hit rate {summary['cache']['hit_rate']:.0%} ({summary['cache']['hits']} hits)"
+    phases = sorted(summary["phases_s"].items(), key=lambda phase: phase[1], reverse=True)
+    if phases:
+        text += " (" + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in phases[:4]) + ")"
+    return text
+
+
+def get_profile_path(argv: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Get the profile path from the '--profile' argument or the CMAKE_CLANG_TOOLS_PROFILE environment variable.
+    The argument is read before the argument parsing, such that the parsing is profiled too.
+    :param argv: Command line arguments, defaults to sys.argv.
+    :return: The profile path or None if profiling is disabled.
+    """
+    return get_argument(sys.argv[1:] if argv is None else argv, "--profile") or os.environ.get(PROFILE_ENVIRONMENT_VARIABLE) or None
+
+
+def start_profiling(path: Optional[str], tool_name: str) -> Optional[Profiler]:
+    """
+    Start profiling this process, the profile is written when the process exits.
+    :param path: Trace file or directory, profiling is disabled if None.
+    :param tool_name: Name of the profiled tool.
+    :return: The profiler or None if profiling is disabled.
+    """
+    global _profiler
+    if path and _profiler is None:
+        _profiler = Profiler(path, tool_name)
+        atexit.register(_profiler.write)
+    return _profiler
+
+
+def span(name: str, category: str = PHASE_CATEGORY, **args):
+    """
+    Measure the time spent in the context, if profiling is enabled.
+    :param name: Name of the span.
+    :param category: Category of the span, see Profiler.span.
+    :param args: Additional arguments shown in the trace.
+    :return: Context manager.
+    """
+    return _profiler.span(name, category, **args) if _profiler else _null_span
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Increment a counter of the summary, if profiling is enabled.
+    :param name: Name of the counter.
+    :param value: Value to add.
+    """
+    if _profiler:
+        _profiler.count(name, value)
+
+
+def aggregate_summaries(summaries: List[dict]) -> dict:
+    """
+    Aggregate the summaries of multiple processes, e.g. of the per-source CMake commands.
+    :param summaries: Summaries of the processes.
+    :return: Aggregated summary, the wall clock time is the sum of the processes.
+    """
+    phases = dict()
+    counters = dict()
+    files = list()
+    for summary in summaries:
+        for name, seconds in summary["phases_s"].items():
+            phases[name] = phases.get(name, 0.0) + seconds
+        for name, value in summary.get("counters", dict()).items():
+            counters[name] = counters.get(name, 0) + value
+        files.extend(summary["slowest_files"])
+    files.sort(key=lambda file: file["seconds"], reverse=True)
+    hits, misses = counters.get("cache hits", 0), counters.get("cache misses", 0)
+    return {"tool": ",".join(sorted({summary["tool"] for summary in summaries})),
+            "wall_time_s": sum(summary["wall_time_s"] for summary in summaries),
+            "files": sum(summary["files"] for summary in summaries), "phases_s": phases, "slowest_files": files[:SLOWEST_FILES_COUNT],
+            "tool_cpu_time_s": sum(summary["tool_cpu_time_s"] for summary in summaries),
+            "cache": {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else None},
+            "counters": counters, "processes": len(summaries)}
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :return: Namespace object that contains the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Aggregate the profiles of multiple runs of the cmake_clang_tools scripts.")
+    parser.add_argument("--output", default=None, type=Path, help="Merged Chrome trace of all profiles.")
+    parser.add_argument("paths", nargs="+", type=Path, help="Profile directories or trace files.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    trace_files = list()
+    for path in args.paths:
+        trace_files.extend(sorted(path.glob(f"*{TRACE_SUFFIX}")) if path.is_dir() else [path])
+    summaries = list()
+    events = list()
+    for trace_file in trace_files:
+        summary_file = trace_file.with_name(trace_file.name[:-len(TRACE_SUFFIX)] + SUMMARY_SUFFIX)
+        try:
+            summaries.append(json.loads(summary_file.read_text()))
+            if args.output:
+                events.extend(json.loads(trace_file.read_text())["traceEvents"])
+        except (OSError, IOError, ValueError, KeyError) as file_error:
+            sys.exit(f"Profile '{trace_file}' could not be read: {file_error}")
+    if not summaries:
+        sys.exit("No profiles found.")
+
+    summary = aggregate_summaries(summaries)
+    print(f"{summary['processes']} processes, {format_summary(summary)}")
+    for file in summary["slowest_files"]:
+        print(f"  {file['seconds']:8.2f} s  {file['file']}")
+    if args.output:
+        write_atomic(args.output, json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
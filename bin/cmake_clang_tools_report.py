@@ -0,0 +1,126 @@
+import json
+import os
+from pathlib import Path
+import sys
+from typing import List, Optional
+
+from cmake_clang_tools_cache import write_atomic
+
+REPORT_FORMAT_JSONL = "jsonl"
+REPORT_FORMAT_SARIF = "sarif"
+REPORT_FORMATS = [REPORT_FORMAT_JSONL, REPORT_FORMAT_SARIF]
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+# End of a SARIF document with a single run, following the results.
+SARIF_END = "]}]}"
+
+
+def get_report_format(report_file: Path, report_format: Optional[str] = None) -> str:
+    """
+    Get the format of a report file.
+    :param report_file: Path of the report file.
+    :param report_format: Explicitly requested format or None to select the format by the file extension.
+    :return: One of REPORT_FORMATS.
+    """
+    if report_format:
+        return report_format
+    return REPORT_FORMAT_SARIF if Path(report_file).suffix == ".sarif" else REPORT_FORMAT_JSONL
+
+
+def write_records(record_file: Path, records: List[dict]) -> None:
+    """
+    Record the diagnostics of a file, such that the next reports can include them without checking the file again.
+    Failures are ignored, the file is missing in the next reports.
+    :param record_file: Path of the record, e.g. next to the proxy stamp of the file.
+    :param records: The diagnostics of the file as returned by DiagnosticReport.add.
+    """
+    try:
+        write_atomic(Path(record_file), json.dumps(records).encode("utf-8"))
+    except (OSError, IOError):
+        pass
+
+
+def read_records(record_file: Path) -> Optional[List[dict]]:
+    """
+    :param record_file: Path of the record, see write_records.
+    :return: The recorded diagnostics or None if there is no record.
+    """
+    try:
+        with open(record_file, 'r') as file:
+            return json.load(file)
+    except (OSError, IOError, ValueError):
+        return None
+
+
+class DiagnosticReport:
+    """
+    Machine readable report of diagnostics, that is written while the tool runs.
+    Every diagnostic is flushed immediately, such that e.g. a CI can annotate the diagnostics before the run finishes.
+    The report is replaced, SARIF reports only form a valid document once the report is closed.
+    """
+
+    def __init__(self, report_file: Path, report_format: str, tool_name: str):
+        """
+        :param report_file: Path of the report file.
+        :param report_format: One of REPORT_FORMATS.
+        :param tool_name: Name of the tool reporting the diagnostics, e.g. 'clang-format'.
+        """
+        self.report_format = report_format
+        self.tool_name = tool_name
+        self._result_count = 0
+        try:
+            if report_format == REPORT_FORMAT_SARIF:
+                self._file = open(report_file, 'w')
+                # The results are streamed into the document, which ends with the results.
+                document = json.dumps({"$schema": SARIF_SCHEMA, "version": "2.1.0",
+                                       "runs": [{"tool": {"driver": {"name": tool_name}}, "results": []}]})
+                self._file.write(document[:-len(SARIF_END)] + "\n")
+            else:
+                self._file = open(report_file, 'w')
+        except (OSError, IOError) as file_error:
+            sys.exit(f"Report file '{report_file}' could not be opened: {file_error}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def add(self, file: Path, line: int, column: int, level: str, message: str, rule: Optional[str] = None) -> dict:
+        """
+        Add a diagnostic to the report.
+        :param file: File of the diagnostic.
+        :param line: Line of the diagnostic, starting at 1.
+        :param column: Column of the diagnostic, starting at 1.
+        :param level: Either 'warning' or 'error'.
+        :param message: Message of the diagnostic.
+        :param rule: Name of the check reporting the diagnostic, defaults to the tool name.
+        :return: The diagnostic as record, which can be added again with add_record.
+        """
+        file_path = os.path.abspath(file)
+        rule = rule or self.tool_name
+        if self.report_format == REPORT_FORMAT_SARIF:
+            result = {"ruleId": rule, "level": level, "message": {"text": message},
+                      "locations": [{"physicalLocation": {"artifactLocation": {"uri": Path(file_path).as_uri()},
+                                                          "region": {"startLine": line, "startColumn": column}}}]}
+            self._file.write(("," if self._result_count else "") + json.dumps(result) + "\n")
+        else:
+            self._file.write(json.dumps({"tool": self.tool_name, "rule": rule, "file": file_path, "line": line, "column": column,
+                                         "level": level, "message": message}) + "\n")
+        self._result_count += 1
+        self._file.flush()
+        return {"file": file_path, "line": line, "column": column, "level": level, "message": message, "rule": rule}
+
+    def add_record(self, record: dict) -> None:
+        """
+        Add a recorded diagnostic to the report.
+        :param record: The diagnostic as returned by add.
+        """
+        self.add(Path(record["file"]), record["line"], record["column"], record["level"], record["message"], record["rule"])
+
+    def close(self) -> None:
+        """
+        Complete and close the report.
+        """
+        if self.report_format == REPORT_FORMAT_SARIF:
+            self._file.write(SARIF_END + "\n")
+        self._file.close()
@@ -0,0 +1,296 @@
+import fcntl
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import re
+import struct
+import sys
+from typing import Dict, List, Optional
+
+from cmake_clang_tools_cache import DEFAULT_CACHE_DIR, write_atomic
+
+WHITELIST_KEY = 'whitelist'
+BLACKLIST_KEY = 'blacklist'
+PROJECTS_KEY = 'projects'
+RUN_KEY_PREFIX = 'run_'
+TOOL_NAMES = ["clang_format", "clang_tidy"]
+# Prefix of the project patterns that are regular expressions, other patterns containing '*', '?' or '[' are globs.
+REGEX_PREFIX = "re:"
+GLOB_CHARACTERS = re.compile(r"[*?[]")
+# Directory of the compiled settings indices, shared by all projects of all workspaces.
+DEFAULT_INDEX_DIR = DEFAULT_CACHE_DIR / "settings"
+# Number of indices kept in the directory, the least recently used ones are removed.
+MAX_INDEX_FILES = 32
+
+INDEX_MAGIC = b"CCTSIDX1"
+# Header: magic, number of slots of the hash table, default bits, length of the JSON encoded patterns following the table.
+INDEX_HEADER = struct.Struct("<8sIII")
+# Slot of the hash table: 64 bit hash of the project name (0 for empty slots) and the bits of the project.
+INDEX_SLOT = struct.Struct("<QI")
+
+# Bits of a project or pattern.
+WHITELISTED = 1
+BLACKLISTED = 2
+# Default bits of the settings.
+HAS_WHITELIST = 1
+NO_SETTINGS = 2
+
+
+def get_run_bit(tool_name: str) -> int:
+    """
+    :param tool_name: Name of the clang tool.
+    :return: Bit set if the tool runs, globally in the default bits or for a project together with its override bit.
+    """
+    return 4 << (2 * TOOL_NAMES.index(tool_name))
+
+
+def get_override_bit(tool_name: str) -> int:
+    """
+    :param tool_name: Name of the clang tool.
+    :return: Bit set if a project overrides whether the tool runs.
+    """
+    return 8 << (2 * TOOL_NAMES.index(tool_name))
+
+
+def hash_project(project_name: str) -> int:
+    """
+    :param project_name: CMake project name.
+    :return: Non-zero 64 bit hash of the name.
+    """
+    return int.from_bytes(hashlib.blake2b(project_name.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+
+def is_pattern(entry: str) -> bool:
+    """
+    :param entry: Project name or pattern of the settings.
+    :return: True if the entry is a glob or regular expression.
+    """
+    return entry.startswith(REGEX_PREFIX) or bool(GLOB_CHARACTERS.search(entry))
+
+
+def translate_pattern(pattern: str) -> str:
+    """
+    :param pattern: Glob or regular expression with the REGEX_PREFIX.
+    :return: Regular expression matching the whole project name.
+    """
+    if pattern.startswith(REGEX_PREFIX):
+        return f"(?:{pattern[len(REGEX_PREFIX):]})\\Z"
+    return fnmatch.translate(pattern)
+
+
+def get_entries(settings: dict, key: str) -> List[str]:
+    """
+    :param settings: The settings.
+    :param key: Key of a list of projects. The default settings use empty maps '{ }' as empty lists.
+    :return: The entries as strings.
+    """
+    return [str(entry) for entry in settings.get(key) or list()]
+
+
+def compile_settings(settings: Optional[dict]) -> bytes:
+    """
+    Compile the settings into an index, which answers whether a tool runs for a project without parsing the settings.
+    Project names are stored in an open addressing hash table, the glob and regular expression patterns are combined into one
+    regular expression per list.
+    :param settings: The settings of the config.yaml file. No tool runs if they are None, e.g. for an empty file.
+    :return: The index.
+    """
+    if settings is None:
+        return INDEX_HEADER.pack(INDEX_MAGIC, 0, NO_SETTINGS, 0)
+    default_bits = 0
+    for tool_name in TOOL_NAMES:
+        if settings.get(RUN_KEY_PREFIX + tool_name, True):
+            default_bits |= get_run_bit(tool_name)
+
+    project_bits = dict()
+    patterns = dict()
+    whitelist = get_entries(settings, WHITELIST_KEY)
+    if whitelist:
+        default_bits |= HAS_WHITELIST
+    for key, bit in [(WHITELIST_KEY, WHITELISTED), (BLACKLIST_KEY, BLACKLISTED)]:
+        list_patterns = list()
+        for entry in get_entries(settings, key):
+            if is_pattern(entry):
+                list_patterns.append(translate_pattern(entry))
+            else:
+                project_bits[entry] = project_bits.get(entry, 0) | bit
+        if list_patterns:
+            patterns[key] = "|".join(f"(?:{pattern})" for pattern in list_patterns)
+
+    # Overrides of the tools per project, e.g. 'projects: {my_package: {run_clang_tidy: false}}'.
+    overrides = list()
+    for entry, project_settings in (settings.get(PROJECTS_KEY) or dict()).items():
+        bits = 0
+        for tool_name in TOOL_NAMES:
+            run = (project_settings or dict()).get(RUN_KEY_PREFIX + tool_name)
+            if run is not None:
+                bits |= get_override_bit(tool_name) | (get_run_bit(tool_name) if run else 0)
+        if is_pattern(str(entry)):
+            overrides.append([translate_pattern(str(entry)), bits])
+        else:
+            project_bits[str(entry)] = project_bits.get(str(entry), 0) | bits
+    if overrides:
+        patterns[PROJECTS_KEY] = overrides
+
+    # The table is at most half full, such that the probe sequences stay short.
+    slot_count = 1
+    while slot_count < 2 * len(project_bits):
+        slot_count *= 2
+    slots = [(0, 0)] * (slot_count if project_bits else 0)
+    for project_name, bits in project_bits.items():
+        key = hash_project(project_name)
+        index = key % slot_count
+        while slots[index][0] not in (0, key):
+            index = (index + 1) % slot_count
+        slots[index] = (key, slots[index][1] | bits)
+
+    encoded_patterns = json.dumps(patterns).encode("utf-8") if patterns else bytes()
+    return b"".join([INDEX_HEADER.pack(INDEX_MAGIC, len(slots), default_bits, len(encoded_patterns)),
+                     *(INDEX_SLOT.pack(*slot) for slot in slots), encoded_patterns])
+
+
+def trim_indices(index_dir: Path, max_files: int = MAX_INDEX_FILES) -> None:
+    """
+    Remove the least recently used indices, such that the indices of old settings do not accumulate.
+    Failures are ignored, the indices are compiled again if needed.
+    :param index_dir: Directory of the indices.
+    :param max_files: Number of indices to keep.
+    """
+    entries = list()
+    try:
+        for entry in os.scandir(str(index_dir)):
+            if entry.name.endswith(".idx"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    continue
+    except OSError:
+        return
+    entries.sort(reverse=True)
+    for _, path in entries[max_files:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+
+
+class SettingsIndex:
+    """
+    Compiled settings, see compile_settings. The index is memory-mapped, such that a lookup only reads the slots it probes.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: The index, as bytes or memory map.
+        """
+        magic, self._slot_count, self._default_bits, patterns_length = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError("Invalid settings index.")
+        self._data = data
+        self._patterns_offset = INDEX_HEADER.size + self._slot_count * INDEX_SLOT.size
+        self._patterns_length = patterns_length
+        self._patterns = None
+
+    @classmethod
+    def open(cls, settings_file: Path, index_dir: Path = DEFAULT_INDEX_DIR) -> "SettingsIndex":
+        """
+        Open the index of a settings file, compile it if the settings changed.
+        The index is keyed by a hash of the content of the file, copies of the settings share it. Concurrent processes wait for
+        the first one to compile the index, such that the YAML is parsed once per change.
+        :param settings_file: The config.yaml file.
+        :param index_dir: Directory of the indices.
+        :return: The index.
+        """
+        try:
+            with open(settings_file, 'rb') as file:
+                content = file.read()
+        except (OSError, IOError) as file_error:
+            sys.exit(f"YAML file '{settings_file}' can not be opened: {file_error}")
+        index_file = Path(index_dir) / f"{hashlib.blake2b(content, digest_size=16).hexdigest()}.idx"
+        index = cls._map(index_file)
+        if index:
+            return index
+
+        Path(index_dir).mkdir(parents=True, exist_ok=True)
+        with open(Path(index_dir) / ".lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = cls._map(index_file)
+            if index:
+                return index
+            # The helpers import PyYAML on demand, which is only needed here.
+            import cmake_clang_tools_helpers
+            # The hashed content is parsed, the file may have changed since it was read.
+            data = compile_settings(cmake_clang_tools_helpers.parse_yaml(content, settings_file))
+            try:
+                write_atomic(index_file, data)
+            except OSError:
+                pass
+            trim_indices(Path(index_dir))
+        return cls(data)
+
+    @classmethod
+    def _map(cls, index_file: Path) -> Optional["SettingsIndex"]:
+        try:
+            with open(index_file, 'rb') as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            index = cls(data)
+            # Mark the index as recently used.
+            os.utime(str(index_file))
+            return index
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _get_patterns(self) -> Dict[str, object]:
+        if self._patterns is None:
+            self._patterns = dict()
+            if self._patterns_length:
+                encoded_patterns = self._data[self._patterns_offset:self._patterns_offset + self._patterns_length]
+                for key, value in json.loads(bytes(encoded_patterns).decode("utf-8")).items():
+                    if key == PROJECTS_KEY:
+                        self._patterns[key] = [(re.compile(pattern), bits) for pattern, bits in value]
+                    else:
+                        self._patterns[key] = re.compile(value)
+        return self._patterns
+
+    def _get_project_bits(self, project_name: str) -> int:
+        if not self._slot_count:
+            return 0
+        key = hash_project(project_name)
+        index = key % self._slot_count
+        while True:
+            slot_key, bits = INDEX_SLOT.unpack_from(self._data, INDEX_HEADER.size + index * INDEX_SLOT.size)
+            if slot_key == key:
+                return bits
+            if slot_key == 0:
+                return 0
+            index = (index + 1) % self._slot_count
+
+    def should_run(self, project_name: str, tool_name: str) -> bool:
+        """
+        Check if a tool runs for a project.
+        :param project_name: CMake project name.
+        :param tool_name: Name of the clang tool.
+        :return: True if the tool is enabled for the project, the project is whitelisted or no whitelist is given and the
+                 project is not blacklisted.
+        """
+        if self._default_bits & NO_SETTINGS:
+            return False
+        bits = self._get_project_bits(project_name)
+        if self._patterns_length and not bits & BLACKLISTED:
+            patterns = self._get_patterns()
+            for key, bit in [(WHITELIST_KEY, WHITELISTED), (BLACKLIST_KEY, BLACKLISTED)]:
+                if key in patterns and patterns[key].match(project_name):
+                    bits |= bit
+            # Overrides of the project name take precedence over the ones of patterns.
+            if not bits & get_override_bit(tool_name):
+                bits |= next((pattern_bits for pattern, pattern_bits in patterns.get(PROJECTS_KEY, list())
+                              if pattern_bits & get_override_bit(tool_name) and pattern.match(project_name)), 0)
+
+        run_bit = get_run_bit(tool_name)
+        should_run_tool = bits & run_bit if bits & get_override_bit(tool_name) else self._default_bits & run_bit
+        project_is_whitelisted = bits & WHITELISTED or not self._default_bits & HAS_WHITELIST
+        return bool(should_run_tool and project_is_whitelisted and not bits & BLACKLISTED)
+
@@ -0,0 +1,265 @@
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+from typing import Dict, List, Optional, TextIO
+from urllib.parse import urlsplit
+
+from cmake_clang_tools_cache import write_atomic
+
+# Environment variables configuring the shared store for all runs, e.g. on the CI runners.
+SHARED_STORE_ENVIRONMENT_VARIABLE = "CMAKE_CLANG_TOOLS_SHARED_CACHE"
+BASE_DIR_ENVIRONMENT_VARIABLE = "CMAKE_CLANG_TOOLS_CACHE_BASE_DIR"
+# Path of the bulk lookup of the HTTP protocol, relative to the URL of the store.
+BULK_LOOKUP_PATH = "lookup"
+HTTP_TIMEOUT_S = 5.0
+# Number of failed requests after which the store is disabled for the rest of the run, such that an unreachable server does
+# not slow down every lookup.
+MAX_ERRORS = 3
+
+
+class SharedStore:
+    """
+    Store of the results of the clang tools shared between machines, like the secondary storage of ccache.
+    The entries are the serialized results of the local cache, see cmake_clang_tools_cache.ResultCache. Failures are counted
+    and otherwise ignored, the store is only an optimization.
+    """
+
+    def __init__(self, url: str):
+        """
+        :param url: Location of the store, see open_shared_store.
+        """
+        self.url = url
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def disabled(self) -> bool:
+        """
+        :return: True if the store failed too often and is not used anymore.
+        """
+        return self.errors >= MAX_ERRORS
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Look up an entry.
+        :param key: Key of the entry.
+        :return: The entry or None if it is not stored.
+        """
+        if self.disabled:
+            return None
+        data = self._get(key)
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """
+        Look up multiple entries at once.
+        :param keys: Keys of the entries.
+        :return: Dictionary mapping the stored keys to their entries.
+        """
+        if self.disabled or not keys:
+            return dict()
+        entries = self._get_many(keys)
+        self.hits += len(entries)
+        self.misses += len(keys) - len(entries)
+        return entries
+
+    def put(self, key: str, data: bytes) -> None:
+        """
+        Store an entry.
+        :param key: Key of the entry.
+        :param data: The entry.
+        """
+        if not self.disabled and self._put(key, data):
+            self.stores += 1
+
+    def _get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        entries = dict()
+        for key in keys:
+            data = self._get(key)
+            if data is not None:
+                entries[key] = data
+        return entries
+
+    def _put(self, key: str, data: bytes) -> bool:
+        raise NotImplementedError
+
+
+class DirectoryStore(SharedStore):
+    """
+    Shared store in a directory, e.g. on a network file system. Entries are never evicted, the directory can be cleaned up by
+    deleting the entries that were not modified for some time.
+    """
+
+    def __init__(self, url: str, directory: Path):
+        """
+        :param url: Location of the store, see open_shared_store.
+        :param directory: Directory of the entries.
+        """
+        super().__init__(url)
+        self.directory = Path(directory)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key[2:]}.json"
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._entry_path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            self.errors += 1
+            return None
+
+    def _put(self, key: str, data: bytes) -> bool:
+        path = self._entry_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # The entries are shared with the other users of the group.
+            write_atomic(path, data, 0o664)
+        except OSError:
+            self.errors += 1
+            return False
+        return True
+
+
+class HttpStore(SharedStore):
+    """
+    Shared store on an HTTP server. The protocol is:
+    - GET <url>/<key[:2]>/<key>: 200 with the entry or 404 if it is not stored.
+    - PUT <url>/<key[:2]>/<key>: Store the entry in the request body, any 2xx status.
+    - POST <url>/lookup: Bulk lookup of the JSON list of keys in the request body, 200 with a JSON object mapping the stored keys
+      to their entries as strings. Servers without bulk lookup answer 404, 405 or 501 and are queried key by key.
+    Every thread keeps its connection alive between the requests.
+    """
+
+    def __init__(self, url: str):
+        """
+        :param url: Base URL of the store, e.g. 'http://cache.local:8080/clang-tools'.
+        """
+        super().__init__(url)
+        parts = urlsplit(url)
+        self._scheme = parts.scheme
+        self._netloc = parts.netloc
+        self._prefix = parts.path.rstrip("/")
+        self._bulk = True
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # The HTTP client is only imported if the store is used.
+            import http.client
+            connection_type = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+            connection = self._local.connection = connection_type(self._netloc, timeout=HTTP_TIMEOUT_S)
+        return connection
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None) -> Optional[tuple]:
+        """
+        Send a request on the connection of this thread. Broken keep-alive connections are reconnected once.
+        :return: Tuple of the status and the response body or None if the request failed.
+        """
+        import http.client
+        headers = {"Content-Type": "application/json"} if body is not None else dict()
+        for _ in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, f"{self._prefix}/{path}", body=body, headers=headers)
+                response = connection.getresponse()
+                # The body has to be read completely to reuse the connection.
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                self._local.connection = None
+        self.errors += 1
+        return None
+
+    def _get(self, key: str) -> Optional[bytes]:
+        response = self._request("GET", f"{key[:2]}/{key}")
+        if response is None:
+            return None
+        status, data = response
+        if status == 200:
+            return data
+        if status != 404:
+            self.errors += 1
+        return None
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if self._bulk:
+            response = self._request("POST", BULK_LOOKUP_PATH, json.dumps(keys).encode("utf-8"))
+            if response is None:
+                return dict()
+            status, data = response
+            if status == 200:
+                requested_keys = set(keys)
+                try:
+                    return {key: value.encode("utf-8") for key, value in json.loads(data.decode("utf-8")).items()
+                            if key in requested_keys}
+                except (ValueError, AttributeError):
+                    self.errors += 1
+                    return dict()
+            if status not in (404, 405, 501):
+                self.errors += 1
+                return dict()
+            self._bulk = False
+        return super()._get_many(keys)
+
+    def _put(self, key: str, data: bytes) -> bool:
+        response = self._request("PUT", f"{key[:2]}/{key}", data)
+        if response is None:
+            return False
+        if not 200 <= response[0] < 300:
+            self.errors += 1
+            return False
+        return True
+
+
+def open_shared_store(url: Optional[str]) -> Optional[SharedStore]:
+    """
+    Open the shared store at a location.
+    :param url: 'http://' or 'https://' URL of an HTTP store, 'file://' URL or path of a directory store. Defaults to the
+                environment variable CMAKE_CLANG_TOOLS_SHARED_CACHE.
+    :return: The store or None if no location is given.
+    """
+    url = url or os.environ.get(SHARED_STORE_ENVIRONMENT_VARIABLE)
+    if not url:
+        return None
+    scheme = urlsplit(url).scheme
+    if scheme in ("http", "https"):
+        return HttpStore(url)
+    if scheme == "file":
+        return DirectoryStore(url, Path(urlsplit(url).path))
+    if scheme:
+        sys.exit(f"Shared cache '{url}' is not supported, use a directory or an http(s):// URL.")
+    return DirectoryStore(url, Path(url))
+
+
+def print_shared_store_summary(tool_label: str, store: Optional[SharedStore], stream: TextIO = sys.stdout) -> None:
+    """
+    Print the statistics of the shared store of a run.
+    :param tool_label: Name of the tool in the summary, e.g. 'clang-tidy'.
+    :param store: The shared store, nothing is printed if None or unused.
+    :param stream: Stream to print to.
+    """
+    if not store or not (store.hits or store.misses or store.stores or store.errors):
+        return
+    lookups = store.hits + store.misses
+    text = f"[{tool_label}] Shared cache {store.url}: {store.hits} of {lookups} lookups hit"
+    if lookups:
+        text += f" ({100 * store.hits / lookups:.0f} %)"
+    text += f", {store.stores} results stored"
+    if store.errors:
+        text += f", {store.errors} errors" + (" (disabled)" if store.disabled else "")
+    print(f"{text}.", file=stream)
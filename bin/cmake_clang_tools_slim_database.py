@@ -0,0 +1,199 @@
+import fcntl
+import json
+import os
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import List, Optional
+
+from cmake_clang_tools_cache import hash_parts, write_atomic
+from cmake_clang_tools_compile_database import COMPILE_COMMANDS_FILE, OUTPUT_ARGUMENTS, OUTPUT_ARGUMENTS_WITH_VALUE, \
+    CompileDatabase, parse_make_dependencies
+
+# Directory in the build directory the slim compile databases are written to, one per set of options.
+SLIM_DATABASE_DIR = "clang-tidy-slim"
+# Directory in the build directory the precompiled headers are written to, shared by all slim compile databases.
+PCH_DIR = "clang-tidy-pch"
+# Compiler arguments that only influence the code generation, not the parsing.
+CODEGEN_ARGUMENT_REGEX = re.compile(r"^(?:-O(?:[0-9sgz]|fast)?|-g(?:[0-9]|gdb|dwarf.*|line-.*|split-dwarf.*|column-info|no-.*|z.*)?|"
+                                    r"--coverage|-pg|-pipe|-save-temps(?:=.*)?|-f(?:no-)?lto(?:=.*)?|-flto-.*|-f(?:no-)?sanitize.*|"
+                                    r"-fprofile-.*|-fcoverage-.*|-f(?:no-)?(?:function|data)-sections)$")
+INCLUDE_ARGUMENT_PREFIX = "-I"
+C_SOURCE_EXTENSIONS = {".c"}
+
+
+def is_in_directories(path: str, directories: List[str]) -> bool:
+    """
+    :param path: Absolute path.
+    :param directories: Absolute paths of directories.
+    :return: True if the path is one of the directories or inside of one of them.
+    """
+    return any(path == directory or path.startswith(directory.rstrip(os.sep) + os.sep) for directory in directories)
+
+
+def slim_arguments(arguments: List[str], directory: str, project_dirs: List[str]) -> List[str]:
+    """
+    Remove the arguments that clang-tidy does not need from a compile command and include the third-party headers as system
+    headers, whose diagnostics clang-tidy does not report.
+    The optimization level is replaced by the macros it defines, such that the preprocessing does not change.
+    :param arguments: Arguments of the compile command, including the compiler.
+    :param directory: Working directory of the compile command.
+    :param project_dirs: Absolute paths of the project directories, include directories outside of them are third-party.
+    :return: The slim arguments.
+    """
+    slim = list()
+    optimization = None
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        index += 1
+        if argument in OUTPUT_ARGUMENTS_WITH_VALUE:
+            index += 1
+        elif argument in OUTPUT_ARGUMENTS or any(argument.startswith(prefix) and argument != prefix for prefix in OUTPUT_ARGUMENTS_WITH_VALUE):
+            continue
+        elif CODEGEN_ARGUMENT_REGEX.match(argument):
+            if argument.startswith("-O"):
+                optimization = argument[2:]
+        elif argument.startswith(INCLUDE_ARGUMENT_PREFIX):
+            include_dir = argument[len(INCLUDE_ARGUMENT_PREFIX):]
+            if not include_dir and index < len(arguments):
+                include_dir = arguments[index]
+                index += 1
+            absolute_include_dir = os.path.normpath(os.path.join(directory, include_dir))
+            if is_in_directories(absolute_include_dir, project_dirs):
+                slim.append(INCLUDE_ARGUMENT_PREFIX + include_dir)
+            else:
+                slim += ["-isystem", include_dir]
+        else:
+            slim.append(argument)
+
+    # The compiler defines these macros depending on the optimization level.
+    if optimization not in (None, "0"):
+        slim[1:1] = ["-D__OPTIMIZE__=1", "-U__NO_INLINE__"]
+        if optimization in ("s", "z"):
+            slim.insert(1, "-D__OPTIMIZE_SIZE__=1")
+        elif optimization == "fast":
+            slim.insert(1, "-ffast-math")
+    return slim
+
+
+def get_pch_compiler(clang_tidy: str) -> str:
+    """
+    Get the clang executable matching a clang-tidy executable, e.g. 'clang++-14' for 'clang-tidy-14'.
+    A precompiled header can only be read by the same version of clang it was written with.
+    :param clang_tidy: The clang-tidy executable.
+    :return: The clang executable.
+    """
+    directory, name = os.path.split(clang_tidy)
+    return os.path.join(directory, name.replace("clang-tidy", "clang++", 1)) if "clang-tidy" in name else "clang++"
+
+
+class PrecompiledHeaders:
+    """
+    Precompiled headers of a header with the third-party includes of a package, e.g. of Eigen, Boost or ROS.
+    One precompiled header is built per set of compile flags and reused by all translation units with these flags, it is rebuilt
+    if the header or one of its includes changes.
+    """
+
+    def __init__(self, header: Path, compiler: str, directory: Path):
+        """
+        :param header: Header including the third-party headers. Project headers should not be included, since clang-tidy does
+                       not report the diagnostics of headers that are read from a precompiled header.
+        :param compiler: The clang executable of the same version as clang-tidy.
+        :param directory: Directory to write the precompiled headers to.
+        """
+        self.header = os.path.abspath(header)
+        self.compiler = compiler
+        self.directory = Path(directory)
+        self._pch_files = dict()
+
+    def _is_up_to_date(self, pch_file: Path, depfile: Path) -> bool:
+        try:
+            pch_mtime = pch_file.stat().st_mtime_ns
+            with open(depfile, 'r') as dependency_file:
+                dependencies = parse_make_dependencies(dependency_file.read())
+            return bool(dependencies) and all(os.stat(dependency).st_mtime_ns <= pch_mtime for dependency in dependencies)
+        except (OSError, IOError):
+            return False
+
+    def get(self, flags: List[str], directory: str) -> Optional[Path]:
+        """
+        Get the precompiled header for a set of compile flags, build it if it does not exist or is outdated.
+        :param flags: Slim compile flags without the compiler and the source file.
+        :param directory: Working directory of the compile command.
+        :return: Path of the precompiled header or None if it can not be built.
+        """
+        key = hash_parts(self.compiler, self.header, directory, *flags)[:16]
+        if key in self._pch_files:
+            return self._pch_files[key]
+        self.directory.mkdir(parents=True, exist_ok=True)
+        pch_file = self.directory / f"{key}.pch"
+        depfile = self.directory / f"{key}.pch.d"
+        # Parallel runs wait for the first one to build the precompiled header.
+        with open(self.directory / f"{key}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not self._is_up_to_date(pch_file, depfile):
+                temporary_file = self.directory / f".tmp-{key}-{os.getpid()}.pch"
+                command = [self.compiler, *flags, "-x", "c++-header", self.header, "-Xclang", "-emit-pch", "-o", str(temporary_file),
+                           "-MD", "-MF", str(depfile), "-w"]
+                try:
+                    result = subprocess.run(command, cwd=directory or None, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                            universal_newlines=True)
+                except OSError as error:
+                    result = subprocess.CompletedProcess(command, 1, str(error))
+                if result.returncode != 0:
+                    print(f"[clang-tidy] Precompiled header of '{self.header}' could not be built, continuing without it: "
+                          f"{result.stdout.strip()}", file=sys.stderr)
+                    if temporary_file.exists():
+                        temporary_file.unlink()
+                    self._pch_files[key] = None
+                    return None
+                os.replace(temporary_file, pch_file)
+        self._pch_files[key] = pch_file
+        return pch_file
+
+
+def write_slim_compile_database(compile_database: CompileDatabase, build_directory: str, project_dirs: List[str],
+                                precompiled_headers: Optional[PrecompiledHeaders] = None,
+                                files: Optional[List[Path]] = None) -> Path:
+    """
+    Write the slim compile commands of a compile database to a separate compile database, that clang-tidy runs with instead.
+    The file is only written if it changes.
+    :param compile_database: The compile database of the build.
+    :param build_directory: The build directory, the slim database is written to a subdirectory.
+    :param project_dirs: Absolute paths of the project directories, include directories outside of them are third-party.
+    :param precompiled_headers: Precompiled headers included by the C++ translation units.
+    :param files: Translation units the precompiled headers are built for. Defaults to all translation units.
+    :return: Directory of the slim compile database.
+    """
+    project_dirs = [os.path.normpath(os.path.abspath(directory)) for directory in project_dirs]
+    # The contents of the header are part of the options, such that the results cached for the directory are not replayed after
+    # the header changed.
+    pch_options = [precompiled_headers.header, precompiled_headers.compiler, Path(precompiled_headers.header).read_bytes()] \
+        if precompiled_headers else list()
+    options = hash_parts(*project_dirs, *pch_options)[:12]
+    slim_directory = Path(build_directory or ".") / f"{SLIM_DATABASE_DIR}-{options}"
+    pch_files = {os.path.normpath(os.path.abspath(file)) for file in files} if files is not None else None
+
+    entries = list()
+    for file, entry in compile_database.entries.items():
+        directory = entry.get("directory", "")
+        arguments = slim_arguments(compile_database.arguments(file), directory, project_dirs)
+        if precompiled_headers and os.path.splitext(file)[1] not in C_SOURCE_EXTENSIONS and (pch_files is None or file in pch_files):
+            flags = [argument for argument in arguments[1:] if argument not in ("-c", entry["file"], file)]
+            pch_file = precompiled_headers.get(flags, directory)
+            if pch_file:
+                arguments[1:1] = ["-include-pch", str(pch_file)]
+        entries.append({"directory": directory, "file": entry["file"], "arguments": arguments})
+
+    content = json.dumps(entries, indent=2).encode("utf-8")
+    slim_database = slim_directory / COMPILE_COMMANDS_FILE
+    try:
+        if slim_database.read_bytes() == content:
+            return slim_directory
+    except (OSError, IOError):
+        pass
+    slim_directory.mkdir(parents=True, exist_ok=True)
+    write_atomic(slim_database, content)
+    return slim_directory
@@ -0,0 +1,137 @@
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from cmake_clang_tools_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_TIMING_DATABASE = DEFAULT_CACHE_DIR / "timings.sqlite"
+# Time in seconds to wait for another process that writes the database.
+LOCK_TIMEOUT_S = 60.0
+# Weight of a new measurement in the recorded duration, smooths outliers of a busy machine.
+SMOOTHING = 0.5
+# Timings that were not updated for this time in seconds are removed, e.g. of deleted files or old configurations.
+MAX_AGE_S = 30 * 24 * 3600
+
+
+class TimingDatabase:
+    """
+    Durations of the previous runs of every file, stored as SQLite database shared by all projects.
+    The durations are keyed by the tool, the file path and the hash of the configuration, such that the files can be ordered
+    longest first. Without a timing of the current configuration, the latest timing of any configuration is used.
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: Path of the database file.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(self.path), timeout=LOCK_TIMEOUT_S)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS timings (tool TEXT NOT NULL, file TEXT NOT NULL, config TEXT NOT NULL, "
+                                 "seconds REAL NOT NULL, updated REAL NOT NULL, PRIMARY KEY (tool, file, config))")
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["TimingDatabase"]:
+        """
+        Open the timing database, timings are optional and not available if the database can not be opened.
+        :param path: Path of the database file.
+        :return: The database or None.
+        """
+        try:
+            return cls(path)
+        except (OSError, sqlite3.Error) as error:
+            print(f"Timing database '{path}' could not be opened: {error}", file=sys.stderr)
+            return None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Remove outdated timings, commit the updates and close the database.
+        """
+        self._connection.execute("DELETE FROM timings WHERE updated < ?", (time.time() - MAX_AGE_S,))
+        self._connection.commit()
+        self._connection.close()
+
+    def predict(self, tool: str, file: Path, config: Optional[str] = None) -> Optional[float]:
+        """
+        Predict the duration of a file from its previous runs.
+        :param tool: Name of the clang tool.
+        :param file: The file.
+        :param config: Hash of the configuration the file is processed with or None to use the timing of any configuration.
+        :return: Predicted duration in seconds or None if the file was never processed.
+        """
+        row = self._connection.execute("SELECT seconds FROM timings WHERE tool = ? AND file = ? ORDER BY config = ? DESC, updated DESC",
+                                       (tool, os.path.abspath(file), config)).fetchone()
+        return row[0] if row else None
+
+    def record(self, tool: str, file: Path, config: str, seconds: float) -> None:
+        """
+        Record the duration of a file.
+        :param tool: Name of the clang tool.
+        :param file: The file.
+        :param config: Hash of the configuration the file was processed with.
+        :param seconds: Measured duration in seconds.
+        """
+        file_path = os.path.abspath(file)
+        row = self._connection.execute("SELECT seconds FROM timings WHERE tool = ? AND file = ? AND config = ?",
+                                       (tool, file_path, config)).fetchone()
+        if row:
+            seconds = SMOOTHING * seconds + (1.0 - SMOOTHING) * row[0]
+        self._connection.execute("INSERT OR REPLACE INTO timings (tool, file, config, seconds, updated) VALUES (?, ?, ?, ?, ?)",
+                                 (tool, file_path, config, seconds, time.time()))
+
+    def order_longest_first(self, tool: str, files: List[Path], config: Optional[str] = None) -> Tuple[List[Path], Dict[Path, float]]:
+        """
+        Order files by their predicted duration, longest first.
+        Files without timing are started first, since they may be the longest ones, ordered by their size.
+        :param tool: Name of the clang tool.
+        :param files: The files.
+        :param config: Hash of the configuration the files are processed with.
+        :return: Tuple of the ordered files and a dictionary mapping the files with a timing to their predicted duration.
+        """
+        predictions = dict()
+        for file in files:
+            prediction = self.predict(tool, file, config)
+            if prediction is not None:
+                predictions[file] = prediction
+
+        def order_key(file: Path):
+            if file in predictions:
+                return False, predictions[file]
+            try:
+                return True, os.stat(file).st_size
+            except OSError:
+                return True, 0
+
+        return sorted(files, key=order_key, reverse=True), predictions
+
+
+def print_timing_summary(tool_label: str, predictions: Dict[Path, float], timings: Dict[Path, float], wall_time: float,
+                         stream: TextIO = sys.stdout) -> None:
+    """
+    Print the measured against the predicted durations of a run.
+    :param tool_label: Name of the tool in the summary, e.g. 'clang-tidy'.
+    :param predictions: Dictionary mapping files to their predicted duration in seconds.
+    :param timings: Dictionary mapping the processed files to their measured duration in seconds.
+    :param wall_time: Wall clock time of the run in seconds.
+    :param stream: Stream to print to.
+    """
+    # A single file, e.g. of the per-source CMake commands, is not summarized.
+    if len(timings) < 2:
+        return
+    predicted_files = [file for file in timings if file in predictions]
+    predicted = sum(predictions[file] for file in predicted_files)
+    actual = sum(timings[file] for file in predicted_files)
+    text = f"[{tool_label}] Timing: {len(timings)} files took {sum(timings.values()):.1f} s in {wall_time:.1f} s wall clock time"
+    if predicted_files:
+        text += f", {len(predicted_files)} files with history took {actual:.1f} s (predicted {predicted:.1f} s)"
+    longest_file = max(timings, key=timings.get)
+    print(f"{text}, longest: {longest_file} ({timings[longest_file]:.1f} s).", file=stream)
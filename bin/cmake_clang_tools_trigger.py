@@ -0,0 +1,47 @@
+import sys
+import time
+
+TRIGGER_CONTENT = 'RUN'
+# Time the script started, the scripts import this module first. Used to profile the interpreter startup and the imports.
+SCRIPT_START_TIME = time.time()
+
+
+def get_argument(argv: list, name: str):
+    """
+    Get the value of a command line argument without argparse, which is slow to import.
+    :param argv: Command line arguments.
+    :param name: Name of the argument, e.g. '--trigger-file'.
+    :return: Value of the last occurrence of the argument or None if it is not given.
+    """
+    value = None
+    for index, argument in enumerate(argv):
+        if argument.startswith(f"{name}="):
+            value = argument[len(name) + 1:]
+        elif argument == name and index + 1 < len(argv):
+            value = argv[index + 1]
+    return value
+
+
+def exit_if_not_triggered(tool_label: str, argv: list = None) -> None:
+    """
+    Exit the script if the trigger file is given and not set, before the script imports its dependencies.
+    The full argument parsing of the script is skipped, if the arguments are invalid the script fails in the next triggered run.
+    Batch mode (--stamp-dir) and help requests always take the regular path.
+    :param tool_label: Name of the tool in the skip message, e.g. 'clang-format'.
+    :param argv: Command line arguments, defaults to sys.argv.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if any(argument in ("-h", "--help") for argument in argv) or get_argument(argv, "--stamp-dir") is not None:
+        return
+    trigger_file = get_argument(argv, "--trigger-file")
+    if not trigger_file:
+        return
+    try:
+        with open(trigger_file, 'r') as file:
+            if file.readline() == TRIGGER_CONTENT:
+                return
+    except (OSError, IOError):
+        # Let the regular path report the error.
+        return
+    print(f"[{tool_label}] Skipping, trigger file not set.")
+    sys.exit(0)
@@ -4,18 +4,36 @@
 # Original Author: Clodéric Mars (https://github.com/cloderic)
 # Original License: The Unlicense
 
+# Skip before loading the dependencies, if the trigger file is not set. CMake runs the script for every source file.
+if __name__ == "__main__":
+    import cmake_clang_tools_trigger
+    cmake_clang_tools_trigger.exit_if_not_triggered("clang-format")
 
 import argparse
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import json
 import os
 from pathlib import Path
+import re
 import subprocess
 import sys
-from typing import Dict, List, Tuple
-import xml.etree.ElementTree as ElementTree
-
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cmake_clang_tools_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_MB, ResultCache, hash_parts, write_atomic
+from cmake_clang_tools_shared_store import BASE_DIR_ENVIRONMENT_VARIABLE, SHARED_STORE_ENVIRONMENT_VARIABLE, open_shared_store, \
+    print_shared_store_summary
+from cmake_clang_tools_timing import DEFAULT_TIMING_DATABASE, TimingDatabase, print_timing_summary
+from cmake_clang_tools_report import REPORT_FORMATS, DiagnosticReport, get_report_format, read_records, write_records
+from cmake_clang_tools_format_daemon import CONFIG_FILE_SEARCH, DEFAULT_IDLE_TIMEOUT_S, DEFAULT_SOCKET_PATH, STYLE_FILE_NAMES, \
+    FormatDaemonClient
+from cmake_clang_tools_jobserver import TokenPool
+import cmake_clang_tools_git
 import cmake_clang_tools_helpers
+import cmake_clang_tools_profile
+from cmake_clang_tools_profile import FILE_CATEGORY
 
 """
 Replacement type.
@@ -26,48 +44,77 @@ Replacement type.
 """
 Replacement = namedtuple("Replacement", "offset length text")
 
-"""
-Error type.
-   Attributes:
-        line        Line index in file.
-        column      Column index in line.
-        found       Found text.
-        expected    Expected text.
-"""
-Error = namedtuple("Error", "line column found expected")
 
-CONFIG_FILE_SEARCH = "file"
+class Error:
+    """
+    Error type, one per replacement. The record has slots, such that files with many replacements only keep its fields.
+       Attributes:
+            line        Line index in file.
+            column      Column index in line.
+            found       Found text.
+            expected    Expected text.
+    """
+    __slots__ = ("line", "column", "found", "expected")
+
+    def __init__(self, line: int, column: int, found: str, expected: str):
+        self.line = line
+        self.column = column
+        self.found = found
+        self.expected = expected
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Error) and (self.line, self.column, self.found, self.expected) == \
+            (other.line, other.column, other.found, other.expected)
+
+    def __repr__(self) -> str:
+        return f"Error(line={self.line!r}, column={self.column!r}, found={self.found!r}, expected={self.expected!r})"
 
 
-def execute_clang_format(executable: str, file: Path, config_file: str, fix: bool) -> str:
+TOOL_NAME = "clang_format"
+# Suffix of the recorded report entries of a file, which replaces the suffix of its proxy stamp.
+REPORT_RECORD_SUFFIX = ".report.json"
+# Default number of bytes of the files checked by one clang-format process, see create_chunks.
+DEFAULT_CHUNK_SIZE = 512 * 1024
+# Maximum number of files checked by one clang-format process, which limits the length of the command line.
+MAX_CHUNK_FILES = 256
+# Number of bytes read from clang-format at once while its output is parsed.
+READ_SIZE = 64 * 1024
+
+
+def load_style(config_file: str, config_cache_file: Optional[Path] = None) -> str:
     """
-    Execute clang-format with the given config on a given file.
-    :param executable: The clang-format executable.
-    :param file: File to run clang-format on.
-    :param config_file: Configuration file to run clang-format with.
-    :param fix: If true, formatting errors are fixed inline. If false, the errors are returned as XML output
-    :return: Command output. If fix is false, the XML output of clang-format is returned.
+    Load the style passed to clang-format.
+    :param config_file: Configuration file to run clang-format with or 'file' to search the parent directories.
+    :param config_cache_file: File to store the compiled configuration in, see cmake_clang_tools_helpers.load_config_string.
+    :return: The style as JSON string or 'file'.
     """
-
     # Check for special case to search file.
-    if config_file != CONFIG_FILE_SEARCH:
-        config = json.dumps(cmake_clang_tools_helpers.load_yaml(Path(config_file)))
-    else:
-        config = CONFIG_FILE_SEARCH
+    if config_file == CONFIG_FILE_SEARCH:
+        return CONFIG_FILE_SEARCH
+    return cmake_clang_tools_helpers.load_config_string(Path(config_file), config_cache_file)
 
-    # Run the clang-format executable with the given config.
-    command = [executable, f"--style={config}"]
 
-    # Either fix the errors directly or report them as XML output.
-    if fix:
-        command.append("-i")
-    else:
-        command.append("--output-replacements-xml")
+def execute_clang_format(executable: str, file: Path, style: str, lines: Optional[List[Tuple[int, int]]] = None) \
+        -> Iterator[Replacement]:
+    """
+    Execute clang-format with the given style on a given file.
+    The output is parsed while it is read, such that it is never held in memory as a whole.
+    :param executable: The clang-format executable.
+    :param file: File to run clang-format on.
+    :param style: Style to run clang-format with, see load_style.
+    :param lines: Line ranges (first and last line, starting at 1) to format. The whole file is formatted if None.
+    :return: Iterator over the replacements of clang-format, in the order of the output.
+    """
 
-    # Run on a single file.
+    # Run the clang-format executable with the given style on a single file.
+    command = [executable, f"--style={style}", "--output-replacements-xml"]
+    command += [f"--lines={first_line}:{last_line}" for first_line, last_line in lines or list()]
     command.append(str(file.resolve()))
 
-    return subprocess.check_output(command)
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        yield from iterate_replacements(iter(lambda: process.stdout.read(READ_SIZE), b""))
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
 
 
 def parse_replacements_from_xml(xml: str) -> List[Replacement]:
@@ -77,102 +124,540 @@ def parse_replacements_from_xml(xml: str) -> List[Replacement]:
     :param xml: XML output of clang-format.
     :return: List of replacements.
     """
+    return list(iterate_replacements([xml]))
 
-    replacements = list()
-    if xml:
-        replacement_xml = ElementTree.XML(xml)
-        for replacement_item in replacement_xml.findall('replacement'):
-            replacement = Replacement(offset=int(replacement_item.attrib["offset"]), length=int(replacement_item.attrib["length"]),
-                                      text=replacement_item.text)
-            replacements.append(replacement)
 
-    return replacements
+def iterate_replacements(data_parts: Iterable[bytes]) -> Iterator[Replacement]:
+    """
+    Parse the XML output of clang-format for a single file while it is read.
+    :param data_parts: Consecutive parts of the output.
+    :return: Iterator over the replacements, in the order of the output.
+    """
+    parser = ReplacementPullParser()
+    for data in data_parts:
+        yield from parser.feed(data)
+    yield from parser.close()
+
+
+class ReplacementPullParser:
+    """
+    Incremental parser of a single '<replacements>' document of clang-format. The parsed replacements are removed from the
+    element tree, such that its memory does not grow with the number of replacements.
+    """
 
+    def __init__(self):
+        self._parser = None
+        self._root = None
+
+    @property
+    def started(self) -> bool:
+        """
+        :return: True if the document has content.
+        """
+        return self._parser is not None
+
+    def feed(self, data: bytes) -> List[Replacement]:
+        """
+        Parse the next part of the document.
+        :param data: Part of the document.
+        :return: The replacements completed by the data.
+        """
+        if self._parser is None:
+            # The XML declaration of a document has to be its first content.
+            data = data.lstrip()
+            if not data:
+                return list()
+            # The XML parser is only imported if clang-format runs, results replayed from the cache do not need it.
+            import xml.etree.ElementTree as ElementTree
+            self._parser = ElementTree.XMLPullParser(events=("start", "end"))
+        self._parser.feed(data)
+        return self._read_events()
+
+    def close(self) -> List[Replacement]:
+        """
+        Finish the document. Empty documents, e.g. the output of a failed clang-format, have no replacements.
+        :return: The replacements completed at the end of the document.
+        """
+        if self._parser is None:
+            return list()
+        self._parser.close()
+        return self._read_events()
+
+    def _read_events(self) -> List[Replacement]:
+        replacements = list()
+        for event, element in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = element
+            elif element.tag == "replacement":
+                replacements.append(Replacement(offset=int(element.attrib["offset"]), length=int(element.attrib["length"]),
+                                                text=element.text))
+                self._root.remove(element)
+        return replacements
+
+
+class ReplacementStreamParser:
+    """
+    Incremental parser of the XML output of clang-format for multiple files, which is one '<replacements>' document per file.
+    The documents are separated at their end tags, which can not occur in the escaped replacement texts, and every document is
+    parsed with its own ReplacementPullParser while the output is read.
+    """
+    END_TAG = b"</replacements>"
+
+    def __init__(self):
+        self._parser = ReplacementPullParser()
+        self._pending = bytes()
+        # Number of completed documents, which is the index of the current document.
+        self.documents = 0
+
+    def feed(self, data: bytes) -> List[Tuple[int, Replacement]]:
+        """
+        Parse the next part of the output.
+        :param data: Output of clang-format.
+        :return: The replacements completed by the data, together with the index of their document, in the order of the output.
+        """
+        replacements = list()
+        data = self._pending + data
+        end = data.find(self.END_TAG)
+        while end >= 0:
+            end += len(self.END_TAG)
+            replacements += [(self.documents, replacement) for replacement in self._parser.feed(data[:end]) + self._parser.close()]
+            self.documents += 1
+            self._parser = ReplacementPullParser()
+            data = data[end:]
+            end = data.find(self.END_TAG)
+
+        # Keep the bytes that could be the beginning of an end tag for the next part.
+        split = max(0, len(data) - len(self.END_TAG) + 1)
+        replacements += [(self.documents, replacement) for replacement in self._parser.feed(data[:split])]
+        self._pending = data[split:]
+        return replacements
+
+    def close(self) -> None:
+        """
+        Check that the output ended with a complete document.
+        """
+        if self._parser.started or self._pending.strip():
+            raise ValueError("clang-format output ended within a document.")
+
+
+def execute_clang_format_files(executable: str, files: List[Path], style: str) -> Iterator[Tuple[int, Replacement]]:
+    """
+    Execute clang-format with the given style on multiple files in a single process.
+    The output is parsed while clang-format runs and split into the replacements of the files, such that it is never held in
+    memory as a whole.
+    :param executable: The clang-format executable.
+    :param files: Files to run clang-format on.
+    :param style: Style to run clang-format with, see load_style.
+    :return: Iterator over the replacements together with the index of their file, in the order of the output.
+    """
+    command = [executable, f"--style={style}", "--output-replacements-xml", *(str(file.resolve()) for file in files)]
+    parser = ReplacementStreamParser()
+    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+        for data in iter(lambda: process.stdout.read(READ_SIZE), b""):
+            yield from parser.feed(data)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    try:
+        parser.close()
+    except ValueError as parse_error:
+        sys.exit(f"Output of '{executable}' can not be parsed: {parse_error}")
+    if parser.documents != len(files):
+        sys.exit(f"'{executable}' returned the replacements of {parser.documents} instead of {len(files)} files.")
+
+
+def create_chunks(files: List[Path], chunk_size: int, jobs: int = 1) -> List[List[Path]]:
+    """
+    Group consecutive files into chunks, which are checked by a single clang-format process.
+    :param files: The files in the order they are checked.
+    :param chunk_size: Maximum number of bytes of the files of a chunk, larger files form a chunk of their own.
+    :param jobs: Number of processes running at the same time. The chunks are made smaller, such that all of them are busy.
+    :return: List of chunks, in the order of the files.
+    """
+    sizes = list()
+    for file in files:
+        try:
+            sizes.append(os.stat(file).st_size)
+        except OSError:
+            sizes.append(0)
+    chunk_size = max(1, min(chunk_size, -(-sum(sizes) // max(1, jobs))))
+
+    chunks = list()
+    chunk = list()
+    bytes_in_chunk = 0
+    for file, size in zip(files, sizes):
+        if chunk and (bytes_in_chunk + size > chunk_size or len(chunk) >= MAX_CHUNK_FILES):
+            chunks.append(chunk)
+            chunk = list()
+            bytes_in_chunk = 0
+        chunk.append(file)
+        bytes_in_chunk += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class ErrorConverter:
+    """
+    Converts the replacements of a file into errors one at a time, such that they can be converted while clang-format runs.
+    clang-format orders the replacements by offset, the line of a replacement is found by counting the line breaks since the
+    previous one.
+    """
 
-def convert_replacements_to_errors(file: Path, replacements: List[Replacement]) -> List[Error]:
+    def __init__(self, file_content: bytes):
+        """
+        :param file_content: Content of the file the replacements were created for.
+        """
+        self._file_content = file_content
+        self._line = 0
+        self._line_offset = 0
+        self._offset = 0
+
+    def convert(self, replacement: Replacement) -> Error:
+        """
+        :param replacement: Replacement of clang-format.
+        :return: The error corresponding to the replacement.
+        """
+        # The offsets of clang-format are byte offsets, work on the raw content.
+        file_content = self._file_content
+        if replacement.offset < self._offset:
+            self._line = self._line_offset = self._offset = 0
+        line_breaks = file_content.count(b"\n", self._offset, replacement.offset)
+        if line_breaks:
+            self._line += line_breaks
+            self._line_offset = file_content.rfind(b"\n", self._offset, replacement.offset) + 1
+        self._offset = replacement.offset
+
+        # Report the column in characters, which differs from the byte offset for non-ASCII content.
+        column = len(file_content[self._line_offset:replacement.offset].decode("utf-8", errors="replace"))
+        found = file_content[replacement.offset:replacement.offset + replacement.length].decode("utf-8", errors="replace")
+        return Error(line=self._line, column=column, found=found, expected=replacement.text if replacement.text else str())
+
+
+def convert_replacements_to_errors(file: Path, replacements: List[Replacement], file_content: Optional[bytes] = None) -> List[Error]:
     """
     Create a list of errors from the replacements of a file.
     The error format is then used for printing compiler warnings/errors.
     :param file: File for which replacements are suggested.
     :param replacements: Replacements from clang-format to convert.
+    :param file_content: Content of the file. The file is read if the content is not given.
     :return: List of errors corresponding to the replacements.
     """
-    errors = list()
-
-    # Content of the file as a string.
-    file_content = ""
-    # Keep track of the offset in the file content.
-    line_offset_indices = [0]
-
-    # Loop through the lines of the file and gather contents and offsets.
-    for line in open(file, "r"):
-        file_content += line
-        line_offset_indices.append(line_offset_indices[-1] + len(line))
+    if not replacements:
+        return list()
+    converter = ErrorConverter(file.read_bytes() if file_content is None else file_content)
+    return [converter.convert(replacement) for replacement in replacements]
 
-    for line_number, line_offset in enumerate(line_offset_indices[:-1]):
-        while len(replacements) > 0 and line_offset_indices[line_number + 1] > replacements[0].offset:
-            replacement = replacements.pop(0)
-            error = Error(line=line_number, column=replacement.offset - line_offset,
-                          found=file_content[replacement.offset: replacement.offset + replacement.length],
-                          expected=replacement.text if replacement.text else str())
-            errors.append(error)
 
-        if len(replacements) == 0:
-            break
-
-    return errors
+def apply_replacements(file_content: bytes, replacements: List[Replacement]) -> bytes:
+    """
+    Apply the replacements of clang-format to the content of a file.
+    :param file_content: Content of the file.
+    :param replacements: Replacements from clang-format, their offsets are byte offsets in the content.
+    :return: The formatted content.
+    """
+    parts = list()
+    position = 0
+    for replacement in sorted(replacements, key=lambda replacement: replacement.offset):
+        parts.append(file_content[position:replacement.offset])
+        parts.append((replacement.text or str()).encode("utf-8"))
+        position = replacement.offset + replacement.length
+    parts.append(file_content[position:])
+    return b"".join(parts)
 
 
-def clang_format_check(executable: str, files: List[Path], config_file: str, fix: bool) -> Tuple[int, Dict[Path, List[Error]]]:
+def fix_file(file: Path, file_content: bytes, replacements: List[Replacement]) -> None:
+    """
+    Fix the formatting of a file by applying the replacements of clang-format.
+    The file is only written if the content changes, such that formatted files keep their modification time.
+    :param file: File to fix.
+    :param file_content: Content of the file the replacements were created for.
+    :param replacements: Replacements from clang-format.
+    """
+    fixed_content = apply_replacements(file_content, replacements)
+    if fixed_content == file_content:
+        return
+    path = file.resolve()
+    try:
+        write_atomic(path, fixed_content, path.stat().st_mode & 0o7777)
+    except (OSError, IOError) as file_error:
+        sys.exit(f"File '{file}' could not be written: {file_error}")
+
+
+@lru_cache(maxsize=None)
+def read_style_config(directory: Path, config_file: str) -> bytes:
+    """
+    Read the raw style configuration that clang-format applies to the files of a directory.
+    :param directory: Directory of the formatted file.
+    :param config_file: Configuration file to run clang-format with or 'file' to search the parent directories.
+    :return: Content of the configuration file, empty if no configuration file is found.
+    """
+    try:
+        if config_file != CONFIG_FILE_SEARCH:
+            return Path(config_file).read_bytes()
+        for parent in [directory, *directory.parents]:
+            for style_file_name in STYLE_FILE_NAMES:
+                style_file = parent / style_file_name
+                if style_file.is_file():
+                    return style_file.read_bytes()
+    except (OSError, IOError) as file_error:
+        sys.exit(f"Config file '{config_file}' can not be read: {file_error}")
+    return bytes()
+
+
+def iterate_clang_format(executable: str, files: List[Path], config_file: str, fix: bool, jobs: int = 1,
+                         cache: Optional[ResultCache] = None,
+                         daemon: Optional[FormatDaemonClient] = None,
+                         config_cache_file: Optional[Path] = None,
+                         timings: Optional[Dict[Path, float]] = None,
+                         changed_lines: Optional[Dict[str, Optional[List[Tuple[int, int]]]]] = None,
+                         chunk_size: int = 0,
+                         start_order: Optional[List[Path]] = None,
+                         token_pool: Optional[TokenPool] = None) -> Iterator[Tuple[Path, List[Error]]]:
     """
-    Run the clang-format check.
+    Run the clang-format check and yield the errors of every file in the order of the files, as soon as the file is checked.
     :param executable: The clang-format executable.
     :param files: List of files to run clang-format on.
     :param config_file: Configuration file to run clang-format with.
-    :param fix: If true, formatting errors are fixed inline. If false, the errors are returned as XML output
+    :param fix: If true, formatting errors are fixed inline and not reported. If false, the errors are returned.
+    :param jobs: Maximum number of clang-format processes running at the same time.
+    :param cache: Result cache to replay the replacements of unchanged files from. Caching is disabled if None. Fixes are not
+                  replayed from the results of the shared store.
+    :param daemon: Client of the clang-format daemon to run clang-format with.
+    :param config_cache_file: File to store the compiled configuration in, see cmake_clang_tools_helpers.load_config_string.
+    :param timings: Dictionary the durations of the clang-format executions are stored in per file. Replayed results are not timed.
+    :param changed_lines: Dictionary mapping absolute file paths to the line ranges to check, see cmake_clang_tools_git. Files
+                          with None ranges or without entry are checked entirely.
+    :param chunk_size: Maximum number of bytes of the files checked by one clang-format process, see create_chunks. Every file
+                       is checked by its own process if 0 and with the daemon. Files with changed lines are always checked
+                       separately, since clang-format only accepts line ranges for a single file.
+    :param start_order: The files in the order they are started when running in parallel, e.g. longest first. Defaults to the
+                        order of the files. The results are still yielded in the order of the files.
+    :param token_pool: Pool of job tokens every parallel unit takes a token from, such that a jobserver of the caller limits the
+                       clang-format processes of all its children.
+    :return: Iterator over tuples of a file and the list of errors of that file, in the order of the files.
+    """
+    tool_version = cache.tool_version(executable) if cache else None
+    with cmake_clang_tools_profile.span("load config"):
+        style = load_style(config_file, config_cache_file) if files else None
+
+    def cache_key(file: Path, file_content: bytes, lines: Optional[List[Tuple[int, int]]]) -> str:
+        return hash_parts("clang-format", tool_version, read_style_config(file.resolve().parent, config_file), file_content,
+                          json.dumps(lines) if lines else None)
+
+    def lookup_replacements(file: Path, file_content: bytes, lines: Optional[List[Tuple[int, int]]], key: Optional[str] = None) \
+            -> Tuple[Optional[str], Optional[List[Replacement]]]:
+        if not cache:
+            return None, None
+        with cmake_clang_tools_profile.span("cache lookup"):
+            key = key or cache_key(file, file_content, lines)
+            # The results of the shared store are not verified, fixes are only replayed from the results of this machine.
+            cached_replacements = cache.get(key, local_only=fix)
+        if cached_replacements is None:
+            cmake_clang_tools_profile.count("cache misses")
+            return key, None
+        cmake_clang_tools_profile.count("cache hits")
+        return key, [Replacement(*replacement) for replacement in cached_replacements]
+
+    def finish_file(file: Path, file_content: bytes, replacements: List[Replacement]) -> List[Error]:
+        # Fixed formatting issues are not reported.
+        if fix:
+            if replacements:
+                with cmake_clang_tools_profile.span("fix"):
+                    fix_file(file, file_content, replacements)
+            return list()
+        with cmake_clang_tools_profile.span("convert errors"):
+            return convert_replacements_to_errors(file, replacements, file_content)
+
+    def check_file_content(file: Path) -> List[Error]:
+        file_content = file.read_bytes()
+        lines = changed_lines.get(os.path.abspath(file)) if changed_lines else None
+        key, replacements = lookup_replacements(file, file_content, lines)
+        if replacements is not None:
+            return finish_file(file, file_content, replacements)
+
+        # The replacements are converted into errors while the output is parsed, they are only kept for the cache and fixing.
+        converter = None if fix else ErrorConverter(file_content)
+        replacements = list() if fix or key else None
+        errors = list()
+        start_time = time.monotonic()
+        with cmake_clang_tools_profile.span("clang-format"):
+            xml_output = None
+            # The warm processes of the daemon check whole files.
+            if daemon and not lines:
+                xml_output = daemon.format(executable, file, config_file, file_content)
+            # Fall back to running clang-format directly, if the daemon is not available.
+            if xml_output is None:
+                parsed_replacements = execute_clang_format(executable, file, style, lines)
+            else:
+                parsed_replacements = iterate_replacements([xml_output])
+            for replacement in parsed_replacements:
+                if replacements is not None:
+                    replacements.append(replacement)
+                if converter:
+                    errors.append(converter.convert(replacement))
+        if timings is not None:
+            timings[file] = time.monotonic() - start_time
+        if key:
+            cache.put(key, [list(replacement) for replacement in replacements])
+
+        return finish_file(file, file_content, replacements) if fix else errors
+
+    def check_file(file: Path) -> List[Error]:
+        with cmake_clang_tools_profile.span("file", FILE_CATEGORY, file=os.path.abspath(file)):
+            return check_file_content(file)
+
+    def check_chunk(chunk: List[Path]) -> List[List[Error]]:
+        file_contents = [file.read_bytes() for file in chunk]
+        keys = [None] * len(chunk)
+        replacements = [None] * len(chunk)
+        # The results of the chunk are fetched from the shared store with a single request.
+        if cache and cache.shared_store and not fix:
+            keys = [cache_key(file, file_content, None) for file, file_content in zip(chunk, file_contents)]
+            with cmake_clang_tools_profile.span("shared cache lookup"):
+                cache.prefetch(keys)
+        for index, file in enumerate(chunk):
+            keys[index], replacements[index] = lookup_replacements(file, file_contents[index], None, keys[index])
+
+        # The files missing in the cache are checked by a single process, its duration is attributed to them by size.
+        missing = [index for index, file_replacements in enumerate(replacements) if file_replacements is None]
+        errors = [None] * len(chunk)
+        if missing:
+            # The replacements are converted into errors while the output is parsed, they are only kept for the cache and fixing.
+            converters = dict() if fix else {index: ErrorConverter(file_contents[index]) for index in missing}
+            for index in missing:
+                replacements[index] = list() if fix or keys[index] else None
+                errors[index] = list()
+            start_time = time.monotonic()
+            with cmake_clang_tools_profile.span("clang-format", files=len(missing)):
+                for position, replacement in execute_clang_format_files(executable, [chunk[index] for index in missing], style):
+                    index = missing[position]
+                    if replacements[index] is not None:
+                        replacements[index].append(replacement)
+                    if converters:
+                        errors[index].append(converters[index].convert(replacement))
+            if timings is not None:
+                duration = time.monotonic() - start_time
+                chunk_bytes = sum(len(file_contents[index]) for index in missing)
+                for index in missing:
+                    timings[chunk[index]] = duration * (len(file_contents[index]) / chunk_bytes if chunk_bytes else 1 / len(missing))
+            for index in missing:
+                if keys[index]:
+                    cache.put(keys[index], [list(replacement) for replacement in replacements[index]])
+
+        for index, (file, file_content) in enumerate(zip(chunk, file_contents)):
+            if fix or errors[index] is None:
+                with cmake_clang_tools_profile.span("file", FILE_CATEGORY, file=os.path.abspath(file)):
+                    errors[index] = finish_file(file, file_content, replacements[index])
+        return errors
+
+    # The order of starting the files only matters if they run in parallel.
+    ordered_files = start_order if start_order is not None and jobs > 1 else files
+    if chunk_size > 0 and not daemon:
+        # Files with changed lines are checked on their own, the files between them are checked in chunks.
+        units = list()
+        batch = list()
+        for file in ordered_files:
+            if changed_lines and changed_lines.get(os.path.abspath(file)):
+                units += create_chunks(batch, chunk_size, jobs) + [[file]]
+                batch = list()
+            else:
+                batch.append(file)
+        units += create_chunks(batch, chunk_size, jobs)
+    else:
+        units = [[file] for file in ordered_files]
+
+    def check_unit(unit: List[Path]) -> List[List[Error]]:
+        return [check_file(unit[0])] if len(unit) == 1 else check_chunk(unit)
+
+    def check_unit_with_token(unit: List[Path]) -> List[List[Error]]:
+        token = token_pool.acquire()
+        try:
+            return check_unit(unit)
+        finally:
+            token_pool.release(token)
+
+    if jobs > 1 and len(units) > 1:
+        # The worker threads only wait for the clang-format processes, parsing of finished files overlaps with running ones.
+        # The units are started in the start order, but the results are consumed in the order of the input files, such that the
+        # report is identical to the serial run. Results finished out of order wait in their futures.
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(check_unit_with_token if token_pool else check_unit, unit) for unit in units]
+            unit_positions = {file: (index, position) for index, unit in enumerate(units) for position, file in enumerate(unit)}
+            for file in files:
+                index, position = unit_positions[file]
+                yield file, futures[index].result()[position]
+    else:
+        for unit in units:
+            yield from zip(unit, check_unit(unit))
+
+
+def clang_format_check(executable: str, files: List[Path], config_file: str, fix: bool, jobs: int = 1,
+                       cache: Optional[ResultCache] = None,
+                       daemon: Optional[FormatDaemonClient] = None,
+                       config_cache_file: Optional[Path] = None,
+                       chunk_size: int = 0) -> Tuple[int, Dict[Path, List[Error]]]:
+    """
+    Run the clang-format check and collect the errors of all files, see iterate_clang_format for the parameters.
     :return: Tuple of the number of detected errors and a dictionary mapping filename to the list of errors of that file.
     """
     error_count = 0
     file_errors = dict()
-
-    for file in files:
-        xml_output = execute_clang_format(executable, file, config_file, fix)
-        replacements = parse_replacements_from_xml(xml_output)
-        errors = convert_replacements_to_errors(file, replacements)
+    for file, errors in iterate_clang_format(executable, files, config_file, fix, jobs, cache, daemon, config_cache_file,
+                                             chunk_size=chunk_size):
         error_count += len(errors)
         file_errors[file] = errors
-
     return error_count, file_errors
 
 
-def print_error_report(file_errors: Dict[Path, List[Error]], warnings_as_errors: bool, verbose: bool) -> None:
+def print_errors(file: Path, errors: List[Error], warnings_as_errors: bool, verbose: bool,
+                 report: Optional[DiagnosticReport] = None) -> List[dict]:
     """
-    Print the errors in the form of compiler warnings/errors.
-    :param file_errors: Dictionary mapping a filename to the list of errors of that file.
+    Print the errors of a file in the form of compiler warnings/errors.
+    :param file: File of the errors.
+    :param errors: List of errors of the file.
     :param warnings_as_errors: Treat warnings as errors. If True, prints compiler errors instead of compiler warnings (equivalent to gcc's -Werrror flag).
     :param verbose: If True, print to stderr instead of stdout.
+    :param report: Machine readable report the errors are added to as well.
+    :return: The records of the errors added to the report.
     """
     # Select stream base on verbosity.
     stream = sys.stderr if verbose else sys.stdout
     severity = '\033[91merror:' if warnings_as_errors else '\033[35mwarning:'
+    records = list()
 
     # Loop through errors and pretty print them.
+    for error in errors:
+        file_path = os.path.abspath(file)
+        line = error.line + 1
+        column = error.column + 1
+        found = "\\n".join(error.found.split("\n"))
+        expected = "\\n".join(error.expected.split("\n"))
+        character_diff = abs(len(error.found) - len(error.expected))
+        message = f"Found: \'{found}\', Expected: \'{expected}\', CharacterDiff: \'{character_diff}\'"
+        text = f"\033[1m\033[97m{file_path}:{line}:{column}: {severity}\033[97m clang-format\033[0m  {message}"
+        print(text, file=stream)
+        if report:
+            records.append(report.add(file, line, column, "error" if warnings_as_errors else "warning", message))
+    stream.flush()
+    return records
+
+
+def print_error_report(file_errors: Dict[Path, List[Error]], warnings_as_errors: bool, verbose: bool) -> None:
+    """
+    Print the errors in the form of compiler warnings/errors.
+    :param file_errors: Dictionary mapping a filename to the list of errors of that file.
+    :param warnings_as_errors: Treat warnings as errors. If True, prints compiler errors instead of compiler warnings (equivalent to gcc's -Werrror flag).
+    :param verbose: If True, print to stderr instead of stdout.
+    """
     for file, errors in file_errors.items():
-        for error in errors:
-            file_path = os.path.abspath(file)
-            line = error.line + 1
-            column = error.column + 1
-            found = "\\n".join(error.found.split("\n"))
-            expected = "\\n".join(error.expected.split("\n"))
-            character_diff = abs(len(error.found) - len(error.expected))
-            text = f"\033[1m\033[97m{file_path}:{line}:{column}: {severity}\033[97m clang-format\033[0m  " \
-                   f"Found: \'{found}\', Expected: \'{expected}\', CharacterDiff: \'{character_diff}\'"
-            print(text, file=stream)
+        print_errors(file, errors, warnings_as_errors, verbose)
 
 
-def parse_arguments() -> argparse.Namespace:
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
     """
     Parses the command line arguments.
+    :param arguments: Arguments to parse, e.g. of a workspace job file. Defaults to the command line.
     :return: Namespace object that contains the parsed arguments.
     """
 
@@ -182,31 +667,174 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--config-file", default="file",
                         help=f"The clang-format configuration file. Use '{CONFIG_FILE_SEARCH}' to load style configuration  .clang-format "
                              "file located in one of the parent directories of the source file (or current directory for stdin).")
+    parser.add_argument("--config-cache-file", default=None, type=Path,
+                        help="File to store the parsed configuration in, such that later runs do not parse the configuration file.")
     parser.add_argument("--trigger-file", default=None, help="The trigger file defines if clang-format should run."
                                                              "If no trigger file is provided, clang-format will be executed.")
     parser.add_argument("--error", action="store_true", help="All warnings are treated as errors.")
     parser.add_argument("--fix", action="store_true", help="Fix the formatting issues.")
     parser.add_argument("--verbose", action="store_true", help="Output is printed to stderr instead of stdout.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Number of clang-format processes to run in parallel. If a parent provides a jobserver, e.g. make or "
+                             "the workspace runner, its tokens limit the processes as well.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, type=Path, help="Directory of the persistent result cache.")
+    parser.add_argument("--cache-max-size", default=DEFAULT_MAX_SIZE_MB, type=float,
+                        help="Maximum size of the result cache in megabytes. Least recently used results are evicted.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the result cache.")
+    parser.add_argument("--shared-cache", default=None,
+                        help="Directory or http(s):// URL of a result store shared with other machines, which is used for the "
+                             "results missing in the local cache. Defaults to the environment variable "
+                             f"{SHARED_STORE_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--cache-base-dir", default=os.environ.get(BASE_DIR_ENVIRONMENT_VARIABLE),
+                        help="Paths in this directory, e.g. the workspace, are cached relative to it, such that checkouts in "
+                             f"different directories share the results. Defaults to the environment variable "
+                             f"{BASE_DIR_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--timing-database", default=DEFAULT_TIMING_DATABASE, type=Path,
+                        help="Database of the durations of previous runs, used to start the longest files first.")
+    parser.add_argument("--no-timings", action="store_true", help="Do not record the durations and keep the order of the files.")
+    parser.add_argument("--stamp-dir", default=None, type=Path,
+                        help="Batch mode: Directory of the per-file proxy stamps. Only files that changed since their stamp was "
+                             "written are processed and the stamps are written for all successfully processed files.")
+    parser.add_argument("--project-name", default="", help="CMake project name used for the proxy stamp names.")
+    parser.add_argument("--chunk-size", default=DEFAULT_CHUNK_SIZE, type=int,
+                        help="Maximum number of bytes of the files checked by one clang-format process. Use 0 to run one process per "
+                             "file. Not used with '--daemon'.")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Check the files with a background daemon, which keeps clang-format processes ready between runs.")
+    parser.add_argument("--daemon-socket", default=DEFAULT_SOCKET_PATH, type=Path, help="Unix socket of the clang-format daemon.")
+    parser.add_argument("--daemon-idle-timeout", default=DEFAULT_IDLE_TIMEOUT_S, type=float,
+                        help="Time in seconds without requests after which a daemon started by this run shuts down.")
+    parser.add_argument("--report-file", default=None, type=Path,
+                        help="Machine readable report the errors of all files are written to while clang-format runs. The errors "
+                             "of the files that are not checked again are added from their last check. Requires '--stamp-dir'.")
+    parser.add_argument("--report-format", default=None, choices=REPORT_FORMATS,
+                        help="Format of the report file. Defaults to 'sarif' for '.sarif' files and 'jsonl' otherwise.")
+    parser.add_argument("--profile", default=None,
+                        help="Write the timings of the phases and files as Chrome trace to this file or directory, together with a "
+                             f"summary. Defaults to the environment variable {cmake_clang_tools_profile.PROFILE_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--changed-since", default=None,
+                        help="Only check the lines changed against this git reference, including uncommitted changes. A reference "
+                             "ending with '...' is compared at its merge base with HEAD, e.g. 'origin/master...'.")
     parser.add_argument("paths", nargs="+", help="File paths for which clang-format should be executed."
                                                  "Globbing is used on the file paths.")
 
-    return parser.parse_args()
+    return parser.parse_args(arguments)
+
+
+def get_report_record_path(stamp_dir: Path, project_name: str, file: Path) -> Path:
+    """
+    Get the path of the recorded report entries of a file, see cmake_clang_tools_report.write_records.
+    :param stamp_dir: Directory of the proxy stamps, the record is stored next to the proxy stamp of the file.
+    :param project_name: CMake project name.
+    :param file: Source file.
+    :return: Path of the record.
+    """
+    return cmake_clang_tools_helpers.proxy_stamp_path(stamp_dir, project_name, file, TOOL_NAME).with_suffix(REPORT_RECORD_SUFFIX)
 
 
 def main():
-    args = parse_arguments()
+    profiler = cmake_clang_tools_profile.start_profiling(cmake_clang_tools_profile.get_profile_path(), "clang-format")
+    with cmake_clang_tools_profile.span("parse arguments"):
+        args = parse_arguments()
+        all_files = cmake_clang_tools_helpers.glob_paths(args.paths)
+    project_files = all_files
+
+    # The report covers all files, which are only passed to the single command of the batch mode.
+    if args.report_file and not args.stamp_dir:
+        sys.exit(f"[clang-format] The report '{args.report_file}' requires the batch mode ('--stamp-dir').")
+    # The errors of the files that are not checked again are added to the report from the records of their last check.
+    record_reports = args.report_file is not None and not args.changed_since
 
     # Only run clang-format if no trigger file is given or the trigger file contains the trigger content.
     if args.trigger_file and not cmake_clang_tools_helpers.check_trigger(args.trigger_file):
+        if args.stamp_dir:
+            cmake_clang_tools_helpers.touch_stamps(all_files, args.stamp_dir, args.project_name, TOOL_NAME)
         print("[clang-format] Skipping, trigger file not set.")
         sys.exit(0)
 
-    # Run clang-format and collect errors.
-    all_files = cmake_clang_tools_helpers.glob_paths(args.paths)
-    error_count, file_errors = clang_format_check(args.clang_format, all_files, args.config_file, args.fix)
-
-    # Print errors in compiler warning format.
-    print_error_report(file_errors, args.error, args.verbose)
+    # In batch mode, only run on the files that changed since their last successful run.
+    if args.stamp_dir:
+        dependencies = [Path(path) for path in [args.config_file, args.trigger_file] if path and path != CONFIG_FILE_SEARCH]
+        with cmake_clang_tools_profile.span("stale check"):
+            stale_files = set(cmake_clang_tools_helpers.get_stale_files(all_files, args.stamp_dir, args.project_name, TOOL_NAME,
+                                                                        dependencies))
+            # Files without a record, e.g. checked before the report was enabled, are checked again to complete the report.
+            all_files = [file for file in all_files if file in stale_files or
+                         (record_reports and not get_report_record_path(args.stamp_dir, args.project_name, file).exists())]
+
+    # Only check the lines changed against the git reference.
+    changed_lines = None
+    if args.changed_since:
+        with cmake_clang_tools_profile.span("git diff"):
+            changed_lines = cmake_clang_tools_git.get_changed_lines(all_files, args.changed_since)
+        all_files = cmake_clang_tools_git.filter_changed_files(all_files, changed_lines)
+
+    # Start the files that took the longest in previous runs first, such that they do not set the wall clock time.
+    # The errors are still reported in the order of the files.
+    timing_database = None if args.no_timings or not all_files else TimingDatabase.open(args.timing_database)
+    timing_config = hash_parts("clang-format", load_style(args.config_file, args.config_cache_file)) if timing_database else None
+    predictions = dict()
+    start_order = None
+    if timing_database:
+        with cmake_clang_tools_profile.span("timing database"):
+            start_order, predictions = timing_database.order_longest_first(TOOL_NAME, all_files, timing_config)
+
+    # Run clang-format and print the errors of every file in compiler warning format as soon as it is checked.
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_max_size, open_shared_store(args.shared_cache), args.cache_base_dir)
+    daemon = FormatDaemonClient(args.daemon_socket, args.daemon_idle_timeout) if args.daemon and all_files else None
+    report = None
+    if args.report_file:
+        report = DiagnosticReport(args.report_file, get_report_format(args.report_file, args.report_format), "clang-format")
+    # The clang-format processes take their tokens from the jobserver of a parent, e.g. the workspace runner.
+    token_pool = TokenPool(args.jobs)
+    error_count = 0
+    processed_files = list()
+    timings = dict()
+    start_time = time.monotonic()
+    try:
+        for file, errors in iterate_clang_format(args.clang_format, all_files, args.config_file, args.fix, max(1, args.jobs), cache,
+                                                 daemon, args.config_cache_file, timings, changed_lines, args.chunk_size,
+                                                 start_order, token_pool):
+            with cmake_clang_tools_profile.span("report"):
+                records = print_errors(file, errors, args.error, args.verbose, report)
+                if record_reports:
+                    write_records(get_report_record_path(args.stamp_dir, args.project_name, file), records)
+            error_count += len(errors)
+            # Files with errors are processed again in the next run, if warnings are treated as errors.
+            if not (args.error and errors):
+                processed_files.append(file)
+        if record_reports:
+            with cmake_clang_tools_profile.span("report"):
+                checked_files = set(all_files)
+                for file in project_files:
+                    if file not in checked_files:
+                        for record in read_records(get_report_record_path(args.stamp_dir, args.project_name, file)) or list():
+                            report.add_record(record)
+    finally:
+        token_pool.close()
+        # Complete the report with the errors found so far, even if clang-format failed.
+        if report:
+            report.close()
+    if cache and cache.stores:
+        with cmake_clang_tools_profile.span("cache trim"):
+            cache.trim()
+    if cache:
+        print_shared_store_summary("clang-format", cache.shared_store, sys.stderr if args.verbose else sys.stdout)
+
+    if timing_database:
+        with timing_database, cmake_clang_tools_profile.span("timing database"):
+            for file, seconds in timings.items():
+                timing_database.record(TOOL_NAME, file, timing_config, seconds)
+        # The build logs only show the timing when profiling.
+        if profiler:
+            print_timing_summary("clang-format", predictions, timings, time.monotonic() - start_time,
+                                 sys.stderr if args.verbose else sys.stdout)
+
+    # The stamps mark entirely checked files.
+    if args.stamp_dir and not args.changed_since:
+        cmake_clang_tools_helpers.touch_stamps(processed_files, args.stamp_dir, args.project_name, TOOL_NAME)
 
     # If warnings should be treated as an error, return the error count.
     if args.error:
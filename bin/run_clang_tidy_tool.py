@@ -1,70 +1,368 @@
 #!/usr/bin/env python3
 
+# Skip before loading the dependencies, if the trigger file is not set. CMake runs the script for every source file.
+if __name__ == "__main__":
+    import cmake_clang_tools_trigger
+    cmake_clang_tools_trigger.exit_if_not_triggered("clang-tidy")
+
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
 import json
 import os
 from pathlib import Path
+import re
 import subprocess
 import sys
-from typing import List
+import tempfile
+import time
+from typing import Dict, List, Optional, Set
 
+from cmake_clang_tools_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE_MB, ResultCache, executable_signature, hash_parts, write_atomic
+import cmake_clang_tools_git
 import cmake_clang_tools_helpers
-
-
-def execute_clang_tidy(executable, files, config, build_directory, header_filter, error, fix, verbose, checks):
+import cmake_clang_tools_profile
+from cmake_clang_tools_profile import FILE_CATEGORY
+from cmake_clang_tools_compile_database import CompileDatabase
+from cmake_clang_tools_diagnostics import DiagnosticCollector
+from cmake_clang_tools_jobserver import TokenPool
+from cmake_clang_tools_manifest import DependencyManifest
+from cmake_clang_tools_slim_database import PCH_DIR, PrecompiledHeaders, get_pch_compiler, write_slim_compile_database
+from cmake_clang_tools_shared_store import BASE_DIR_ENVIRONMENT_VARIABLE, SHARED_STORE_ENVIRONMENT_VARIABLE, open_shared_store, \
+    print_shared_store_summary
+from cmake_clang_tools_timing import DEFAULT_TIMING_DATABASE, TimingDatabase, print_timing_summary
+
+TOOL_NAME = "clang_tidy"
+FIXES_FILE = "clang-tidy-fixes.yaml"
+FIXES_SHARD_DIR = "clang-tidy-fixes"
+# Output of the last run of every translation unit, from which the summary of all translation units is created.
+DIAGNOSTICS_SHARD_DIR = "clang-tidy-diagnostics"
+# Header filter that does not match any header.
+NO_HEADER_FILTER = "^$"
+
+
+def build_clang_tidy_command(executable, files, config, build_directory, header_filter, error, fix, checks, export_fixes=None,
+                             line_filter=None, compile_database_directory=None):
     """
-    Run clang-tidy.
-    :param executable: The clang-format executable.
+    Build the clang-tidy command.
+    :param executable: The clang-tidy executable.
     :param files: The files to run clang-tidy on.
     :param config: The clan-tidy configuration string.
     :param build_directory: The build directory where the compile commands are located and the output is stored.
     :param header_filter: Header filter to exclude/include header files.
     :param error: Treat warnings as errors.
     :param fix: Fix the issue detected by clang-tidy.
-    :param verbose: If True, print to stderr instead of stdout.
     :param checks: Additional checks to include or exclude.
-    :return: Result code of the clang-tidy execution.
+    :param export_fixes: File to export the fixes to. Defaults to 'clang-tidy-fixes.yaml' in the build directory.
+    :param line_filter: JSON list of files and line ranges to report the diagnostics of, see cmake_clang_tools_git.create_line_filter.
+    :param compile_database_directory: Directory of the compile database to use instead of the one in the build directory, e.g. the
+                                       slim compile database.
+    :return: The clang-tidy command as list of arguments.
     """
-    # Create base command.
-    command = f"{executable} --config={config} -p={build_directory} --header-filter=\"{header_filter}\" " \
-              f"--export-fixes={build_directory}/clang-tidy-fixes.yaml --extra-arg=-w"
+    if export_fixes is None:
+        export_fixes = f"{build_directory}/{FIXES_FILE}"
+
+    # Create base command. Without a config, clang-tidy discovers the .clang-tidy file.
+    command = [executable]
+    if config:
+        command.append(f"--config={config}")
+    command += [f"-p={compile_database_directory or build_directory}", f"--header-filter={header_filter}",
+                f"--export-fixes={export_fixes}", "--extra-arg=-w"]
 
     # Add optional arguments.
     if error:
-        command += " --warnings-as-errors='*'"
+        command.append("--warnings-as-errors=*")
     if fix:
-        command += " --fix"
+        command.append("--fix")
     if checks:
-        command += f" --checks='{checks}'"
+        command.append(f"--checks={checks}")
+    if line_filter:
+        command.append(f"--line-filter={line_filter}")
 
     # Run for all files.
+    command += [os.path.abspath(file) for file in files]
+
+    return command
+
+
+def get_fixes_shard_path(build_directory: str, file: Path, shard_dir: str = FIXES_SHARD_DIR) -> Path:
+    """
+    Get the path of the exported fixes of a single translation unit.
+    :param build_directory: The build directory where the fixes are stored.
+    :param file: The translation unit.
+    :param shard_dir: Directory of the shards in the build directory, e.g. DIAGNOSTICS_SHARD_DIR for the recorded output.
+    :return: Path of the fixes shard.
+    """
+    source = os.path.abspath(file)
+    return Path(build_directory or ".") / shard_dir / f"{hash_parts(source)[:16]}-{os.path.basename(source)}.json"
+
+
+def load_recorded_diagnostics(build_directory: str, files: List[Path]) -> DiagnosticCollector:
+    """
+    Collect the diagnostics recorded by the last runs of the translation units, see execute_clang_tidy_shards.
+    :param build_directory: The build directory where the output is recorded.
+    :param files: The translation units, the ones without a recorded output are skipped.
+    :return: Collector with the diagnostics of all translation units.
+    """
+    collector = DiagnosticCollector()
     for file in files:
-        command += f" {os.path.abspath(file)}"
+        try:
+            collector.add_output(get_fixes_shard_path(build_directory, file, DIAGNOSTICS_SHARD_DIR).read_text())
+        except (OSError, IOError):
+            continue
+    return collector
 
+
+def load_fixes_shard(fixes_file: Path) -> Optional[dict]:
+    """
+    Load the fixes exported by clang-tidy.
+    :param fixes_file: YAML file written by clang-tidy's '--export-fixes'.
+    :return: The exported fixes or None if clang-tidy did not export any fixes.
+    """
+    # PyYAML is only imported if clang-tidy runs, results replayed from the cache do not need it.
+    import yaml
+    try:
+        with open(fixes_file, 'r') as file:
+            return yaml.load(file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or None
+    except (OSError, IOError, yaml.YAMLError):
+        return None
+
+
+def merge_fixes(build_directory: str) -> None:
+    """
+    Merge the fixes of all translation units into a single 'clang-tidy-fixes.yaml' file in the build directory.
+    Diagnostics reported by multiple translation units (e.g. in headers) are only contained once.
+    Concurrent runs in the same build directory are serialized with a file lock.
+    :param build_directory: The build directory where the fixes are stored.
+    """
+    import yaml
+    shard_dir = Path(build_directory or ".") / FIXES_SHARD_DIR
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    with open(shard_dir / ".lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        diagnostics = list()
+        seen_diagnostics = set()
+        for shard in sorted(shard_dir.glob("*.json")):
+            try:
+                with open(shard, 'r') as file:
+                    fixes = json.load(file)
+            except (OSError, IOError, ValueError):
+                continue
+            # Drop fixes of deleted translation units.
+            main_source_file = fixes.get("MainSourceFile")
+            if main_source_file and not os.path.exists(main_source_file):
+                shard.unlink()
+                continue
+            for diagnostic in fixes.get("Diagnostics") or list():
+                identity = json.dumps(diagnostic, sort_keys=True)
+                if identity not in seen_diagnostics:
+                    seen_diagnostics.add(identity)
+                    diagnostics.append(diagnostic)
+
+        # Use the C implementation of the YAML emitter if available.
+        merged_fixes = yaml.dump({"MainSourceFile": "", "Diagnostics": diagnostics}, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+                                 explicit_start=True, explicit_end=True, default_flow_style=False, allow_unicode=True, sort_keys=False)
+        write_atomic(Path(build_directory or ".") / FIXES_FILE, merged_fixes.encode("utf-8"))
+
+
+def execute_clang_tidy_shards(executable, files, config, build_directory, header_filter, error, fix, verbose, checks, cache=None,
+                              jobs=1, header_filters=None, compile_database=None, timings=None, line_filter=None,
+                              compile_database_directory=None, collector=None, start_order=None, record_diagnostics=False,
+                              token_pool=None) -> List[int]:
+    """
+    Run clang-tidy with one process per translation unit.
+    The output of every translation unit is printed as a whole, in the order of the files, unless it is collected.
+    The fixes of every translation unit are exported separately and merged afterwards.
+    :param executable: The clang-tidy executable.
+    :param files: The files to run clang-tidy on.
+    :param config: The clan-tidy configuration string.
+    :param build_directory: The build directory where the compile commands are located and the output is stored.
+    :param header_filter: Header filter to exclude/include header files.
+    :param error: Treat warnings as errors.
+    :param fix: Fix the issue detected by clang-tidy.
+    :param verbose: If True, print to stderr instead of stdout.
+    :param checks: Additional checks to include or exclude.
+    :param cache: Result cache to replay the output of unchanged files from. Caching is disabled if None.
+    :param jobs: Maximum number of clang-tidy processes running at the same time.
+    :param header_filters: Dictionary mapping absolute file paths to a header filter overriding header_filter for that file.
+    :param compile_database: Compile database of the build directory, loaded if not given.
+    :param timings: Dictionary the durations of the clang-tidy executions are stored in per file. Replayed results are not timed.
+    :param line_filter: JSON list of files and line ranges to report the diagnostics of, see build_clang_tidy_command.
+    :param compile_database_directory: Directory of the compile database clang-tidy runs with, see build_clang_tidy_command.
+    :param collector: DiagnosticCollector the diagnostics are added to instead of printing them, only the other messages of
+                      clang-tidy are printed. The output of crashed runs is printed as it is.
+    :param start_order: The files in the order they are started when running in parallel, e.g. longest first. Defaults to the
+                        order of the files. The output is still printed in the order of the files.
+    :param record_diagnostics: Record the output of every translation unit in the build directory, see load_recorded_diagnostics.
+    :param token_pool: Pool of job tokens every parallel translation unit takes a token from, such that a jobserver of the caller
+                       limits the clang-tidy processes of all its children.
+    :return: List of the result codes of the clang-tidy executions, one per file.
+    """
     stream = sys.stderr if verbose else sys.stdout
-    # print(f"Run clang-tidy: {command}")
-    return subprocess.run(command, shell=True, stdout=stream, stderr=stream).returncode
+    # Fixes modify the files, such that the result can not be replayed.
+    if fix:
+        cache = None
+    if cache and compile_database is None:
+        compile_database = CompileDatabase.load(build_directory)
+    tool_version = cache.tool_version(executable) if cache else None
+    shard_dir = Path(build_directory or ".") / FIXES_SHARD_DIR
+    shard_dir.mkdir(parents=True, exist_ok=True)
+
+    def shard_key(file) -> Optional[str]:
+        # The key covers the contents of the file and all the headers it includes.
+        # Files whose dependencies can not be determined are not cached.
+        dependencies = compile_database.dependencies(file)
+        if dependencies is None:
+            return None
+        file_header_filter = (header_filters or dict()).get(os.path.abspath(file), header_filter)
+        return hash_parts("clang-tidy", tool_version, config, checks, cache.normalize(file_header_filter), str(error),
+                          cache.normalize(line_filter or ""), cache.normalize(compile_database_directory or ""),
+                          cache.normalize(json.dumps(compile_database.arguments(file))),
+                          *(hash_parts(cache.normalize(dependency), Path(dependency).read_bytes()) for dependency in dependencies))
+
+    # The results are fetched from the shared store with a single request.
+    keys = dict()
+    if cache and cache.shared_store:
+        with cmake_clang_tools_profile.span("shared cache lookup"):
+            keys = {file: shard_key(file) for file in files}
+            cache.prefetch([key for key in keys.values() if key])
+
+    def run_shard(file) -> dict:
+        with cmake_clang_tools_profile.span("file", FILE_CATEGORY, file=os.path.abspath(file)):
+            return run_shard_file(file)
+
+    def run_shard_with_token(file) -> dict:
+        token = token_pool.acquire()
+        try:
+            return run_shard(file)
+        finally:
+            token_pool.release(token)
+
+    def run_shard_file(file) -> dict:
+        file_header_filter = (header_filters or dict()).get(os.path.abspath(file), header_filter)
+
+        key = None
+        if cache:
+            with cmake_clang_tools_profile.span("cache lookup"):
+                key = keys[file] if file in keys else shard_key(file)
+                result = cache.get(key) if key else None
+            if result is not None:
+                cmake_clang_tools_profile.count("cache hits")
+                return result
+            cmake_clang_tools_profile.count("cache misses")
+
+        file_descriptor, export_fixes = tempfile.mkstemp(dir=str(shard_dir), prefix=".tmp-", suffix=".yaml")
+        os.close(file_descriptor)
+        try:
+            command = build_clang_tidy_command(executable, [file], config, build_directory, file_header_filter, error, fix, checks,
+                                               export_fixes, line_filter, compile_database_directory)
+            start_time = time.monotonic()
+            with cmake_clang_tools_profile.span("clang-tidy"):
+                process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            if timings is not None:
+                timings[file] = time.monotonic() - start_time
+            with cmake_clang_tools_profile.span("load fixes"):
+                result = {"returncode": process.returncode, "output": process.stdout.decode("utf-8", errors="replace"),
+                          "fixes": load_fixes_shard(Path(export_fixes))}
+        finally:
+            os.unlink(export_fixes)
+
+        # Only store regular results, not crashes or interruptions.
+        if key and process.returncode >= 0:
+            cache.put(key, result)
+        return result
+
+    def finish_shard(file, result: dict) -> int:
+        with cmake_clang_tools_profile.span("report"):
+            shard = get_fixes_shard_path(build_directory, file)
+            if result.get("fixes"):
+                write_atomic(shard, json.dumps(result["fixes"]).encode("utf-8"))
+            elif shard.exists():
+                shard.unlink()
+            if record_diagnostics:
+                diagnostics_shard = get_fixes_shard_path(build_directory, file, DIAGNOSTICS_SHARD_DIR)
+                # The output of crashes is incomplete, the translation unit has no diagnostics until it is checked again.
+                if result["returncode"] >= 0:
+                    diagnostics_shard.parent.mkdir(parents=True, exist_ok=True)
+                    write_atomic(diagnostics_shard, result["output"].encode("utf-8"))
+                elif diagnostics_shard.exists():
+                    diagnostics_shard.unlink()
+            if collector and result["returncode"] >= 0:
+                for message in collector.add_output(result["output"]):
+                    print(message, file=stream)
+            else:
+                stream.write(result["output"])
+            stream.flush()
+        return result["returncode"]
+
+    # Fixing in parallel could apply the same fix in a shared header multiple times.
+    if jobs > 1 and len(files) > 1 and not fix:
+        # Results finished out of the order of the files wait in their futures.
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {file: executor.submit(run_shard_with_token if token_pool else run_shard, file)
+                       for file in (files if start_order is None else start_order)}
+            results = [finish_shard(file, futures[file].result()) for file in files]
+    else:
+        results = [finish_shard(file, run_shard(file)) for file in files]
 
+    if files:
+        with cmake_clang_tools_profile.span("merge fixes"):
+            merge_fixes(build_directory)
+    return results
 
-def load_config(config_file: str) -> str:
+
+def execute_clang_tidy(executable, files, config, build_directory, header_filter, error, fix, verbose, checks, cache=None, jobs=1):
+    """
+    Run clang-tidy.
+    :param executable: The clang-format executable.
+    :param files: The files to run clang-tidy on.
+    :param config: The clan-tidy configuration string.
+    :param build_directory: The build directory where the compile commands are located and the output is stored.
+    :param header_filter: Header filter to exclude/include header files.
+    :param error: Treat warnings as errors.
+    :param fix: Fix the issue detected by clang-tidy.
+    :param verbose: If True, print to stderr instead of stdout.
+    :param checks: Additional checks to include or exclude.
+    :param cache: Result cache to replay the output of unchanged files from. Caching is disabled if None.
+    :param jobs: Maximum number of clang-tidy processes running at the same time.
+    :return: Result code of the clang-tidy execution.
+    """
+    results = execute_clang_tidy_shards(executable, files, config, build_directory, header_filter, error, fix, verbose, checks,
+                                        cache, jobs)
+    return next((result for result in results if result), 0)
+
+
+def load_config(config_file: str, config_cache_file: Optional[Path] = None) -> str:
     """
     Load the configuration and return it as a JSON string.
     :param config_file: Path of the config file.
+    :param config_cache_file: File to store the compiled configuration in, see cmake_clang_tools_helpers.load_config_string.
     :return: Parsed configuration file as string or empty string if config_file is empty.
     """
     # Discover .clang-tidy file if no config file is given.
     if not config_file:
         return str()
 
-    config = json.dumps(cmake_clang_tools_helpers.load_yaml(Path(config_file)))
-    # Replace double quotes with single quotes
-    idx = config.find("Checks") + 7
-    config = config[:idx - 1] + config[idx:].replace("\"", "\'", 2)
-    # Remove remaining double quotes
-    config = config.replace("\"", "")
-    config = json.dumps(config)
+    return cmake_clang_tools_helpers.load_config_string(Path(config_file), config_cache_file)
+
 
-    return config
+def create_incremental_key(tool_signature: str, file: Path, config: str, checks: str, header_filter: str, error: bool, fix: bool,
+                           compile_database: CompileDatabase) -> str:
+    """
+    Create the key of the clang-tidy command of a translation unit for the incremental mode.
+    :param tool_signature: Signature of the clang-tidy executable, see cmake_clang_tools_cache.executable_signature.
+    :param file: Source file of the translation unit.
+    :param config: The clang-tidy configuration string.
+    :param checks: Additional checks to include or exclude.
+    :param header_filter: Header filter of the translation unit.
+    :param error: Treat warnings as errors.
+    :param fix: Fix the issue detected by clang-tidy.
+    :param compile_database: Compile database containing the compile command of the translation unit.
+    :return: Hash over all inputs of the command, except the contents of the files.
+    """
+    return hash_parts("clang-tidy", tool_signature, config, checks, header_filter, str(error), str(fix),
+                      json.dumps(compile_database.arguments(file)))
 
 
 def create_header_filter(header_filter: str, header_dirs: List[str], exclude_header_dirs: List[str]) -> str:
@@ -109,11 +407,96 @@ def create_header_filter(header_filter: str, header_dirs: List[str], exclude_hea
     return overload_header_filter
 
 
+def get_owner_preference(header: str, translation_units: List[str]) -> List[str]:
+    """
+    Order the translation units by their preference to own a header: Sources named like the header first (e.g. 'a.cpp' for
+    'a.hpp'), then by the number of leading directories they share with the header.
+    The order is deterministic, such that separate runs for single translation units agree on the owners.
+    :param header: Absolute path of the header.
+    :param translation_units: Absolute paths of the translation units.
+    :return: The translation units, most preferred first.
+    """
+    header_path = Path(header)
+    header_directories = header_path.parent.parts
+
+    def preference_key(translation_unit: str):
+        translation_unit_path = Path(translation_unit)
+        shared_directories = 0
+        for header_directory, directory in zip(header_directories, translation_unit_path.parent.parts):
+            if header_directory != directory:
+                break
+            shared_directories += 1
+        return translation_unit_path.stem != header_path.stem, -shared_directories, translation_unit
+
+    return sorted(translation_units, key=preference_key)
 
 
-def parse_arguments() -> argparse.Namespace:
+def create_header_ownership_filters(files: List[Path], translation_units: List[Path], compile_database: CompileDatabase,
+                                    header_filter: str) -> Dict[str, str]:
+    """
+    Create a header filter per file, that only matches the headers owned by the file.
+    Every header matching the header filter is owned by the first translation unit including it, in the order of
+    get_owner_preference. The dependencies of the other translation units are only determined until the owners of the headers
+    of the files are found, which usually only needs the sources named like the headers.
+    Headers are identified by their real path and the filters match all of their spellings, such that the names clang-tidy
+    reports (relative include directories, '..' segments or symbolic links) are matched.
+    Files whose dependencies can not be determined or that own a header that does not exist keep the given header filter.
+    :param files: Files to create the header filters for.
+    :param translation_units: All translation units the headers are distributed to, including the files.
+    :param compile_database: Compile database used to determine the included headers.
+    :param header_filter: Header filter regular expression selecting the headers to check.
+    :return: Dictionary mapping the absolute file paths to their header filter.
+    """
+    header_regex = re.compile(header_filter)
+    sources = sorted({os.path.abspath(file) for file in [*translation_units, *files]})
+    included_headers = dict()
+    owners = dict()
+
+    def get_included_headers(source: str) -> Optional[Dict[str, Set[str]]]:
+        # Maps the real paths of the headers matching the header filter to their spellings.
+        if source not in included_headers:
+            headers = None
+            spellings = compile_database.dependency_spellings(Path(source))
+            if spellings is not None:
+                headers = dict()
+                real_source = os.path.realpath(source)
+                for spelling, dependency in zip(spellings, compile_database.dependencies(Path(source))):
+                    header = os.path.realpath(dependency)
+                    names = {spelling, dependency, header}
+                    if header != real_source and any(header_regex.search(name) for name in names):
+                        headers.setdefault(header, set()).update(names)
+            included_headers[source] = headers
+        return included_headers[source]
+
+    def get_owner(header: str, includer: str) -> str:
+        if header not in owners:
+            # Translation units whose dependencies can not be determined report all headers themselves and are skipped.
+            for source in get_owner_preference(header, sources):
+                if source == includer or header in (get_included_headers(source) or dict()):
+                    owners[header] = source
+                    break
+        return owners[header]
+
+    header_filters = dict()
+    for file in files:
+        source = os.path.abspath(file)
+        headers = get_included_headers(source)
+        owned_headers = [header for header in sorted(headers or dict()) if get_owner(header, source) == source]
+        if headers is None or not all(os.path.exists(header) for header in owned_headers):
+            header_filters[source] = header_filter
+        elif owned_headers:
+            names = [name for header in owned_headers for name in sorted(headers[header])]
+            header_filters[source] = "^(" + "|".join(re.escape(name) for name in names) + ")$"
+        else:
+            # Match no header at all.
+            header_filters[source] = NO_HEADER_FILTER
+    return header_filters
+
+
+def parse_arguments(arguments: Optional[List[str]] = None) -> argparse.Namespace:
     """
     Parses the command line arguments.
+    :param arguments: Arguments to parse, e.g. of a workspace job file. Defaults to the command line.
     :return: Namespace object that contains the parsed arguments.
     """
 
@@ -122,6 +505,8 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--clang-tidy", default="clang-tidy", help="The clang-tidy executable.")
     parser.add_argument("--config-file", help="The clang-tidy configuration file. When the value is empty, clang-tidy will attempt to find "
                                               "a file named .clang-tidy for each source file in its parent directories.")
+    parser.add_argument("--config-cache-file", default=None, type=Path,
+                        help="File to store the parsed configuration in, such that later runs do not parse the configuration file.")
     parser.add_argument("--trigger-file", default=None, help="The trigger file defines if clang-tidy should run."
                                                              "If no trigger file is provided, clang-tidy will be executed.")
     parser.add_argument("--build-directory", help="Directory where the 'compile_commands.json' file is located."
@@ -132,32 +517,249 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument("--header-filter", help="Header filter to overload specifications from the config file."
                                                 "Note: Has no effect if '--header-dirs' is set.")
     parser.add_argument("--checks", help="Comma-separated list of checks to add or remove.")
+    parser.add_argument("--header-ownership", action="store_true",
+                        help="Report the diagnostics of every header only for one of the translation units including it.")
+    parser.add_argument("--sources-file", default=None, type=Path,
+                        help="File listing all translation units of the project (one per line), the headers are distributed to. "
+                             "Defaults to the given file paths.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only run on the translation units whose compile command or included files changed since their last "
+                             "successful run. The translation units are recorded in 'clang-tidy-manifest.sqlite' in the build directory.")
     parser.add_argument("--error", action="store_true", help="All warnings are treated as errors.")
     parser.add_argument("--fix", action="store_true", help="Fix the issues discovered by clang-tidy (not recommended).")
     parser.add_argument("--verbose", action="store_true", help="Output is printed to stderr instead of stdout.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Number of clang-tidy processes to run in parallel. Fixing always runs sequentially. If a parent "
+                             "provides a jobserver, e.g. make or the workspace runner, its tokens limit the processes as well.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, type=Path, help="Directory of the persistent result cache.")
+    parser.add_argument("--cache-max-size", default=DEFAULT_MAX_SIZE_MB, type=float,
+                        help="Maximum size of the result cache in megabytes. Least recently used results are evicted.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the result cache.")
+    parser.add_argument("--shared-cache", default=None,
+                        help="Directory or http(s):// URL of a result store shared with other machines, which is used for the "
+                             "results missing in the local cache. Defaults to the environment variable "
+                             f"{SHARED_STORE_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--cache-base-dir", default=os.environ.get(BASE_DIR_ENVIRONMENT_VARIABLE),
+                        help="Paths in this directory, e.g. the workspace, are cached relative to it, such that checkouts in "
+                             f"different directories share the results. Defaults to the environment variable "
+                             f"{BASE_DIR_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--timing-database", default=DEFAULT_TIMING_DATABASE, type=Path,
+                        help="Database of the durations of previous runs, used to start the longest translation units first.")
+    parser.add_argument("--no-timings", action="store_true", help="Do not record the durations and keep the order of the files.")
+    parser.add_argument("--stamp-dir", default=None, type=Path,
+                        help="Batch mode: Directory of the per-file proxy stamps. Only files that changed since their stamp was "
+                             "written are processed and the stamps are written for all successfully processed files.")
+    parser.add_argument("--project-name", default="", help="CMake project name used for the proxy stamp names.")
+    parser.add_argument("--stamp-dependencies-file", default=None, type=Path,
+                        help="Batch mode: File listing additional dependencies (one per line) of all files, e.g. the headers.")
+    parser.add_argument("--profile", default=None,
+                        help="Write the timings of the phases and files as Chrome trace to this file or directory, together with a "
+                             f"summary. Defaults to the environment variable {cmake_clang_tools_profile.PROFILE_ENVIRONMENT_VARIABLE}.")
+    parser.add_argument("--changed-since", default=None,
+                        help="Only report the diagnostics in the lines changed against this git reference, including uncommitted "
+                             "changes, and only run on the changed translation units and the ones including changed headers. A "
+                             "reference ending with '...' is compared at its merge base with HEAD, e.g. 'origin/master...'.")
+    parser.add_argument("--slim-compile-commands", action="store_true",
+                        help="Run clang-tidy with a slim copy of the compile database, without the code generation arguments and "
+                             "with the include directories outside of the project directories as system include directories.")
+    parser.add_argument("--project-dirs", default="",
+                        help="Comma-separated list of the project directories for '--slim-compile-commands'. Defaults to the header "
+                             "directories and the common directory of the files.")
+    parser.add_argument("--pch-header", default=None, type=Path,
+                        help="Header including the third-party headers of the project, e.g. of Eigen or Boost. With "
+                             "'--slim-compile-commands', it is precompiled once per set of compile flags and included by all C++ "
+                             "translation units. Project headers must not be included.")
+    parser.add_argument("--pch-compiler", default=None,
+                        help="The clang executable building the precompiled header, it must have the version of clang-tidy. "
+                             "Defaults to the clang++ executable next to clang-tidy, e.g. 'clang++-14' for 'clang-tidy-14'.")
+    parser.add_argument("--summary-file", default=None, type=Path,
+                        help="JSON file the number of diagnostics per check and level of all files is written to, e.g. to compare "
+                             "runs in CI. Requires '--stamp-dir' or '--incremental'.")
     parser.add_argument("paths", nargs="+", help="File paths for which clang-format should be executed."
                                                  "Globbing is used on the file paths.")
 
-    return parser.parse_args()
+    return parser.parse_args(arguments)
+
+
+def filter_changed_translation_units(files: List[Path], changed_lines: Dict[str, Optional[list]],
+                                     compile_database: CompileDatabase) -> List[Path]:
+    """
+    Keep the translation units that changed or include a changed file.
+    :param files: The translation units.
+    :param changed_lines: Changed line ranges of the changed files, see cmake_clang_tools_git.get_changed_lines.
+    :param compile_database: Compile database used to determine the included files.
+    :return: The affected translation units in the given order.
+    """
+    changed_files = {file for file in changed_lines if changed_lines[file] != list()}
+    changed_translation_units = list()
+    for file in files:
+        if os.path.abspath(file) in changed_files:
+            changed_translation_units.append(file)
+            continue
+        dependencies = compile_database.dependencies(file)
+        if dependencies and not changed_files.isdisjoint(dependencies):
+            changed_translation_units.append(file)
+    return changed_translation_units
+
+
+def prepare_slim_compile_database(args: argparse.Namespace, compile_database: CompileDatabase, header_dirs: List[str],
+                                  files: List[Path]) -> str:
+    """
+    Write the slim compile database and build the precompiled header requested by the arguments.
+    :param args: Parsed arguments, see parse_arguments.
+    :param compile_database: Compile database of the build directory.
+    :param header_dirs: The header directories, which are project directories if '--project-dirs' is not given.
+    :param files: The translation units to check.
+    :return: Directory of the slim compile database.
+    """
+    project_dirs = cmake_clang_tools_helpers.string_to_list(args.project_dirs) or header_dirs + \
+        [os.path.commonpath([os.path.abspath(os.path.dirname(file)) for file in files])]
+    precompiled_headers = None
+    if args.pch_header:
+        if not args.pch_header.is_file():
+            sys.exit(f"Precompiled header '{args.pch_header}' does not exist.")
+        precompiled_headers = PrecompiledHeaders(args.pch_header, args.pch_compiler or get_pch_compiler(args.clang_tidy),
+                                                 Path(args.build_directory or ".") / PCH_DIR)
+    return str(write_slim_compile_database(compile_database, args.build_directory, project_dirs, precompiled_headers, files))
 
 
 def main():
-    args = parse_arguments()
+    profiler = cmake_clang_tools_profile.start_profiling(cmake_clang_tools_profile.get_profile_path(), "clang-tidy")
+    with cmake_clang_tools_profile.span("parse arguments"):
+        args = parse_arguments()
+    files = [Path(path) for path in args.paths]
+    all_files = files
+
+    # The summary covers all translation units, which are only passed to the single command of the batch and incremental mode.
+    if args.summary_file and not (args.stamp_dir or args.incremental):
+        sys.exit(f"[clang-tidy] The summary '{args.summary_file}' requires the batch ('--stamp-dir') or incremental mode.")
 
     # Only run clang-tidy if no trigger file is given or the trigger file contains the trigger content.
     if args.trigger_file and not cmake_clang_tools_helpers.check_trigger(args.trigger_file):
+        if args.stamp_dir:
+            cmake_clang_tools_helpers.touch_stamps(files, args.stamp_dir, args.project_name, TOOL_NAME)
         print("[clang-tidy] Skipping, trigger file not set.")
         sys.exit(0)
 
+    # In batch mode, only run on the files that changed since their last successful run.
+    if args.stamp_dir:
+        dependencies = [Path(path) for path in [args.config_file, args.trigger_file] if path]
+        if args.stamp_dependencies_file:
+            dependencies += [Path(path) for path in cmake_clang_tools_helpers.read_list_file(args.stamp_dependencies_file)]
+        with cmake_clang_tools_profile.span("stale check"):
+            files = cmake_clang_tools_helpers.get_stale_files(files, args.stamp_dir, args.project_name, TOOL_NAME, dependencies)
+
     # Construct the header filter.
     header_dirs = cmake_clang_tools_helpers.string_to_list(args.header_dirs)
     exclude_header_dirs = cmake_clang_tools_helpers.string_to_list(args.exclude_header_dirs)
     header_filter = create_header_filter(args.header_filter, header_dirs, exclude_header_dirs)
-    config = load_config(args.config_file)
+    with cmake_clang_tools_profile.span("load config"):
+        config = load_config(args.config_file, args.config_cache_file)
+
+    with cmake_clang_tools_profile.span("load compile database"):
+        compile_database = CompileDatabase.load(args.build_directory)
+
+    # Only run on the translation units affected by the changes against the git reference and report the changed lines.
+    line_filter = None
+    if args.changed_since:
+        with cmake_clang_tools_profile.span("git diff"):
+            changed_lines = cmake_clang_tools_git.get_changed_lines(files, args.changed_since)
+            files = filter_changed_translation_units(files, changed_lines, compile_database)
+        line_filter = cmake_clang_tools_git.create_line_filter(changed_lines)
+
+    # Distribute the headers to the translation units.
+    header_filters = None
+    if args.header_ownership and files:
+        translation_units = files
+        # The headers of a changed-since run are distributed to the affected translation units only, which are checked.
+        if args.sources_file and not args.changed_since:
+            translation_units = [Path(path) for path in cmake_clang_tools_helpers.read_list_file(args.sources_file)]
+        with cmake_clang_tools_profile.span("header ownership"):
+            header_filters = create_header_ownership_filters(files, translation_units, compile_database, header_filter)
+
+    # In incremental mode, only run on the translation units whose command or dependencies changed.
+    manifest = None
+    if args.incremental:
+        manifest = DependencyManifest.open(args.build_directory)
+        tool_signature = executable_signature(args.clang_tidy)[1]
+        keys = dict()
+        for file in files:
+            file_header_filter = (header_filters or dict()).get(os.path.abspath(file), header_filter)
+            keys[file] = create_incremental_key(tool_signature, file, config, args.checks, file_header_filter, args.error, args.fix,
+                                                compile_database)
+        with cmake_clang_tools_profile.span("incremental check"):
+            files = [file for file in files if not manifest.is_up_to_date(file, keys[file])]
+            # The dependencies are recorded as they were before clang-tidy runs, such that edits during the run are not missed.
+            if not line_filter:
+                for file in files:
+                    manifest.stat_dependencies(compile_database.dependencies(file) or [])
+
+    # Start the translation units that took the longest in previous runs first, such that they do not set the wall clock time.
+    timing_database = None if args.no_timings or not files else TimingDatabase.open(args.timing_database)
+    timing_config = hash_parts("clang-tidy", config, args.checks or "")
+    predictions = dict()
+    start_order = None
+    if timing_database:
+        with cmake_clang_tools_profile.span("timing database"):
+            start_order, predictions = timing_database.order_longest_first(TOOL_NAME, files, timing_config)
+
+    # Run clang-tidy with the slim compile commands, the fixes are still exported to the build directory.
+    compile_database_directory = None
+    if args.slim_compile_commands and files:
+        with cmake_clang_tools_profile.span("slim compile database"):
+            compile_database_directory = prepare_slim_compile_database(args, compile_database, header_dirs, files)
 
     # Execute clang-tidy.
-    result = execute_clang_tidy(args.clang_tidy, args.paths, config, args.build_directory, header_filter, args.error,
-                                args.fix, args.verbose, args.checks)
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, args.cache_max_size, open_shared_store(args.shared_cache), args.cache_base_dir)
+    collector = DiagnosticCollector()
+    timings = dict()
+    start_time = time.monotonic()
+    # The clang-tidy processes take their tokens from the jobserver of a parent, e.g. the workspace runner.
+    with TokenPool(args.jobs) as token_pool:
+        results = execute_clang_tidy_shards(args.clang_tidy, files, config, args.build_directory, header_filter, args.error, args.fix,
+                                            args.verbose, args.checks, cache, max(1, args.jobs), header_filters, compile_database,
+                                            timings, line_filter, compile_database_directory, collector, start_order,
+                                            args.summary_file is not None and not line_filter, token_pool)
+    result = next((file_result for file_result in results if file_result), 0)
+
+    # Print the diagnostics of all translation units at once, sorted and without the duplicates of shared headers.
+    with cmake_clang_tools_profile.span("report"):
+        collector.print_report("clang-tidy", sys.stderr if args.verbose else sys.stdout)
+        if args.summary_file:
+            # The translation units that were not checked again contribute the diagnostics of their last run.
+            summary_collector = collector if line_filter else load_recorded_diagnostics(args.build_directory, all_files)
+            summary_collector.write_summary(args.summary_file, "clang-tidy")
+
+    if timing_database:
+        with timing_database, cmake_clang_tools_profile.span("timing database"):
+            for file, seconds in timings.items():
+                timing_database.record(TOOL_NAME, file, timing_config, seconds)
+        # The build logs only show the timing when profiling.
+        if profiler:
+            print_timing_summary("clang-tidy", predictions, timings, time.monotonic() - start_time,
+                                 sys.stderr if args.verbose else sys.stdout)
+
+    # Record the successfully processed translation units with their current dependencies, if all their lines were checked.
+    if manifest and not line_filter:
+        with manifest:
+            for file, file_result in zip(files, results):
+                dependencies = compile_database.dependencies(file) if file_result == 0 else None
+                if dependencies:
+                    manifest.update(file, keys[file], dependencies)
+                else:
+                    manifest.remove(file)
+
+    # In batch mode, only write the stamps of the successfully processed files.
+    if args.stamp_dir and not line_filter:
+        processed_files = [file for file, file_result in zip(files, results) if file_result == 0]
+        cmake_clang_tools_helpers.touch_stamps(processed_files, args.stamp_dir, args.project_name, TOOL_NAME)
+    if cache and cache.stores:
+        with cmake_clang_tools_profile.span("cache trim"):
+            cache.trim()
+    if cache:
+        print_shared_store_summary("clang-tidy", cache.shared_store, sys.stderr if args.verbose else sys.stdout)
     sys.exit(result)
 
 
@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+
+import argparse
+import ctypes
+import os
+from pathlib import Path
+import select
+import struct
+import subprocess
+import sys
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+
+from cmake_clang_tools_cache import ResultCache
+from cmake_clang_tools_compile_database import COMPILE_COMMANDS_FILE, CompileDatabase
+from cmake_clang_tools_diagnostics import DiagnosticCollector
+import cmake_clang_tools_helpers
+from cmake_clang_tools_settings import SettingsIndex, compile_settings
+from cmake_clang_tools_shared_store import open_shared_store
+from cmake_clang_tools_slim_database import is_in_directories
+import run_clang_format_tool
+import run_clang_tidy_tool
+from run_clang_tools_workspace import DEFAULT_SETTINGS_FILE, TOOL_NAMES, WorkspaceJob, find_job_files, parse_job_file
+
+# Time in seconds without further changes after which the changed files are checked, such that a burst of saves, e.g. of a
+# refactoring touching multiple files, is checked once.
+DEFAULT_DEBOUNCE_S = 0.1
+# Interval in seconds in which the modification times are compared, if inotify is not available.
+POLL_INTERVAL_S = 0.5
+# Events of the inotify API (see inotify(7)): A file was written and closed or moved into the directory, e.g. by editors saving
+# to a temporary file first.
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+# Header of an inotify event: watch descriptor, mask, cookie and length of the name following the header.
+INOTIFY_EVENT = struct.Struct("iIII")
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    """
+    Watches files for changes with the inotify API of Linux. The directories of the files are watched, which also notices files
+    replaced by a rename.
+    """
+
+    def __init__(self, files: Iterable[str]):
+        """
+        :param files: Absolute paths of the watched files.
+        """
+        self.files = set(files)
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._file_descriptor = libc.inotify_init1(os.O_CLOEXEC)
+        if self._file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), "inotify is not available")
+        self._directories = dict()
+        for directory in sorted({os.path.dirname(file) for file in self.files}):
+            watch_descriptor = libc.inotify_add_watch(self._file_descriptor, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if watch_descriptor >= 0:
+                self._directories[watch_descriptor] = directory
+
+    def read(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Wait for changes of the watched files.
+        :param timeout: Maximum time to wait in seconds, waits until a file changes if None.
+        :return: The changed files, empty if the timeout expired or only other files of the directories changed.
+        """
+        readable, _, _ = select.select([self._file_descriptor], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self._file_descriptor, INOTIFY_READ_SIZE)
+        changed_files = set()
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            watch_descriptor, _, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            if watch_descriptor in self._directories:
+                file = os.path.join(self._directories[watch_descriptor], os.fsdecode(name))
+                if file in self.files:
+                    changed_files.add(file)
+        return changed_files
+
+    def close(self) -> None:
+        os.close(self._file_descriptor)
+
+
+class PollingWatcher:
+    """
+    Watches files for changes by comparing their modification times, if inotify is not available.
+    """
+
+    def __init__(self, files: Iterable[str], interval: float = POLL_INTERVAL_S):
+        """
+        :param files: Absolute paths of the watched files.
+        :param interval: Interval of the comparisons in seconds.
+        """
+        self.files = set(files)
+        self._interval = interval
+        self._modification_times = {file: self._get_modification_time(file) for file in self.files}
+
+    @staticmethod
+    def _get_modification_time(file: str) -> Optional[int]:
+        try:
+            return os.stat(file).st_mtime_ns
+        except OSError:
+            return None
+
+    def read(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Wait for changes of the watched files, see InotifyWatcher.read.
+        """
+        end_time = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed_files = set()
+            for file in self.files:
+                modification_time = self._get_modification_time(file)
+                if modification_time != self._modification_times[file]:
+                    self._modification_times[file] = modification_time
+                    changed_files.add(file)
+            if changed_files or (end_time is not None and time.monotonic() >= end_time):
+                return changed_files
+            time.sleep(self._interval if end_time is None else max(0.0, min(self._interval, end_time - time.monotonic())))
+
+    def close(self) -> None:
+        pass
+
+
+def create_watcher(files: Iterable[str]):
+    """
+    :param files: Absolute paths of the watched files.
+    :return: InotifyWatcher of the files, or a PollingWatcher if inotify is not available.
+    """
+    try:
+        return InotifyWatcher(files)
+    except (AttributeError, OSError):
+        return PollingWatcher(files)
+
+
+def get_file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    :param path: Path of a file.
+    :return: Modification time and size of the file or None if it does not exist.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FormatWatchJob:
+    """
+    clang-format job of a project in watch mode, which checks the changed sources with the arguments of the job file.
+    """
+
+    def __init__(self, job: WorkspaceJob):
+        """
+        :param job: The job of the project, see run_clang_tools_workspace.parse_job_file.
+        """
+        self.job = job
+        self.args = run_clang_format_tool.parse_arguments(job.arguments + [str(source) for source in job.sources])
+        self.files = {os.path.abspath(source) for source in job.sources}
+        self.cache = None
+        if not self.args.no_cache:
+            self.cache = ResultCache(self.args.cache_dir, self.args.cache_max_size, open_shared_store(self.args.shared_cache),
+                                     self.args.cache_base_dir)
+
+    def get_affected_files(self, changed_files: Set[str]) -> List[Path]:
+        """
+        :param changed_files: Absolute paths of the changed files.
+        :return: The sources of the job that changed.
+        """
+        return [Path(file) for file in sorted(changed_files & self.files)]
+
+    def check(self, files: List[Path]) -> bool:
+        """
+        Check the files and print the errors.
+        :param files: Sources of the job.
+        :return: False if errors were found and warnings are treated as errors.
+        """
+        args = self.args
+        # The style configuration may have been edited since the last check.
+        run_clang_format_tool.read_style_config.cache_clear()
+        processed_files = list()
+        error_count = 0
+        for file, errors in run_clang_format_tool.iterate_clang_format(args.clang_format, files, args.config_file, args.fix,
+                                                                       max(1, args.jobs), self.cache,
+                                                                       config_cache_file=args.config_cache_file,
+                                                                       chunk_size=args.chunk_size):
+            run_clang_format_tool.print_errors(file, errors, args.error, args.verbose)
+            error_count += len(errors)
+            if not (args.error and errors):
+                processed_files.append(file)
+        # The stamps are shared with the project targets, such that the next build of the project skips the sources.
+        cmake_clang_tools_helpers.touch_stamps(processed_files, self.job.stamp_dir, self.job.project, self.job.tool)
+        return not (args.error and error_count)
+
+    def close(self) -> None:
+        if self.cache and self.cache.stores:
+            self.cache.trim()
+
+
+class TidyWatchJob:
+    """
+    clang-tidy job of a project in watch mode, which checks the changed translation units and the ones including a changed
+    file with the arguments of the job file. The configuration and the compile database stay loaded until they change.
+    """
+
+    def __init__(self, job: WorkspaceJob):
+        """
+        :param job: The job of the project, see run_clang_tools_workspace.parse_job_file.
+        """
+        self.job = job
+        args = self.args = run_clang_tidy_tool.parse_arguments(job.arguments + [str(source) for source in job.sources])
+        self.sources = [Path(os.path.abspath(source)) for source in job.sources]
+        self.header_dirs = cmake_clang_tools_helpers.string_to_list(args.header_dirs or "")
+        self.header_filter = run_clang_tidy_tool.create_header_filter(
+            args.header_filter, self.header_dirs, cmake_clang_tools_helpers.string_to_list(args.exclude_header_dirs or ""))
+        self.cache = None
+        if not args.no_cache:
+            self.cache = ResultCache(args.cache_dir, args.cache_max_size, open_shared_store(args.shared_cache), args.cache_base_dir)
+        self.config = None
+        self.compile_database = None
+        self.compile_database_directory = None
+        self._config_stamp = None
+        self._compile_database_stamp = None
+        self._includers = dict()
+        self.load()
+        # The headers of the project are watched, the ones of other projects and the system are not.
+        project_dirs = [os.path.abspath(directory) for directory in self.header_dirs] + \
+            [os.path.commonpath([os.path.dirname(source) for source in self.sources])]
+        self.files = {str(source) for source in self.sources} | {os.path.abspath(dependency) for dependency in job.dependencies} | \
+            {dependency for dependency in self._includers if is_in_directories(dependency, project_dirs)}
+
+    def load(self) -> None:
+        """
+        Load the configuration and the compile database, if they changed since they were loaded.
+        The files included by the translation units are determined with the compile database.
+        """
+        args = self.args
+        config_stamp = get_file_stamp(Path(args.config_file)) if args.config_file else None
+        if self.config is None or config_stamp != self._config_stamp:
+            self.config = run_clang_tidy_tool.load_config(args.config_file, args.config_cache_file)
+            self._config_stamp = config_stamp
+
+        compile_database_stamp = get_file_stamp(Path(args.build_directory or ".") / COMPILE_COMMANDS_FILE)
+        if self.compile_database is None or compile_database_stamp != self._compile_database_stamp:
+            self.compile_database = CompileDatabase.load(args.build_directory)
+            self._compile_database_stamp = compile_database_stamp
+            if args.slim_compile_commands:
+                self.compile_database_directory = run_clang_tidy_tool.prepare_slim_compile_database(
+                    args, self.compile_database, self.header_dirs, self.sources)
+            self._includers = dict()
+            for source in self.sources:
+                self._add_includer(source)
+
+    def _add_includer(self, source: Path) -> None:
+        for dependency in self.compile_database.dependencies(source) or list():
+            self._includers.setdefault(dependency, set()).add(str(source))
+
+    def get_affected_files(self, changed_files: Set[str]) -> List[Path]:
+        """
+        :param changed_files: Absolute paths of the changed files.
+        :return: The changed translation units of the job and the ones including a changed file.
+        """
+        affected_files = set()
+        for file in changed_files:
+            affected_files.update(self._includers.get(file, set()))
+        affected_files.update(changed_files.intersection(str(source) for source in self.sources))
+        return [Path(file) for file in sorted(affected_files)]
+
+    def check(self, files: List[Path]) -> bool:
+        """
+        Check the translation units and print the diagnostics.
+        :param files: Translation units of the job.
+        :return: True if clang-tidy succeeded for all of them.
+        """
+        args = self.args
+        self.load()
+        # The includes of the translation units may have changed, their cache keys need the current ones.
+        for file in files:
+            self.compile_database.invalidate(file)
+        collector = DiagnosticCollector()
+        results = run_clang_tidy_tool.execute_clang_tidy_shards(args.clang_tidy, files, self.config, args.build_directory,
+                                                                self.header_filter, args.error, args.fix, args.verbose, args.checks,
+                                                                self.cache, max(1, args.jobs), compile_database=self.compile_database,
+                                                                compile_database_directory=self.compile_database_directory,
+                                                                collector=collector)
+        collector.print_report("clang-tidy", sys.stderr if args.verbose else sys.stdout)
+
+        for file in files:
+            for includers in self._includers.values():
+                includers.discard(str(file))
+            self._add_includer(file)
+        processed_files = [file for file, result in zip(files, results) if result == 0]
+        cmake_clang_tools_helpers.touch_stamps(processed_files, self.job.stamp_dir, self.job.project, self.job.tool)
+        return len(processed_files) == len(files)
+
+    def close(self) -> None:
+        if self.cache and self.cache.stores:
+            self.cache.trim()
+
+
+def create_watch_jobs(jobs: List[WorkspaceJob], settings: dict, tools: List[str], projects: List[str]) -> list:
+    """
+    Create the watch jobs of the projects.
+    :param jobs: Jobs of all projects, see run_clang_tools_workspace.parse_job_file.
+    :param settings: The cmake_clang_tools settings with the white- and blacklist.
+    :param tools: Tools to run.
+    :param projects: Names of the projects to watch, all projects if empty.
+    :return: List of FormatWatchJob and TidyWatchJob.
+    """
+    settings_index = SettingsIndex(compile_settings(settings))
+    watch_jobs = list()
+    for job in jobs:
+        if job.tool not in tools or not job.sources or (projects and job.project not in projects) or \
+                not settings_index.should_run(job.project, job.tool):
+            continue
+        watch_jobs.append(FormatWatchJob(job) if job.tool == "clang_format" else TidyWatchJob(job))
+    return watch_jobs
+
+
+def check_changed_files(watch_jobs: list, changed_files: Set[str]) -> int:
+    """
+    Check the files affected by changes with all jobs.
+    :param watch_jobs: The jobs, see create_watch_jobs.
+    :param changed_files: Absolute paths of the changed files.
+    :return: Number of checked files.
+    """
+    checked_count = 0
+    for watch_job in watch_jobs:
+        files = watch_job.get_affected_files(changed_files)
+        if not files:
+            continue
+        checked_count += len(files)
+        try:
+            if not watch_job.check(files):
+                print(f"[cmake_clang_tools] {watch_job.job.tool} failed for project {watch_job.job.project}.", file=sys.stderr)
+        # Failures of a check, e.g. a broken configuration, are reported and the files are checked again on their next change.
+        except subprocess.CalledProcessError as process_error:
+            print(f"[cmake_clang_tools] {watch_job.job.tool} failed: {process_error}", file=sys.stderr)
+        except SystemExit as exit_error:
+            print(f"[cmake_clang_tools] {watch_job.job.tool} failed: {exit_error.code}", file=sys.stderr)
+    return checked_count
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :return: Namespace object that contains the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Watch the sources of the projects of a workspace and check them with clang-format "
+                                                 "and clang-tidy whenever they are saved.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--settings-file", default=DEFAULT_SETTINGS_FILE, type=Path,
+                        help="Path of the cmake_clang_tools settings file with the white- and blacklist.")
+    parser.add_argument("--tools", default=",".join(TOOL_NAMES), help="Comma-separated list of the tools to run.")
+    parser.add_argument("--projects", default="", help="Comma-separated list of the projects to watch. Defaults to all projects.")
+    parser.add_argument("--debounce", default=DEFAULT_DEBOUNCE_S, type=float,
+                        help="Time in seconds without further changes after which the changed files are checked.")
+    parser.add_argument("build_directories", nargs="+", type=Path,
+                        help="Build directories searched for the projects using cmake_clang_tools, e.g. the build space of a catkin "
+                             "workspace.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    tools = cmake_clang_tools_helpers.string_to_list(args.tools)
+    for tool in tools:
+        if tool not in TOOL_NAMES:
+            sys.exit(f"Unknown tool '{tool}', choose from {', '.join(TOOL_NAMES)}.")
+    settings = cmake_clang_tools_helpers.load_yaml(args.settings_file) if args.settings_file.exists() else None
+
+    jobs = [parse_job_file(job_file) for job_file in find_job_files(args.build_directories)]
+    watch_jobs = create_watch_jobs(jobs, settings or dict(), tools, cmake_clang_tools_helpers.string_to_list(args.projects))
+    if not watch_jobs:
+        sys.exit("[cmake_clang_tools] No projects to watch, build them with the cmake_clang_tools macros first.")
+    watcher = create_watcher(set().union(*(watch_job.files for watch_job in watch_jobs)))
+    print(f"[cmake_clang_tools] Watching {len(watcher.files)} files of {len({job.job.project for job in watch_jobs})} projects "
+          f"({type(watcher).__name__}), stop with Ctrl+C.", flush=True)
+
+    try:
+        while True:
+            changed_files = watcher.read(None)
+            if not changed_files:
+                continue
+            # Wait for the end of a burst of saves.
+            while True:
+                more_changed_files = watcher.read(args.debounce)
+                if not more_changed_files:
+                    break
+                changed_files |= more_changed_files
+            start_time = time.monotonic()
+            checked_count = check_changed_files(watch_jobs, changed_files)
+            print(f"[cmake_clang_tools] Checked {checked_count} files for {len(changed_files)} changed files in "
+                  f"{time.monotonic() - start_time:.2f} s.", flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        for watch_job in watch_jobs:
+            watch_job.close()
+
+
+if __name__ == "__main__":
+    main()
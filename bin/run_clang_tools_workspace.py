@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import glob
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import cmake_clang_tools_helpers
+from cmake_clang_tools_jobserver import TokenPool
+from cmake_clang_tools_settings import SettingsIndex, compile_settings
+from cmake_clang_tools_timing import DEFAULT_TIMING_DATABASE, TimingDatabase, print_timing_summary
+
+# Job files written by the add_clang_format and add_clang_tidy macros into their binary directories.
+JOB_FILE_PATTERN = "**/clang_*/*-workspace-job.txt"
+DEFAULT_SETTINGS_FILE = Path.home() / ".config" / "cmake_clang_tools" / "config.yaml"
+TOOL_NAMES = ["clang_format", "clang_tidy"]
+
+WorkspaceJob = namedtuple("WorkspaceJob", ["project", "tool", "script", "stamp_dir", "arguments", "dependencies", "sources"])
+WorkItem = namedtuple("WorkItem", ["job", "sources", "size", "prediction"])
+
+
+def parse_job_file(path: Path) -> WorkspaceJob:
+    """
+    Parse a job file written by the CMake macros.
+    The file contains one 'key=value' entry per line, the keys 'argument', 'dependency' and 'source' can be repeated.
+    :param path: Path of the job file.
+    :return: The job of a project and tool.
+    """
+    values = {"argument": list(), "dependency": list(), "source": list()}
+    for line in cmake_clang_tools_helpers.read_list_file(path):
+        key, separator, value = line.partition("=")
+        if not separator:
+            sys.exit(f"Job file '{path}' contains an invalid line: {line}")
+        if key in values and isinstance(values[key], list):
+            values[key].append(value)
+        else:
+            values[key] = value
+    try:
+        return WorkspaceJob(values["project"], values["tool"], values["script"], Path(values["stamp_dir"]), values["argument"],
+                            [Path(dependency) for dependency in values["dependency"]], [Path(source) for source in values["source"]])
+    except KeyError as key_error:
+        sys.exit(f"Job file '{path}' misses the entry {key_error}.")
+
+
+def find_job_files(build_directories: List[Path]) -> List[Path]:
+    """
+    Find the job files of all projects in the build directories.
+    :param build_directories: Build directories to search, e.g. the build space of a catkin workspace.
+    :return: Sorted list of job files.
+    """
+    job_files = set()
+    for build_directory in build_directories:
+        for job_file in glob.iglob(str(build_directory / JOB_FILE_PATTERN), recursive=True):
+            job_files.add(Path(job_file))
+    return sorted(job_files)
+
+
+def collect_work_items(jobs: List[WorkspaceJob], settings: dict, tools: List[str], force: bool,
+                       timing_database: Optional[TimingDatabase] = None) -> List[WorkItem]:
+    """
+    Collect the jobs that need to be processed with their stale sources, longest first.
+    :param jobs: Jobs of all projects.
+    :param settings: The cmake_clang_tools settings with the white- and blacklist.
+    :param tools: Tools to run.
+    :param force: Process all sources, even if their proxy stamps are up to date.
+    :param timing_database: Durations of the previous runs to predict the duration of the sources.
+    :return: Work items ordered by decreasing predicted duration. Jobs without timing of any stale source come first, ordered by
+             the size of their stale sources.
+    """
+    settings_index = SettingsIndex(compile_settings(settings))
+    work_items = list()
+    for job in jobs:
+        if job.tool not in tools or not settings_index.should_run(job.project, job.tool):
+            continue
+        sources = job.sources
+        # The incremental mode of clang-tidy tracks the includes itself, the proxy stamps do not cover them.
+        if not force and not is_incremental(job):
+            sources = cmake_clang_tools_helpers.get_stale_files(sources, job.stamp_dir, job.project, job.tool, job.dependencies)
+        if not sources:
+            continue
+        size = 0
+        for source in sources:
+            try:
+                size += os.stat(source).st_size
+            except OSError:
+                pass
+        predictions = [timing_database.predict(job.tool, source) for source in sources] if timing_database else list()
+        predictions = [prediction for prediction in predictions if prediction is not None]
+        work_items.append(WorkItem(job, sources, size, sum(predictions) if predictions else None))
+    # Start the longest jobs first, such that no long running job is left at the end.
+    work_items.sort(key=lambda work_item: (True, work_item.size) if work_item.prediction is None else (False, work_item.prediction),
+                    reverse=True)
+    return work_items
+
+
+def is_incremental(job: WorkspaceJob) -> bool:
+    """
+    :param job: The job of a project and tool.
+    :return: True if the job runs clang-tidy in incremental mode, which does not use the proxy stamps.
+    """
+    return "--incremental" in job.arguments
+
+
+def build_command(work_item: WorkItem, jobs: int, timing_arguments: List[str]) -> List[str]:
+    """
+    Build the command running the tool script for all sources of the project, like the batch target of the project.
+    :param work_item: The work item.
+    :param jobs: Maximum number of tool processes of the script, the jobserver of the runner limits the total.
+    :param timing_arguments: Arguments of the script selecting the timing database.
+    :return: The command.
+    """
+    job = work_item.job
+    stamp_arguments = list() if is_incremental(job) else [f"--stamp-dir={job.stamp_dir}", f"--project-name={job.project}"]
+    return [sys.executable, job.script, *job.arguments, *stamp_arguments, f"--jobs={jobs}", *timing_arguments,
+            *map(str, job.sources)]
+
+
+def run_work_item(work_item: WorkItem, token_pool: TokenPool, timing_arguments: List[str]) -> Tuple[WorkItem, int, str, float]:
+    """
+    Run the tool script of a work item, once a token of the pool is available.
+    The script checks the stale sources and writes their proxy stamps itself, its processes take further tokens of the pool.
+    :param work_item: The work item.
+    :param token_pool: Pool of job tokens limiting the concurrency.
+    :param timing_arguments: Arguments of the script selecting the timing database.
+    :return: Tuple of the work item, the return code, the output of the script and its duration in seconds.
+    """
+    job = work_item.job
+    # The stamps of the sources that are stale due to the dependencies of the job or forced are not checked by the script.
+    if not is_incremental(job):
+        cmake_clang_tools_helpers.remove_stamps(work_item.sources, job.stamp_dir, job.project, job.tool)
+    command = build_command(work_item, token_pool.jobs, timing_arguments)
+    token = token_pool.acquire()
+    try:
+        start_time = time.monotonic()
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                                env=token_pool.environment(), pass_fds=token_pool.pass_fds())
+        duration = time.monotonic() - start_time
+    finally:
+        token_pool.release(token)
+    return work_item, result.returncode, result.stdout, duration
+
+
+def parse_arguments() -> argparse.Namespace:
+    """
+    Parses the command line arguments.
+    :return: Namespace object that contains the parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Run clang-format and clang-tidy for all projects of a workspace in one job queue.",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--settings-file", default=DEFAULT_SETTINGS_FILE, type=Path,
+                        help="Path of the cmake_clang_tools settings file with the white- and blacklist.")
+    parser.add_argument("--tools", default=",".join(TOOL_NAMES), help="Comma-separated list of the tools to run.")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="Number of concurrent jobs. If the runner is started by make with a jobserver, the jobserver limits the "
+                             "concurrency instead.")
+    parser.add_argument("--timing-database", default=DEFAULT_TIMING_DATABASE, type=Path,
+                        help="Database of the durations of previous runs, used to start the longest jobs first.")
+    parser.add_argument("--no-timings", action="store_true", help="Do not use the durations of previous runs, start the largest "
+                                                                   "sources first.")
+    parser.add_argument("--force", action="store_true", help="Process all sources, even if they did not change since their last run.")
+    parser.add_argument("build_directories", nargs="+", type=Path,
+                        help="Build directories searched for the projects using cmake_clang_tools, e.g. the build space of a catkin "
+                             "workspace.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    tools = cmake_clang_tools_helpers.string_to_list(args.tools)
+    for tool in tools:
+        if tool not in TOOL_NAMES:
+            sys.exit(f"Unknown tool '{tool}', choose from {', '.join(TOOL_NAMES)}.")
+    settings = cmake_clang_tools_helpers.load_yaml(args.settings_file) if args.settings_file.exists() else None
+
+    jobs = [parse_job_file(job_file) for job_file in find_job_files(args.build_directories)]
+    timing_database = None if args.no_timings else TimingDatabase.open(args.timing_database)
+    work_items = collect_work_items(jobs, settings or dict(), tools, args.force, timing_database)
+    if timing_database:
+        # The scripts record the durations themselves.
+        timing_database.close()
+    timing_arguments = ["--no-timings"] if args.no_timings else [f"--timing-database={args.timing_database}"]
+    print(f"[cmake_clang_tools] Running {len(work_items)} of {len({(job.project, job.tool) for job in jobs})} project tools with "
+          f"{sum(len(work_item.sources) for work_item in work_items)} sources.")
+
+    failed_count = 0
+    predictions = dict()
+    timings = dict()
+    start_time = time.monotonic()
+    with TokenPool(args.jobs) as token_pool, ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        futures = [executor.submit(run_work_item, work_item, token_pool, timing_arguments) for work_item in work_items]
+        # Outputs are printed as the jobs finish, the longest jobs are started first but do not hold back the others.
+        for future in as_completed(futures):
+            work_item, return_code, output, duration = future.result()
+            name = f"{work_item.job.project} ({work_item.job.tool})"
+            timings[name] = duration
+            if work_item.prediction is not None:
+                predictions[name] = work_item.prediction
+            if output:
+                print(output, end="", flush=True)
+            if return_code != 0:
+                failed_count += 1
+                print(f"[cmake_clang_tools] {work_item.job.tool} failed for project {work_item.job.project}.", file=sys.stderr)
+
+    print_timing_summary("cmake_clang_tools", predictions, timings, time.monotonic() - start_time)
+    if failed_count:
+        sys.exit(f"[cmake_clang_tools] {failed_count} of {len(work_items)} jobs failed.")
+
+
+if __name__ == "__main__":
+    main()
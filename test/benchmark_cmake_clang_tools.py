@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmarks of the cmake_clang_tools scripts on synthetic packages, see synthetic_workspace.py.
+The benchmarks are not part of the test suite, run them with:
+
+    python3 -m pytest -s test/benchmark_cmake_clang_tools.py
+
+The clang tools are replaced by the stubs in test/stubs, such that the overhead of the scripts is measured separately from
+the tools. Set CMAKE_CLANG_TOOLS_BENCHMARK_CLANG_FORMAT and CMAKE_CLANG_TOOLS_BENCHMARK_CLANG_TIDY to the real executables to
+measure the tools too. CMAKE_CLANG_TOOLS_BENCHMARK_SCALE multiplies the size of the packages and CMAKE_CLANG_TOOLS_BENCHMARK_ROUNDS
+sets the number of rounds. If pytest-benchmark is installed, its benchmark fixture and reports are used.
+"""
+import os
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_cache import ResultCache
+from cmake_clang_tools_compile_database import CompileDatabase
+from cmake_clang_tools_discovery import FileDiscovery
+from cmake_clang_tools_helpers import glob_paths
+from run_clang_format_tool import DEFAULT_CHUNK_SIZE, Replacement, clang_format_check, convert_replacements_to_errors, \
+    parse_replacements_from_xml
+from run_clang_tidy_tool import create_header_ownership_filters, execute_clang_tidy_shards
+from synthetic_workspace import STUB_CLANG_FORMAT, STUB_CLANG_TIDY, generate_workspace
+
+SCALE = float(os.environ.get("CMAKE_CLANG_TOOLS_BENCHMARK_SCALE", "1"))
+ROUNDS = int(os.environ.get("CMAKE_CLANG_TOOLS_BENCHMARK_ROUNDS", "5"))
+CLANG_FORMAT = os.environ.get("CMAKE_CLANG_TOOLS_BENCHMARK_CLANG_FORMAT", str(STUB_CLANG_FORMAT))
+CLANG_TIDY = os.environ.get("CMAKE_CLANG_TOOLS_BENCHMARK_CLANG_TIDY", str(STUB_CLANG_TIDY))
+JOBS = os.cpu_count() or 1
+# Replacements of the large file, one every 64 bytes like the clang-format stub.
+REPLACEMENT_DISTANCE = 64
+
+
+class Benchmark:
+    """
+    Minimal replacement of the benchmark fixture of pytest-benchmark, prints the minimum and mean time of the rounds.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __call__(self, function, *args, **kwargs):
+        return self.pedantic(function, args, kwargs, rounds=ROUNDS, warmup_rounds=1)
+
+    def pedantic(self, function, args=(), kwargs=None, setup=None, rounds=1, warmup_rounds=0, iterations=1):
+        durations = list()
+        result = None
+        for round_index in range(warmup_rounds + rounds):
+            if setup:
+                args, kwargs = setup() or (args, kwargs)
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                result = function(*args, **(kwargs or dict()))
+            if round_index >= warmup_rounds:
+                durations.append((time.perf_counter() - start_time) / iterations)
+        print(f"\n[benchmark] {self.name}: min {min(durations) * 1e3:.2f} ms, mean {statistics.mean(durations) * 1e3:.2f} ms "
+              f"({len(durations)} rounds)", file=sys.stderr)
+        return result
+
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    @pytest.fixture
+    def benchmark(request) -> Benchmark:
+        return Benchmark(request.node.name)
+
+
+@pytest.fixture(scope="module")
+def packages(tmp_path_factory):
+    return generate_workspace(tmp_path_factory.mktemp("workspace"), package_count=max(1, int(2 * SCALE)),
+                              source_count=max(2, int(100 * SCALE)), header_count=max(1, int(50 * SCALE)), include_depth=10,
+                              large_file_count=2, large_file_lines=int(20000 * SCALE))
+
+
+@pytest.fixture(scope="module")
+def sources(packages):
+    return [source for package in packages for source in package.sources]
+
+
+def test_glob_paths(benchmark, packages):
+    patterns = [str(package.directory / directory / pattern) for package in packages
+                for directory, pattern in [("src", "*.cpp"), ("include", "*/*.hpp")]]
+    files = benchmark(glob_paths, patterns)
+    assert len(files) == sum(len(package.sources) + len(package.headers) for package in packages)
+
+
+def test_file_discovery(benchmark, packages):
+    directories = [str(package.directory) for package in packages]
+    files = benchmark(lambda: FileDiscovery().discover(directories))
+    assert len(files["CXX_SOURCE_FILES"]) == sum(len(package.sources) for package in packages)
+
+
+def test_file_discovery_cached(benchmark, packages, tmp_path):
+    directories = [str(package.directory) for package in packages]
+    discovery = FileDiscovery(listing_cache_file=tmp_path / "listing.json")
+    discovery.discover(directories)
+    discovery.save()
+    files = benchmark(lambda: FileDiscovery(listing_cache_file=tmp_path / "listing.json").discover(directories))
+    assert len(files["CXX_SOURCE_FILES"]) == sum(len(package.sources) for package in packages)
+
+
+def test_parse_replacements_from_xml(benchmark, packages):
+    content = packages[0].large_files[0].read_bytes()
+    xml = "<?xml version='1.0'?>\n<replacements xml:space='preserve' incomplete_format='false'>\n" + \
+          "".join(f"<replacement offset='{offset}' length='1'>  </replacement>\n"
+                  for offset in range(0, len(content), REPLACEMENT_DISTANCE)) + "</replacements>\n"
+    replacements = benchmark(parse_replacements_from_xml, xml)
+    assert len(replacements) == len(range(0, len(content), REPLACEMENT_DISTANCE))
+
+
+def test_convert_replacements_to_errors(benchmark, packages):
+    file = packages[0].large_files[0]
+    content = file.read_bytes()
+    replacements = [Replacement(offset, 1, "  ") for offset in range(0, len(content), REPLACEMENT_DISTANCE)]
+    errors = benchmark(convert_replacements_to_errors, file, replacements, content)
+    assert len(errors) == len(replacements)
+
+
+def test_clang_format_processes(benchmark, sources):
+    # Baseline: Running the tool alone, the difference to test_clang_format_check is the overhead of the script.
+    def run_processes():
+        for source in sources:
+            subprocess.run([CLANG_FORMAT, "--style=file", "--output-replacements-xml", str(source)], stdout=subprocess.DEVNULL,
+                           check=True)
+
+    benchmark.pedantic(run_processes, rounds=ROUNDS)
+
+
+def test_clang_format_check(benchmark, sources):
+    error_count, file_errors = benchmark.pedantic(clang_format_check, (CLANG_FORMAT, sources, "file", False, 1), rounds=ROUNDS)
+    assert len(file_errors) == len(sources)
+
+
+def test_clang_format_check_parallel(benchmark, sources):
+    error_count, file_errors = benchmark.pedantic(clang_format_check, (CLANG_FORMAT, sources, "file", False, JOBS), rounds=ROUNDS)
+    assert len(file_errors) == len(sources)
+
+
+def test_clang_format_check_chunks(benchmark, sources):
+    error_count, file_errors = benchmark.pedantic(clang_format_check, (CLANG_FORMAT, sources, "file", False, JOBS),
+                                                  {"chunk_size": DEFAULT_CHUNK_SIZE}, rounds=ROUNDS)
+    assert len(file_errors) == len(sources)
+
+
+def test_clang_format_check_cached(benchmark, sources, tmp_path):
+    cache = ResultCache(tmp_path / "cache")
+    clang_format_check(CLANG_FORMAT, sources, "file", False, JOBS, cache)
+    error_count, file_errors = benchmark(clang_format_check, CLANG_FORMAT, sources, "file", False, JOBS, cache)
+    assert len(file_errors) == len(sources)
+
+
+def test_compile_database_dependencies(benchmark, packages):
+    def load_dependencies():
+        for package in packages:
+            compile_database = CompileDatabase.load(str(package.build_directory))
+            for source in package.sources:
+                assert compile_database.dependencies(source) is not None
+
+    benchmark(load_dependencies)
+
+
+def test_header_ownership(benchmark, packages):
+    package = packages[0]
+    compile_database = CompileDatabase.load(str(package.build_directory))
+    header_filters = benchmark(create_header_ownership_filters, package.sources, package.sources, compile_database,
+                               f"^{package.directory / 'include'}/.*")
+    assert len(header_filters) == len(package.sources)
+
+
+def test_clang_tidy_shards(benchmark, packages):
+    package = packages[0]
+    compile_database = CompileDatabase.load(str(package.build_directory))
+    header_filter = f"^{package.directory / 'include'}/.*"
+    header_filters = create_header_ownership_filters(package.sources, package.sources, compile_database, header_filter)
+    results = benchmark.pedantic(execute_clang_tidy_shards, (CLANG_TIDY, package.sources, "{}", str(package.build_directory),
+                                                             header_filter, False, False, False, ""),
+                                 {"jobs": JOBS, "header_filters": header_filters, "compile_database": compile_database},
+                                 rounds=ROUNDS)
+    assert len(results) == len(package.sources)
+
+
+def test_clang_tidy_shards_cached(benchmark, packages, tmp_path):
+    package = packages[0]
+    cache = ResultCache(tmp_path / "cache")
+    arguments = (CLANG_TIDY, package.sources, "{}", str(package.build_directory), "", False, False, False, "", cache, JOBS)
+    execute_clang_tidy_shards(*arguments)
+    results = benchmark(execute_clang_tidy_shards, *arguments)
+    assert len(results) == len(package.sources)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main(["-s", "-q", __file__, *sys.argv[1:]]))
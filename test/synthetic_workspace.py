@@ -0,0 +1,116 @@
+from collections import namedtuple
+import json
+import os
+from pathlib import Path
+import random
+from typing import List
+
+STUBS_DIR = Path(__file__).resolve().parent / "stubs"
+STUB_CLANG_FORMAT = STUBS_DIR / "clang-format"
+STUB_CLANG_TIDY = STUBS_DIR / "clang-tidy"
+
+SyntheticPackage = namedtuple("SyntheticPackage", ["name", "directory", "build_directory", "sources", "headers", "large_files"])
+
+
+def write_badly_formatted_lines(lines: List[str], count: int, random_generator: random.Random) -> None:
+    """
+    Append code with inconsistent spacing, indentation and line breaks, such that clang-format reports many replacements.
+    :param lines: Lines to append to.
+    :param count: Number of lines to append.
+    :param random_generator: Random generator of the package.
+    """
+    for index in range(count):
+        indent = " " * random_generator.randrange(0, 7)
+        variant = index % 4
+        if variant == 0:
+            lines.append(f"{indent}int   value_{index}  =  {index} ;")
+        elif variant == 1:
+            lines.append(f"{indent}if(value_{index - 1}>{index}){{ value_{index - 1}-=1;}}")
+        elif variant == 2:
+            lines.append(f"{indent}static const char *text_{index}= \"line {index}\" ;   ")
+        else:
+            lines.append(f"{indent}for(int i=0;i<{index};++i) value_{index - 3}+= i ;")
+
+
+def generate_package(directory: Path, name: str = "synthetic_package", source_count: int = 20, header_count: int = 10,
+                     include_depth: int = 5, large_file_count: int = 1, large_file_lines: int = 5000,
+                     seed: int = 0) -> SyntheticPackage:
+    """
+    Generate a package shaped like the example package (CMakeLists.txt, .clang-format, include/ and src/) with a build directory
+    that contains a compile database and the dependency files of a compilation, such that the dependencies are known without a compiler.
+    Every source includes one header, which includes a chain of 'include_depth' further headers.
+    :param directory: Directory to create the package in.
+    :param name: Name of the package and its CMake project.
+    :param source_count: Number of source files, including the large ones.
+    :param header_count: Number of header files.
+    :param include_depth: Length of the include chain of every header.
+    :param large_file_count: Number of large, badly formatted source files.
+    :param large_file_lines: Number of lines of the large source files.
+    :param seed: Seed of the generated content, the same seed generates the same package.
+    :return: The generated package.
+    """
+    random_generator = random.Random(seed)
+    package_dir = Path(directory).resolve() / name
+    include_dir = package_dir / "include" / name
+    source_dir = package_dir / "src"
+    build_dir = package_dir / "build"
+    for sub_directory in [include_dir, source_dir, build_dir]:
+        sub_directory.mkdir(parents=True, exist_ok=True)
+
+    headers = [include_dir / f"header_{index}.hpp" for index in range(header_count)]
+    for index, header in enumerate(headers):
+        lines = ["#pragma once"]
+        if index + 1 < header_count and (index + 1) % (include_depth + 1) != 0:
+            lines.append(f"#include \"{name}/header_{index + 1}.hpp\"")
+        lines.append(f"namespace {name} {{")
+        lines.append(f"int function_{index}(int argument);")
+        write_badly_formatted_lines(lines, 20, random_generator)
+        lines.append("}")
+        header.write_text("\n".join(lines) + "\n")
+
+    sources = [source_dir / f"source_{index}.cpp" for index in range(source_count)]
+    large_files = sources[:large_file_count]
+    included_headers = dict()
+    for index, source in enumerate(sources):
+        header_index = index % header_count if header_count else None
+        lines = list()
+        if header_index is not None:
+            lines.append(f"#include \"{name}/header_{header_index}.hpp\"")
+            # The chain of includes ends at the next header starting a chain.
+            chain_end = min(header_count, (header_index // (include_depth + 1) + 1) * (include_depth + 1))
+            included_headers[source] = headers[header_index:chain_end]
+        lines.append(f"int {name}::function_{index}(int argument) {{")
+        write_badly_formatted_lines(lines, large_file_lines if source in large_files else 50, random_generator)
+        lines.append("return argument; }")
+        source.write_text("\n".join(lines) + "\n")
+
+    (package_dir / ".clang-format").write_text("BasedOnStyle: Google\nColumnLimit: 120\n")
+    (package_dir / "CMakeLists.txt").write_text(
+        f"cmake_minimum_required (VERSION 2.8)\nproject({name})\n\nset(CMAKE_EXPORT_COMPILE_COMMANDS ON)\ninclude_directories(include)\n"
+        f"add_library(${{PROJECT_NAME}} {' '.join(os.path.relpath(source, package_dir) for source in sources)})\n")
+
+    # The dependency files are written after the sources and headers, such that they are up to date.
+    entries = list()
+    for source in sources:
+        object_file = f"CMakeFiles/{name}.dir/src/{source.name}.o"
+        depfile = build_dir / f"{object_file}.d"
+        depfile.parent.mkdir(parents=True, exist_ok=True)
+        dependencies = [str(file) for file in [source, *included_headers.get(source, [])]]
+        depfile.write_text(f"{object_file}: \\\n " + " \\\n ".join(dependencies) + "\n")
+        entries.append({"directory": str(build_dir), "file": str(source),
+                        "arguments": ["c++", f"-I{package_dir / 'include'}", "-std=c++17", "-MD", "-MT", object_file, "-MF",
+                                      f"{object_file}.d", "-o", object_file, "-c", str(source)]})
+    (build_dir / "compile_commands.json").write_text(json.dumps(entries, indent=2))
+    return SyntheticPackage(name, package_dir, build_dir, sources, headers, large_files)
+
+
+def generate_workspace(directory: Path, package_count: int = 2, **package_arguments) -> List[SyntheticPackage]:
+    """
+    Generate a workspace of packages, e.g. to run the workspace runner on.
+    :param directory: Directory to create the packages in.
+    :param package_count: Number of packages.
+    :param package_arguments: Arguments of generate_package.
+    :return: The generated packages.
+    """
+    return [generate_package(directory, name=f"synthetic_package_{index}", seed=index, **package_arguments)
+            for index in range(package_count)]
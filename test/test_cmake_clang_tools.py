@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import filecmp
+import json
+import os
 from pathlib import Path
 import sys
 from typing import List
@@ -84,8 +86,16 @@ def test_update_cache(tmpdir: Path):
     with open(file, 'w') as f:
         f.write("data: {2, 3}")
     assert not filecmp.cmp(file, cached_file)
+    assert not is_cache_up_to_date(file, cached_file)
     update_cache(file, cached_file)
     assert filecmp.cmp(file, cached_file)
+    assert is_cache_up_to_date(file, cached_file)
+    # Files with the same size and modification time are compared by their content.
+    stat = os.stat(file)
+    with open(file, 'w') as f:
+        f.write("data: {2, 4}")
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not is_cache_up_to_date(file, cached_file)
 
 
 def test_string_to_list_default_separator():
@@ -116,3 +126,72 @@ def test_string_to_list_extra_spaces():
     string = "  a   ,  b,c  "
     expected_list = ['a', 'b', 'c']
     assert expected_list == string_to_list(string)
+
+
+def test_glob_paths_sorted(tmpdir: Path):
+    for name in ["c.cpp", "a.cpp", "b.hpp"]:
+        with open(tmpdir / name, 'w'):
+            pass
+    files = glob_paths([str(tmpdir / "*.cpp"), str(tmpdir / "*.hpp"), str(tmpdir / "a.cpp")])
+    assert [file.name for file in files] == ["a.cpp", "b.hpp", "c.cpp"]
+
+
+def test_proxy_stamp_path_shortened():
+    stamp = proxy_stamp_path(Path("/build"), "project", Path("/src/" + "a" * 200 + ".cpp"), "clang_format")
+    assert stamp.parent == Path("/build")
+    assert stamp.name == ("project--src-" + "a" * 200 + ".cpp-clang_format")[-127:] + ".proxy"
+
+
+def test_stale_files(tmpdir: Path):
+    stamp_dir = Path(tmpdir)
+    config = stamp_dir / "config"
+    files = [stamp_dir / "a.cpp", stamp_dir / "b.cpp"]
+    for file in [config, *files]:
+        file.touch()
+        os.utime(str(file), (1000, 1000))
+    assert get_stale_files(files, stamp_dir, "project", "clang_format", [config]) == files
+
+    touch_stamps(files, stamp_dir, "project", "clang_format")
+    for file in files:
+        os.utime(str(proxy_stamp_path(stamp_dir, "project", file, "clang_format")), (2000, 2000))
+    assert get_stale_files(files, stamp_dir, "project", "clang_format", [config]) == []
+
+    os.utime(str(files[1]), (3000, 3000))
+    assert get_stale_files(files, stamp_dir, "project", "clang_format", [config]) == [files[1]]
+
+    os.utime(str(config), (3000, 3000))
+    assert get_stale_files(files, stamp_dir, "project", "clang_format", [config]) == files
+
+    os.utime(str(config), (1000, 1000))
+    os.utime(str(files[1]), (1000, 1000))
+    remove_stamps(files[:1], stamp_dir, "project", "clang_format")
+    assert get_stale_files(files, stamp_dir, "project", "clang_format", [config]) == files[:1]
+
+
+def test_load_config_string_compiled(tmpdir: Path):
+    import cmake_clang_tools_helpers
+    config_file = Path(tmpdir) / ".clang-tidy"
+    cache_file = Path(tmpdir) / "config-compiled.json"
+    config_file.write_text("Checks: '-*,readability-*'\nCheckOptions:\n  - key: a.b\n    value: \"x\"\n")
+    config_string = load_config_string(config_file, cache_file)
+    assert json.loads(config_string) == {"Checks": "-*,readability-*", "CheckOptions": [{"key": "a.b", "value": "x"}]}
+
+    # Other processes use the compiled configuration, as long as the file does not change.
+    cmake_clang_tools_helpers._config_strings.clear()
+    compiled_configs = json.loads(cache_file.read_text())
+    compiled_configs[str(config_file)]["config"] = "compiled"
+    cache_file.write_text(json.dumps(compiled_configs))
+    assert load_config_string(config_file, cache_file) == "compiled"
+
+    cmake_clang_tools_helpers._config_strings.clear()
+    config_file.write_text("Checks: '-*'\n")
+    assert json.loads(load_config_string(config_file, cache_file)) == {"Checks": "-*"}
+
+
+def test_glob_paths(tmpdir: Path):
+    directory = Path(tmpdir)
+    for file in ["a.cpp", "sub/b.cpp", "sub/deeper/c.cpp"]:
+        (directory / file).parent.mkdir(parents=True, exist_ok=True)
+        (directory / file).touch()
+    assert glob_paths([str(directory / "*.cpp"), str(directory / "a.cpp"), str(directory / "missing.cpp")]) == [directory / "a.cpp"]
+    assert glob_paths([str(directory / "**" / "*.cpp")]) == [directory / "a.cpp", directory / "sub/b.cpp", directory / "sub/deeper/c.cpp"]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_cache import *
+
+
+def test_hash_parts_boundaries():
+    assert hash_parts("ab", "c") != hash_parts("a", "bc")
+    assert hash_parts("a", None) == hash_parts("a", "")
+    assert hash_parts("a", b"b") == hash_parts("a", "b")
+
+
+def test_result_cache_roundtrip(tmpdir: Path):
+    cache = ResultCache(Path(tmpdir))
+    key = hash_parts("key")
+    assert cache.get(key) is None
+    cache.put(key, [[0, 1, "found", "expected"]])
+    assert cache.get(key) == [[0, 1, "found", "expected"]]
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_result_cache_evicts_least_recently_used(tmpdir: Path):
+    cache = ResultCache(Path(tmpdir), max_size_mb=3000 / (1024 * 1024))
+    keys = [hash_parts(str(i)) for i in range(3)]
+    for age, key in enumerate(keys):
+        cache.put(key, "x" * 1000)
+        path = cache._entry_path(key)
+        os.utime(str(path), (1000 + age, 1000 + age))
+    # Reading the oldest entry marks it as recently used.
+    assert cache.get(keys[0]) is not None
+    cache.trim(force=True)
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is not None
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import io
+import json
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_diagnostics import *
+
+FIRST_OUTPUT = """3 warnings generated.
+/pkg/include/pkg/a.hpp:4:7: warning: use 'using' instead of 'typedef' [modernize-use-using]
+    4 | typedef int Index;
+      | ^~~~~~~~~~~~~~~~~
+      | using Index = int
+/pkg/src/a.cpp:10:3: warning: 'auto x' can be declared as 'auto *x' [llvm-qualified-auto,readability-qualified-auto]
+/pkg/src/a.cpp:2:1: note: previous declaration is here
+Suppressed 1 warnings (1 in non-user code).
+Use -header-filter=.* to display errors from all non-system headers. Use -system-headers to display errors from system headers as well.
+"""
+SECOND_OUTPUT = """/pkg/src/../include/pkg/a.hpp:4:7: warning: use 'using' instead of 'typedef' [modernize-use-using]
+/pkg/src/b.cpp:1:10: error: 'missing.hpp' file not found [clang-diagnostic-error]
+2 warnings and 1 error generated.
+Error while processing /pkg/src/b.cpp.
+"""
+
+
+def test_parse_clang_tidy_output():
+    diagnostics, messages = parse_clang_tidy_output(FIRST_OUTPUT)
+    assert diagnostics == [
+        Diagnostic("/pkg/include/pkg/a.hpp", 4, 7, "warning", "use 'using' instead of 'typedef'", "modernize-use-using", ()),
+        Diagnostic("/pkg/src/a.cpp", 10, 3, "warning", "'auto x' can be declared as 'auto *x'",
+                   "llvm-qualified-auto,readability-qualified-auto", ("/pkg/src/a.cpp:2:1: note: previous declaration is here",))]
+    assert messages == list()
+    # The warnings promoted to errors are counted for their checks.
+    diagnostics_as_errors, _ = parse_clang_tidy_output("/pkg/src/a.cpp:10:3: error: 'auto x' can be declared as 'auto *x' "
+                                                       "[llvm-qualified-auto,readability-qualified-auto,-warnings-as-errors]\n"
+                                                       "/pkg/src/a.cpp:4:7: error: use 'using' [modernize-use-using,-warnings-as-errors]")
+    assert [diagnostic.check for diagnostic in diagnostics_as_errors] == ["llvm-qualified-auto,readability-qualified-auto",
+                                                                          "modernize-use-using"]
+    assert format_diagnostic(diagnostics[1]) == "/pkg/src/a.cpp:10:3: warning: 'auto x' can be declared as 'auto *x' " \
+                                                "[llvm-qualified-auto,readability-qualified-auto]\n" \
+                                                "/pkg/src/a.cpp:2:1: note: previous declaration is here"
+
+
+def test_diagnostic_collector(tmpdir: Path):
+    collector = DiagnosticCollector()
+    assert collector.add_output(FIRST_OUTPUT) == list()
+    assert collector.add_output(SECOND_OUTPUT) == ["Error while processing /pkg/src/b.cpp."]
+    # The warning in the header is reported by both translation units.
+    assert len(collector.diagnostics) == 3
+    assert collector.duplicates == 1
+
+    stream = io.StringIO()
+    collector.print_report("clang-tidy", stream)
+    lines = stream.getvalue().splitlines()
+    assert [line.split(":")[0] for line in lines[:4]] == ["/pkg/include/pkg/a.hpp", "/pkg/src/a.cpp", "/pkg/src/a.cpp", "/pkg/src/b.cpp"]
+    assert lines[4] == "[clang-tidy] 3 diagnostics in 3 files (1 duplicates omitted), clang-diagnostic-error: 1, " \
+                       "llvm-qualified-auto: 1, modernize-use-using: 1, readability-qualified-auto: 1."
+
+    summary_file = Path(tmpdir) / "summary" / "clang-tidy.json"
+    collector.write_summary(summary_file, "clang-tidy")
+    assert json.loads(summary_file.read_text()) == {
+        "tool": "clang-tidy", "diagnostics": 3, "duplicates": 1, "files": 3, "levels": {"error": 1, "warning": 2},
+        "checks": {"clang-diagnostic-error": 1, "llvm-qualified-auto": 1, "modernize-use-using": 1, "readability-qualified-auto": 1}}
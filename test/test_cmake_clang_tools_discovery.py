@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_discovery import *
+
+
+def create_files(directory: Path, files: List[str]) -> None:
+    for file in files:
+        (directory / file).parent.mkdir(parents=True, exist_ok=True)
+        (directory / file).touch()
+
+
+def test_gitignore_patterns():
+    rules = parse_gitignore(["# comment\n", "build/\n", "*.gen.cpp\n", "!keep.gen.cpp\n", "/top.cpp\n", "doc/**/*.h\n"])
+    gitignores = [("/repo", rules)]
+    assert is_ignored("/repo/build", True, gitignores)
+    assert is_ignored("/repo/src/build", True, gitignores)
+    assert not is_ignored("/repo/src/build", False, gitignores)
+    assert is_ignored("/repo/src/a.gen.cpp", False, gitignores)
+    assert not is_ignored("/repo/src/keep.gen.cpp", False, gitignores)
+    assert is_ignored("/repo/top.cpp", False, gitignores)
+    assert not is_ignored("/repo/src/top.cpp", False, gitignores)
+    assert is_ignored("/repo/doc/a.h", False, gitignores)
+    assert is_ignored("/repo/doc/x/y/a.h", False, gitignores)
+    assert not is_ignored("/repo/src/doc/a.h", False, gitignores)
+
+
+def test_discover_files(tmpdir: Path):
+    directory = Path(tmpdir)
+    (directory / ".git").mkdir()
+    (directory / ".gitignore").write_text("generated/\n")
+    (directory / "include" / ".gitignore").parent.mkdir()
+    (directory / "include" / ".gitignore").write_text("*.t\n")
+    create_files(directory, ["src/a.cpp", "src/sub/b.cc", "src/generated/c.cpp", "src/message.proto", "src/notes.txt",
+                             "include/pkg/a.hpp", "include/pkg/impl.t", "include/third_party/x.h", "third_party/y.cpp"])
+
+    files = FileDiscovery(excludes=["third_party"]).discover([str(directory / "src"), str(directory / "include"),
+                                                              str(directory / "third_party"), str(directory / "missing")])
+    # The excludes only apply to headers.
+    assert files == {"CXX_SOURCE_FILES": [str(directory / "src/a.cpp"), str(directory / "src/sub/b.cc"),
+                                          str(directory / "third_party/y.cpp")],
+                     "HXX_SOURCE_FILES": [str(directory / "include/pkg/a.hpp")],
+                     "PROTO_FILES": [str(directory / "src/message.proto")]}
+
+    # Directories ignored by a parent .gitignore file are skipped.
+    assert FileDiscovery().discover([str(directory / "src" / "generated")])["CXX_SOURCE_FILES"] == []
+    assert FileDiscovery(gitignore=False).discover([str(directory / "src" / "generated")])["CXX_SOURCE_FILES"] == \
+        [str(directory / "src/generated/c.cpp")]
+
+
+def test_listing_cache(tmpdir: Path):
+    directory = Path(tmpdir)
+    create_files(directory, ["src/a.cpp"])
+    cache_file = directory / "build" / "listing.json"
+    discovery = FileDiscovery(listing_cache_file=cache_file)
+    assert discovery.discover([str(directory / "src")])["CXX_SOURCE_FILES"] == [str(directory / "src/a.cpp")]
+    discovery.save()
+
+    # Unchanged directories are taken from the cache.
+    discovery = FileDiscovery(listing_cache_file=cache_file)
+    assert discovery.discover([str(directory / "src")])["CXX_SOURCE_FILES"] == [str(directory / "src/a.cpp")]
+    assert not discovery._listings_changed
+
+    # Added files change the modification time of the directory.
+    create_files(directory, ["src/b.cpp"])
+    os.utime(directory / "src", ns=(0, os.stat(directory / "src").st_mtime_ns + 1000000))
+    discovery = FileDiscovery(listing_cache_file=cache_file)
+    assert discovery.discover([str(directory / "src")])["CXX_SOURCE_FILES"] == [str(directory / "src/a.cpp"),
+                                                                                 str(directory / "src/b.cpp")]
+
+
+def test_format_cmake_lists():
+    assert format_cmake_lists({"CXX_SOURCE_FILES": ["/a b/c;d.cpp"], "PROTO_FILES": []}) == \
+        'set(CLANG_TOOLING_CXX_SOURCE_FILES\n  "/a b/c\\;d.cpp"\n)\nset(CLANG_TOOLING_PROTO_FILES\n)\n'
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_format_daemon import *
+
+FAKE_CLANG_FORMAT = """#!{python}
+import sys
+content = sys.stdin.buffer.read()
+assume_filename = [argument for argument in sys.argv if argument.startswith("--assume-filename=")][0]
+sys.stdout.write(f"<replacements><replacement offset='0' length='{{len(content)}}'>{{assume_filename}}</replacement></replacements>")
+"""
+
+
+def test_message_roundtrip():
+    client, server = socket.socketpair()
+    with client, server:
+        send_message(client, {"file": "a.cpp"}, b"int a;\n")
+        header, payload = receive_message(server)
+    assert header == {"file": "a.cpp", "size": 7}
+    assert payload == b"int a;\n"
+
+
+def test_daemon_formats_from_stdin(tmpdir: Path):
+    directory = Path(tmpdir)
+    executable = directory / "clang-format"
+    executable.write_text(FAKE_CLANG_FORMAT.format(python=sys.executable))
+    executable.chmod(0o755)
+    (directory / ".clang-format").write_text("BasedOnStyle: LLVM\n")
+    socket_path = directory / "daemon.sock"
+
+    daemon_thread = threading.Thread(target=serve, args=(socket_path, 0.5))
+    daemon_thread.start()
+    client = FormatDaemonClient(socket_path)
+    # The daemon is served by the thread, the client must not start another one.
+    client._started = True
+    for name in ["a.cpp", "b.cpp"]:
+        output = client.format(str(executable), directory / name, CONFIG_FILE_SEARCH, b"int a;\n")
+        assert output == f"<replacements><replacement offset='0' length='7'>" \
+                         f"--assume-filename={directory / 'stdin.cpp'}</replacement></replacements>".encode()
+
+    # The daemon shuts down once it is idle.
+    daemon_thread.join(timeout=10)
+    assert not daemon_thread.is_alive()
+    assert not socket_path.exists()
+
+
+def test_create_private_directory(tmpdir: Path):
+    directory = Path(tmpdir) / "daemon"
+    create_private_directory(directory)
+    assert directory.stat().st_mode & 0o777 == 0o700
+
+    # Directories accessible by other users, e.g. created by them in the temporary directory, are refused.
+    directory.chmod(0o755)
+    with pytest.raises(PermissionError):
+        create_private_directory(directory)
+    link = Path(tmpdir) / "link"
+    link.symlink_to(directory)
+    directory.chmod(0o700)
+    with pytest.raises(PermissionError):
+        create_private_directory(link)
+    if os.getuid() == 0:
+        os.chown(directory, 12345, -1)
+        with pytest.raises(PermissionError):
+            create_private_directory(directory)
+
+
+def test_client_refuses_public_socket_directory(tmpdir: Path):
+    directory = Path(tmpdir) / "public"
+    directory.mkdir(mode=0o777)
+    directory.chmod(0o777)
+    client = FormatDaemonClient(directory / "daemon.sock")
+    assert client.format("clang-format", directory / "a.cpp", CONFIG_FILE_SEARCH, b"int a;\n") is None
+    assert not client.available
+    assert not (directory / "daemon.sock").exists()
+
+
+def test_is_same_user():
+    client, server = socket.socketpair()
+    with client, server:
+        assert is_same_user(client)
+        assert is_same_user(server)
+
+
+def test_concurrent_refills_keep_warm_workers():
+    class SlowPool(ClangFormatPool):
+        def _spawn(self, command: list):
+            time.sleep(0.05)
+            return command
+
+    pool = SlowPool(warm_workers=2)
+    pool._pools["key"] = deque()
+    # The requests of the same pool refill it at the same time.
+    threads = [threading.Thread(target=pool._refill, args=("key", ["clang-format"])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(pool._pools["key"]) == 2
+    assert pool._pending == dict()
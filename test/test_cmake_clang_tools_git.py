@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_git import *
+
+
+def git(directory: Path, *arguments: str) -> None:
+    subprocess.run(["git", "-C", str(directory), "-c", "user.name=test", "-c", "user.email=test@example.com", *arguments], check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def test_parse_diff_line_ranges():
+    diff = "diff --git src/a.cpp src/a.cpp\n--- src/a.cpp\n+++ src/a.cpp\n@@ -1 +1 @@\n-a\n+b\n@@ -10,0 +11,3 @@\n+c\n+d\n+e\n" \
+           "diff --git b.cpp b.cpp\n--- b.cpp\n+++ b.cpp\n@@ -4,2 +3,0 @@\n-f\n-g\n"
+    assert parse_diff_line_ranges(diff, "/repo") == {"/repo/src/a.cpp": [(1, 1), (11, 13)], "/repo/b.cpp": []}
+
+
+def test_get_changed_lines(tmpdir: Path):
+    directory = Path(tmpdir)
+    git(directory, "init", "-q")
+    files = [directory / name for name in ["changed.cpp", "unchanged.cpp", "removed_lines.cpp"]]
+    for file in files:
+        file.write_text("".join(f"int line{index};\n" for index in range(10)))
+    git(directory, "add", ".")
+    git(directory, "commit", "-q", "-m", "base")
+    git(directory, "tag", "base")
+
+    files[0].write_text(files[0].read_text().replace("line2;", "line2 ;").replace("line7;", "line7 ;"))
+    files[2].write_text(files[2].read_text().replace("int line5;\n", ""))
+    untracked = directory / "untracked.cpp"
+    untracked.write_text("int a;\n")
+    changed_lines = get_changed_lines(files + [untracked], "base")
+    assert changed_lines == {str(files[0]): [(3, 3), (8, 8)], str(files[2]): [], str(untracked): None}
+    assert filter_changed_files(files + [untracked], changed_lines) == [files[0], untracked]
+    assert json.loads(create_line_filter(changed_lines)) == [{"name": str(files[0]), "lines": [[3, 3], [8, 8]]},
+                                                             {"name": str(untracked)}]
+
+    # A reference ending with '...' is compared at the merge base.
+    git(directory, "commit", "-q", "-a", "-m", "change")
+    assert get_changed_lines(files, "HEAD...") == {str(untracked): None}
+    assert get_changed_lines(files, "base...")[str(files[0])] == [(3, 3), (8, 8)]
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_jobserver import *
+
+
+def is_empty(read_fd: int) -> bool:
+    os.set_blocking(read_fd, False)
+    try:
+        os.read(read_fd, 1)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.set_blocking(read_fd, True)
+
+
+def test_parse_makeflags():
+    assert parse_makeflags("") is None
+    assert parse_makeflags("-j8") is None
+    assert parse_makeflags("-j8 --jobserver-auth=3,4") == {"read_fd": 3, "write_fd": 4}
+    assert parse_makeflags("-j8 --jobserver-fds=5,6 --jobserver-auth=3,4") == {"read_fd": 3, "write_fd": 4}
+    assert parse_makeflags("-j8 --jobserver-auth=fifo:/tmp/GMfifo1") == {"fifo": "/tmp/GMfifo1"}
+
+
+def test_token_pool_limits_jobs():
+    with TokenPool(2, makeflags="") as pool:
+        jobserver = parse_makeflags(pool.environment()["MAKEFLAGS"])
+        assert jobserver["read_fd"] in pool.pass_fds()
+        tokens = [pool.acquire(), pool.acquire()]
+        assert tokens[0] is None
+        assert tokens[1] == TOKEN
+        assert is_empty(jobserver["read_fd"])
+        pool.release(tokens[1])
+        assert not is_empty(jobserver["read_fd"])
+
+
+def test_token_pool_joins_parent_jobserver():
+    read_fd, write_fd = os.pipe()
+    os.write(write_fd, b"x")
+    try:
+        with TokenPool(8, makeflags=f"-j2 --jobserver-auth={read_fd},{write_fd}") as pool:
+            # The parent jobserver is not replaced for the child processes.
+            assert "MAKEFLAGS" not in pool.environment() or pool.environment()["MAKEFLAGS"] == os.environ.get("MAKEFLAGS")
+            assert pool.acquire() is None
+            token = pool.acquire()
+            assert token == b"x"
+            assert is_empty(read_fd)
+            pool.release(token)
+        assert os.read(read_fd, 1) == b"x"
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
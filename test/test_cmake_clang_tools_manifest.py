@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_manifest import *
+
+
+def test_manifest_tracks_dependencies(tmpdir: Path):
+    directory = Path(tmpdir)
+    source = directory / "a.cpp"
+    header = directory / "a.hpp"
+    source.write_text('#include "a.hpp"\n')
+    header.write_text("int a;\n")
+    dependencies = [str(source), str(header)]
+
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert not manifest.is_up_to_date(source, "key")
+        manifest.update(source, "key", dependencies)
+
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert manifest.is_up_to_date(source, "key")
+        assert not manifest.is_up_to_date(source, "other key")
+
+    stat = header.stat()
+    os.utime(header, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert not manifest.is_up_to_date(source, "key")
+        manifest.update(source, "key", dependencies)
+        header.unlink()
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert not manifest.is_up_to_date(source, "key")
+
+
+def test_manifest_records_dependencies_before_processing(tmpdir: Path):
+    directory = Path(tmpdir)
+    source = directory / "a.cpp"
+    source.write_text("int a;\n")
+
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert not manifest.is_up_to_date(source, "key")
+        manifest.stat_dependencies([str(source)])
+        # The source is edited while it is processed.
+        stat = source.stat()
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        manifest.update(source, "key", [str(source)])
+    with DependencyManifest.open(str(directory)) as manifest:
+        assert not manifest.is_up_to_date(source, "key")
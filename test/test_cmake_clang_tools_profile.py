@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import json
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_profile import *
+
+
+def test_profiler_writes_trace_and_summary(tmpdir: Path):
+    profile_dir = str(tmpdir) + os.sep
+    profiler = Profiler(profile_dir, "clang-format")
+    assert profiler.trace_path == Path(tmpdir) / f"clang-format-{os.getpid()}{TRACE_SUFFIX}"
+    with profiler.span("load config"):
+        pass
+    for file in ["a.cpp", "b.cpp"]:
+        with profiler.span("file", FILE_CATEGORY, file=file):
+            with profiler.span("clang-format"):
+                pass
+    profiler.count("cache hits")
+    profiler.count("cache misses", 3)
+    profiler.write()
+
+    events = json.loads(profiler.trace_path.read_text())["traceEvents"]
+    assert all(event["ph"] == "X" and event["pid"] == os.getpid() for event in events)
+    assert [event["args"]["file"] for event in events if event["cat"] == FILE_CATEGORY] == ["a.cpp", "b.cpp"]
+    summary = json.loads(profiler.summary_path.read_text())
+    assert profiler.summary_path.name == f"clang-format-{os.getpid()}{SUMMARY_SUFFIX}"
+    assert summary["files"] == 2
+    assert {"load config", "clang-format", "imports"} <= set(summary["phases_s"])
+    assert summary["cache"] == {"hits": 1, "misses": 3, "hit_rate": 0.25}
+
+    aggregated = aggregate_summaries([summary, summary])
+    assert aggregated["processes"] == 2
+    assert aggregated["files"] == 4
+    assert aggregated["cache"]["hit_rate"] == 0.25
+
+
+def test_profile_path_and_disabled_spans(monkeypatch):
+    monkeypatch.delenv(PROFILE_ENVIRONMENT_VARIABLE, raising=False)
+    assert get_profile_path(["--error", "a.cpp"]) is None
+    assert get_profile_path(["--profile=trace.json", "a.cpp"]) == "trace.json"
+    monkeypatch.setenv(PROFILE_ENVIRONMENT_VARIABLE, "profile/")
+    assert get_profile_path(["a.cpp"]) == "profile/"
+    assert get_profile_path(["--profile", "trace.json", "a.cpp"]) == "trace.json"
+    # Without a profiler, the spans do nothing.
+    with span("phase"):
+        count("cache hits")
+
+
+def test_trim_profiles(tmpdir: Path):
+    profile_dir = Path(tmpdir)
+    for index in range(4):
+        for suffix in [TRACE_SUFFIX, SUMMARY_SUFFIX]:
+            path = profile_dir / f"clang-tidy-{index}{suffix}"
+            path.write_text("{}")
+            os.utime(path, (index, index))
+    (profile_dir / "merged.json").write_text("{}")
+    trim_profiles(profile_dir, 2)
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        f"clang-tidy-2{SUMMARY_SUFFIX}", f"clang-tidy-2{TRACE_SUFFIX}", f"clang-tidy-3{SUMMARY_SUFFIX}", f"clang-tidy-3{TRACE_SUFFIX}",
+        "merged.json"]
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import json
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_report import *
+
+
+def test_get_report_format():
+    assert get_report_format(Path("report.sarif")) == REPORT_FORMAT_SARIF
+    assert get_report_format(Path("report.jsonl")) == REPORT_FORMAT_JSONL
+    assert get_report_format(Path("report.sarif"), REPORT_FORMAT_JSONL) == REPORT_FORMAT_JSONL
+
+
+def test_jsonl_report_is_replaced(tmpdir: Path):
+    report_file = Path(tmpdir) / "report.jsonl"
+    report_file.write_text("{}\n")
+    with DiagnosticReport(report_file, REPORT_FORMAT_JSONL, "clang-format") as report:
+        record = report.add(Path("a.cpp"), 1, 2, "warning", "first")
+        # Every diagnostic is written immediately.
+        assert len(report_file.read_text().splitlines()) == 1
+        report.add(Path("b.cpp"), 3, 4, "error", "second", "readability-braces")
+
+    diagnostics = [json.loads(line) for line in report_file.read_text().splitlines()]
+    assert [diagnostic["message"] for diagnostic in diagnostics] == ["first", "second"]
+    assert diagnostics[0]["rule"] == "clang-format"
+    assert diagnostics[1]["rule"] == "readability-braces"
+    assert diagnostics[1]["line"] == 3 and diagnostics[1]["column"] == 4
+
+    # The recorded diagnostics are added to the next report as they were.
+    record_file = Path(tmpdir) / "a.cpp.report.json"
+    assert read_records(record_file) is None
+    write_records(record_file, [record])
+    with DiagnosticReport(report_file, REPORT_FORMAT_JSONL, "clang-format") as report:
+        for recorded in read_records(record_file):
+            report.add_record(recorded)
+    assert [json.loads(line) for line in report_file.read_text().splitlines()] == [diagnostics[0]]
+
+
+def test_sarif_report_is_valid_after_close(tmpdir: Path):
+    report_file = Path(tmpdir) / "report.sarif"
+    with DiagnosticReport(report_file, REPORT_FORMAT_SARIF, "clang-format") as report:
+        report.add(Path("a.cpp"), 1, 2, "warning", "first")
+        report.add(Path("b.cpp"), 3, 4, "error", "second")
+
+    document = json.loads(report_file.read_text())
+    results = document["runs"][0]["results"]
+    assert document["runs"][0]["tool"]["driver"]["name"] == "clang-format"
+    assert [result["message"]["text"] for result in results] == ["first", "second"]
+    assert results[1]["locations"][0]["physicalLocation"]["region"] == {"startLine": 3, "startColumn": 4}
+
+    with DiagnosticReport(report_file, REPORT_FORMAT_SARIF, "clang-format"):
+        pass
+    assert json.loads(report_file.read_text())["runs"][0]["results"] == []
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_settings import *
+
+
+def test_default_settings():
+    # The default config.yaml uses empty maps as empty lists.
+    index = SettingsIndex(compile_settings({"run_clang_format": True, "run_clang_tidy": False, "whitelist": {}, "blacklist": {}}))
+    assert index.should_run("project", "clang_format")
+    assert not index.should_run("project", "clang_tidy")
+    # Empty settings files do not run any tool.
+    assert not SettingsIndex(compile_settings(None)).should_run("project", "clang_format")
+
+
+def test_project_patterns():
+    names = [f"project_{index}" for index in range(100)]
+    settings = {"whitelist": names + ["ros_*", "re:nav(igation)?_.*"], "blacklist": ["project_7", "ros_test_*"]}
+    index = SettingsIndex(compile_settings(settings))
+    assert all(index.should_run(name, "clang_tidy") for name in names if name != "project_7")
+    assert not index.should_run("project_7", "clang_tidy")
+    assert not index.should_run("project_100", "clang_tidy")
+    assert index.should_run("ros_core", "clang_format")
+    assert not index.should_run("ros_test_core", "clang_format")
+    assert index.should_run("navigation_core", "clang_format")
+    assert index.should_run("nav_core", "clang_format")
+    assert not index.should_run("my_nav_core", "clang_format")
+
+
+def test_project_overrides():
+    settings = {"run_clang_tidy": False, "projects": {"core": {"run_clang_tidy": True}, "core_*": {"run_clang_format": False},
+                                                      "*": {"run_clang_tidy": True}, "legacy": {"run_clang_tidy": False}}}
+    index = SettingsIndex(compile_settings(settings))
+    assert index.should_run("core", "clang_tidy")
+    assert index.should_run("core", "clang_format")
+    assert not index.should_run("core_msgs", "clang_format")
+    assert index.should_run("core_msgs", "clang_tidy")
+    # Overrides of the project name take precedence over the ones of patterns.
+    assert not index.should_run("legacy", "clang_tidy")
+
+
+def test_open_settings_index(tmpdir: Path):
+    directory = Path(tmpdir)
+    settings_file = directory / "config.yaml"
+    settings_file.write_text("run_clang_tidy: true\nwhitelist: [first]\n")
+    index_dir = directory / "index"
+    assert SettingsIndex.open(settings_file, index_dir).should_run("first", "clang_tidy")
+    assert not SettingsIndex.open(settings_file, index_dir).should_run("second", "clang_tidy")
+    assert len(list(index_dir.glob("*.idx"))) == 1
+
+    # Changed settings are compiled again.
+    settings_file.write_text("run_clang_tidy: true\nwhitelist: [first, second]\n")
+    assert SettingsIndex.open(settings_file, index_dir).should_run("second", "clang_tidy")
+    assert len(list(index_dir.glob("*.idx"))) == 2
+
+    # Settings with the same size and modification time do not share their index.
+    other_file = directory / "other.yaml"
+    other_file.write_text("run_clang_tidy: true\nwhitelist: [first, fourth]\n")
+    os.utime(other_file, ns=(settings_file.stat().st_atime_ns, settings_file.stat().st_mtime_ns))
+    assert other_file.stat().st_size == settings_file.stat().st_size
+    assert not SettingsIndex.open(other_file, index_dir).should_run("second", "clang_tidy")
+    assert SettingsIndex.open(other_file, index_dir).should_run("fourth", "clang_tidy")
+
+
+def test_trim_indices(tmpdir: Path):
+    index_dir = Path(tmpdir)
+    for index in range(5):
+        (index_dir / f"{index}.idx").write_bytes(b"")
+        os.utime(index_dir / f"{index}.idx", (1000 + index, 1000 + index))
+    trim_indices(index_dir, 3)
+    assert sorted(file.name for file in index_dir.glob("*.idx")) == ["2.idx", "3.idx", "4.idx"]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+from pathlib import Path
+import sys
+import threading
+
+import pytest
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_cache import ResultCache
+from cmake_clang_tools_shared_store import *
+
+
+class StoreHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in of an HTTP store, keeping the entries in memory.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def send(self, status: int, body: bytes = b"") -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers["Content-Length"]))
+
+    def do_GET(self) -> None:
+        self.server.connections.add(self.client_address)
+        entry = self.server.entries.get(self.path)
+        self.send(200, entry) if entry is not None else self.send(404)
+
+    def do_PUT(self) -> None:
+        self.server.connections.add(self.client_address)
+        self.server.entries[self.path] = self.read_body()
+        self.send(201)
+
+    def do_POST(self) -> None:
+        self.server.connections.add(self.client_address)
+        keys = json.loads(self.read_body())
+        if not self.server.bulk:
+            self.send(405)
+            return
+        self.server.bulk_requests += 1
+        entries = {key: self.server.entries[f"/store/{key[:2]}/{key}"].decode("utf-8") for key in keys
+                   if f"/store/{key[:2]}/{key}" in self.server.entries}
+        self.send(200, json.dumps(entries).encode("utf-8"))
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StoreHandler)
+    server.entries = dict()
+    server.connections = set()
+    server.bulk = True
+    server.bulk_requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_http_store(server, bulk: bool):
+    server.bulk = bulk
+    store = open_shared_store(f"http://127.0.0.1:{server.server_address[1]}/store/")
+    assert isinstance(store, HttpStore)
+    keys = [f"{index:02x}key" for index in range(10)]
+    for key in keys[:5]:
+        store.put(key, f'"{key}"'.encode("utf-8"))
+    assert store.get(keys[0]) == b'"00key"'
+    assert store.get(keys[9]) is None
+    assert store.get_many(keys) == {key: f'"{key}"'.encode("utf-8") for key in keys[:5]}
+    assert server.bulk_requests == (1 if bulk else 0)
+    assert (store.hits, store.misses, store.stores, store.errors) == (6, 6, 5, 0)
+    # All requests of a thread share one connection.
+    assert len(server.connections) == 1
+
+
+def test_unreachable_http_store_is_disabled():
+    store = open_shared_store("http://127.0.0.1:1/store")
+    for _ in range(MAX_ERRORS + 2):
+        assert store.get("00key") is None
+    assert store.disabled
+    assert store.errors == MAX_ERRORS
+    stream = io.StringIO()
+    print_shared_store_summary("clang-tidy", store, stream)
+    assert "(disabled)" in stream.getvalue()
+
+
+def test_result_cache_with_shared_store(tmpdir: Path):
+    directory = Path(tmpdir)
+    shared_dir = directory / "shared"
+    # Two checkouts in different directories share the results of their files.
+    first = ResultCache(directory / "first", shared_store=open_shared_store(str(shared_dir)), base_dir=str(directory / "ws1"))
+    key = first.normalize(str(directory / "ws1" / "src" / "a.cpp"))
+    assert key == "src/a.cpp"
+    first.put(key, {"output": f"{directory / 'ws1' / 'src' / 'a.cpp'}:1:1: warning"})
+
+    second = ResultCache(directory / "second", shared_store=open_shared_store(f"file://{shared_dir}"),
+                         base_dir=str(directory / "ws2"))
+    second.prefetch([key])
+    assert second.shared_store.hits == 1
+    assert second.get(key) == {"output": f"{directory / 'ws2' / 'src' / 'a.cpp'}:1:1: warning"}
+    assert (second.hits, second.misses) == (1, 0)
+    assert second.get("00missing") is None
+    assert second.shared_store.misses == 1
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import json
+import os
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_slim_database import *
+
+# Compiler writing an empty precompiled header and a depfile listing the header, logging its invocations.
+FAKE_COMPILER = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/compiler.log"
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -o) output="$2"; shift ;;
+    -MF) depfile="$2"; shift ;;
+    -x) shift; header="$2" ;;
+  esac
+  shift
+done
+touch "$output"
+echo "$output: $header" > "$depfile"
+"""
+
+
+def create_compiler(directory: Path, content: str) -> str:
+    compiler = directory / "clang++"
+    compiler.write_text(content)
+    compiler.chmod(0o755)
+    return str(compiler)
+
+
+def test_slim_arguments():
+    arguments = ["/usr/bin/c++", "-DNDEBUG", "-I/pkg/include", "-I", "/opt/ros/include", "-Irelative", "-isystem", "/usr/include/eigen3",
+                 "-O2", "-g", "-fsanitize=address", "-flto=thin", "-ffunction-sections", "--coverage", "-std=c++17", "-MD", "-MT",
+                 "a.o", "-MF", "a.o.d", "-o", "a.o", "-c", "/pkg/src/a.cpp"]
+    assert slim_arguments(arguments, "/pkg/build", ["/pkg"]) == \
+        ["/usr/bin/c++", "-D__OPTIMIZE__=1", "-U__NO_INLINE__", "-DNDEBUG", "-I/pkg/include", "-isystem", "/opt/ros/include",
+         "-Irelative", "-isystem", "/usr/include/eigen3", "-std=c++17", "/pkg/src/a.cpp"]
+    assert slim_arguments(["c++", "-Os", "-gcc-toolchain", "/gcc", "a.cpp"], "/pkg", ["/pkg"]) == \
+        ["c++", "-D__OPTIMIZE_SIZE__=1", "-D__OPTIMIZE__=1", "-U__NO_INLINE__", "-gcc-toolchain", "/gcc", "a.cpp"]
+    assert slim_arguments(["c++", "-O0", "-ggdb", "a.cpp"], "/pkg", ["/pkg"]) == ["c++", "a.cpp"]
+
+
+def test_get_pch_compiler():
+    assert get_pch_compiler("clang-tidy") == "clang++"
+    assert get_pch_compiler("/usr/bin/clang-tidy-14") == "/usr/bin/clang++-14"
+    assert get_pch_compiler("/opt/tidy") == "clang++"
+
+
+def test_write_slim_compile_database(tmpdir: Path):
+    directory = Path(tmpdir)
+    header = directory / "third_party.hpp"
+    header.write_text("#include <vector>\n")
+    compiler = create_compiler(directory, FAKE_COMPILER)
+    compile_database = CompileDatabase([
+        {"directory": str(directory), "file": "a.cpp", "command": "c++ -O2 -I/opt/include -o a.o -c a.cpp"},
+        {"directory": str(directory), "file": "b.cpp", "command": "c++ -O2 -I/opt/include -o b.o -c b.cpp"},
+        {"directory": str(directory), "file": "c.c", "command": "cc -O2 -o c.o -c c.c"}])
+    precompiled_headers = PrecompiledHeaders(header, compiler, directory / PCH_DIR)
+    slim_directory = write_slim_compile_database(compile_database, str(directory), [str(directory)], precompiled_headers)
+    entries = json.loads((slim_directory / COMPILE_COMMANDS_FILE).read_text())
+
+    # Translation units with the same flags share one precompiled header, C files do not include it.
+    assert entries[0]["arguments"][:3] == entries[1]["arguments"][:3]
+    pch_file = entries[0]["arguments"][2]
+    assert entries[0]["arguments"] == ["c++", "-include-pch", pch_file, "-D__OPTIMIZE__=1", "-U__NO_INLINE__", "-isystem",
+                                       "/opt/include", "a.cpp"]
+    assert entries[2]["arguments"] == ["cc", "-D__OPTIMIZE__=1", "-U__NO_INLINE__", "c.c"]
+    assert len((directory / "compiler.log").read_text().splitlines()) == 1
+
+    # Up to date databases and precompiled headers are not written again.
+    mtime = (slim_directory / COMPILE_COMMANDS_FILE).stat().st_mtime_ns
+    precompiled_headers = PrecompiledHeaders(header, compiler, directory / PCH_DIR)
+    assert write_slim_compile_database(compile_database, str(directory), [str(directory)], precompiled_headers) == slim_directory
+    assert (slim_directory / COMPILE_COMMANDS_FILE).stat().st_mtime_ns == mtime
+    assert len((directory / "compiler.log").read_text().splitlines()) == 1
+
+    # A changed header is precompiled again.
+    header.write_text("#include <map>\n")
+    os.utime(header, ns=(0, Path(pch_file).stat().st_mtime_ns + 1000000))
+    precompiled_headers = PrecompiledHeaders(header, compiler, directory / PCH_DIR)
+    assert write_slim_compile_database(compile_database, str(directory), [str(directory)], precompiled_headers) != slim_directory
+    assert len((directory / "compiler.log").read_text().splitlines()) == 2
+
+
+def test_failing_precompiled_header(tmpdir: Path, capsys):
+    directory = Path(tmpdir)
+    header = directory / "third_party.hpp"
+    header.write_text("#error\n")
+    compiler = create_compiler(directory, "#!/bin/sh\necho 'third_party.hpp:1:2: error'\nexit 1\n")
+    compile_database = CompileDatabase([{"directory": str(directory), "file": "a.cpp", "arguments": ["c++", "-c", "a.cpp"]}])
+    slim_directory = write_slim_compile_database(compile_database, str(directory), [str(directory)],
+                                                 PrecompiledHeaders(header, compiler, directory / PCH_DIR))
+    assert json.loads((slim_directory / COMPILE_COMMANDS_FILE).read_text())[0]["arguments"] == ["c++", "a.cpp"]
+    assert "could not be built" in capsys.readouterr().err
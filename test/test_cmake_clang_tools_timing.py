@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import io
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_timing import *
+
+
+def test_timing_database_predicts_durations(tmpdir: Path):
+    path = Path(tmpdir) / "timings.sqlite"
+    with TimingDatabase(path) as database:
+        assert database.predict("clang_tidy", Path("a.cpp"), "config") is None
+        database.record("clang_tidy", Path("a.cpp"), "config", 10.0)
+        database.record("clang_tidy", Path("a.cpp"), "config", 20.0)
+
+    with TimingDatabase(path) as database:
+        assert database.predict("clang_tidy", Path("a.cpp"), "config") == 15.0
+        # Timings of other configurations are used if the configuration has no timing.
+        assert database.predict("clang_tidy", Path("a.cpp"), "other config") == 15.0
+        database.record("clang_tidy", Path("a.cpp"), "other config", 1.0)
+        assert database.predict("clang_tidy", Path("a.cpp"), "config") == 15.0
+        assert database.predict("clang_tidy", Path("a.cpp"), "other config") == 1.0
+        assert database.predict("clang_format", Path("a.cpp"), "config") is None
+
+
+def test_order_longest_first(tmpdir: Path):
+    directory = Path(tmpdir)
+    files = [directory / name for name in ["fast.cpp", "slow.cpp", "new.cpp", "new_large.cpp"]]
+    for file in files:
+        file.write_text("int a;\n")
+    files[3].write_text("int a;\n" * 10)
+    with TimingDatabase(directory / "timings.sqlite") as database:
+        database.record("clang_tidy", files[0], "config", 1.0)
+        database.record("clang_tidy", files[1], "config", 60.0)
+        ordered_files, predictions = database.order_longest_first("clang_tidy", files, "config")
+    # Files without timings are started first, since they might be the longest.
+    assert ordered_files == [files[3], files[2], files[1], files[0]]
+    assert predictions == {files[0]: 1.0, files[1]: 60.0}
+
+
+def test_print_timing_summary():
+    stream = io.StringIO()
+    print_timing_summary("clang-tidy", {Path("a.cpp"): 1.0}, {Path("a.cpp"): 2.0}, 2.0, stream)
+    assert stream.getvalue() == ""
+    print_timing_summary("clang-tidy", {Path("a.cpp"): 1.0}, {Path("a.cpp"): 2.0, Path("b.cpp"): 3.0}, 3.0, stream)
+    assert stream.getvalue() == "[clang-tidy] Timing: 2 files took 5.0 s in 3.0 s wall clock time, 1 files with history took 2.0 s " \
+                                "(predicted 1.0 s), longest: b.cpp (3.0 s).\n"
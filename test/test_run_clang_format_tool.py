@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import json
+import os
+import subprocess
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from run_clang_format_tool import *
+from synthetic_workspace import STUB_CLANG_FORMAT
+
+
+def test_convert_replacements_to_errors(tmpdir: Path):
+    file = Path(tmpdir) / "file.cpp"
+    file.write_bytes(b"int  a;\nint b ;\n")
+    replacements = [Replacement(offset=3, length=2, text=" "), Replacement(offset=13, length=1, text="")]
+    errors = convert_replacements_to_errors(file, replacements)
+    assert errors == [Error(line=0, column=3, found="  ", expected=" "), Error(line=1, column=5, found=" ", expected="")]
+
+
+def test_convert_replacements_to_errors_non_ascii(tmpdir: Path):
+    file = Path(tmpdir) / "file.cpp"
+    content = "// äöü\nauto s = \"€\";  int a;\n".encode("utf-8")
+    file.write_bytes(content)
+    offset = content.index(b";  int") + 1
+    errors = convert_replacements_to_errors(file, [Replacement(offset=offset, length=2, text="\n")])
+    # The column is counted in characters, while the offset of clang-format is in bytes.
+    assert errors == [Error(line=1, column=13, found="  ", expected="\n")]
+
+
+def test_convert_replacements_to_errors_end_of_file():
+    content = b"int a;"
+    errors = convert_replacements_to_errors(Path("unused"), [Replacement(offset=6, length=0, text="\n")], content)
+    assert errors == [Error(line=0, column=6, found="", expected="\n")]
+
+
+def measure_conversion(line_count: int) -> float:
+    content = b"int  value;\n" * line_count
+    replacements = [Replacement(offset=line * 12 + 3, length=2, text=" ") for line in range(line_count)]
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        errors = convert_replacements_to_errors(Path("unused"), replacements, content)
+        best = min(best, time.perf_counter() - start)
+    assert len(errors) == line_count
+    return best
+
+
+def test_convert_replacements_to_errors_scales_linearly():
+    # Micro-benchmark: Eight times the replacements may take at most about eight times longer (with margin for noise).
+    # A quadratic implementation would take about 64 times longer.
+    small = measure_conversion(5000)
+    large = measure_conversion(40000)
+    assert large / small < 24
+
+
+def test_apply_replacements():
+    content = "int  ä;\nint b ;\n".encode("utf-8")
+    replacements = [Replacement(offset=14, length=1, text=None), Replacement(offset=3, length=2, text=" ")]
+    assert apply_replacements(content, replacements) == "int ä;\nint b;\n".encode("utf-8")
+
+
+def test_fix_file_only_writes_changes(tmpdir: Path):
+    file = Path(tmpdir) / "file.cpp"
+    file.write_bytes(b"int  a;\n")
+    file.chmod(0o640)
+    os.utime(file, ns=(1000000000, 1000000000))
+    fix_file(file, file.read_bytes(), list())
+    assert file.stat().st_mtime_ns == 1000000000
+
+    fix_file(file, file.read_bytes(), [Replacement(offset=3, length=2, text=" ")])
+    assert file.read_bytes() == b"int a;\n"
+    assert file.stat().st_mode & 0o777 == 0o640
+
+
+def test_changed_lines_are_passed_to_clang_format(tmpdir: Path):
+    directory = Path(tmpdir)
+    executable = directory / "clang-format"
+    executable.write_text(f"#!/bin/sh\necho \"$@\" >> {directory / 'arguments.txt'}\necho \"<replacements></replacements>\"\n")
+    executable.chmod(0o755)
+    files = [directory / "changed.cpp", directory / "untracked.cpp"]
+    for file in files:
+        file.write_text("int a;\n")
+    changed_lines = {str(files[0]): [(1, 2), (5, 5)], str(files[1]): None}
+    list(iterate_clang_format(str(executable), files, "file", False, changed_lines=changed_lines))
+    arguments = (directory / "arguments.txt").read_text().splitlines()
+    assert arguments == [f"--style=file --output-replacements-xml --lines=1:2 --lines=5:5 {files[0]}",
+                         f"--style=file --output-replacements-xml {files[1]}"]
+
+
+def test_replacement_stream_parser():
+    output = b"<?xml version='1.0'?>\n<replacements xml:space='preserve' incomplete_format='false'>\n" \
+             b"<replacement offset='3' length='2'> </replacement>\n</replacements>\n" \
+             b"<?xml version='1.0'?>\n<replacements xml:space='preserve' incomplete_format='false'>\n</replacements>\n" \
+             b"<?xml version='1.0'?>\n<replacements xml:space='preserve' incomplete_format='false'>\n" \
+             b"<replacement offset='0' length='0'>&lt;/replacements&gt;&#10;</replacement>\n</replacements>\n"
+    # The documents are split correctly for every size of the read parts.
+    for read_size in [1, 7, len(output)]:
+        parser = ReplacementStreamParser()
+        replacements = list()
+        for start in range(0, len(output), read_size):
+            replacements += parser.feed(output[start:start + read_size])
+        parser.close()
+        assert replacements == [(0, Replacement(3, 2, " ")), (2, Replacement(0, 0, "</replacements>\n"))]
+        assert parser.documents == 3
+
+    parser = ReplacementStreamParser()
+    parser.feed(output[:100])
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_iterate_replacements():
+    output = b"<?xml version='1.0'?>\n<replacements xml:space='preserve' incomplete_format='false'>\n" + \
+             b"".join(b"<replacement offset='%d' length='1'>  </replacement>\n" % offset for offset in range(1000)) + \
+             b"</replacements>\n"
+    parts = [output[start:start + 100] for start in range(0, len(output), 100)]
+    parser = ReplacementPullParser()
+    replacements = list()
+    for part in parts:
+        replacements += parser.feed(part)
+        # Parsed replacements are not kept in the element tree.
+        assert parser._root is None or len(parser._root) <= 1
+    replacements += parser.close()
+    assert replacements == [Replacement(offset, 1, "  ") for offset in range(1000)]
+    assert list(iterate_replacements(parts)) == replacements
+    assert list(iterate_replacements([b"", b"\n"])) == list()
+
+
+def test_error_converter():
+    content = "int  ä;\n\nint b ;\n".encode("utf-8")
+    replacements = [Replacement(offset=3, length=2, text=" "), Replacement(offset=15, length=1, text=None),
+                    Replacement(offset=9, length=0, text="\n")]
+    converter = ErrorConverter(content)
+    # Unordered replacements are converted as well.
+    assert [converter.convert(replacement) for replacement in replacements] == \
+        [Error(line=0, column=3, found="  ", expected=" "), Error(line=2, column=5, found=" ", expected=""),
+         Error(line=1, column=0, found="", expected="\n")]
+
+
+def test_execute_clang_format_streams_replacements(tmpdir: Path, monkeypatch):
+    file = Path(tmpdir) / "file.cpp"
+    file.write_text("int a;\n")
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "3")
+    assert list(execute_clang_format(str(STUB_CLANG_FORMAT), file, "file")) == \
+        [Replacement(offset, 1, "  ") for offset in [0, 64, 128]]
+
+    executable = Path(tmpdir) / "clang-format"
+    executable.write_text("#!/bin/sh\nexit 1\n")
+    executable.chmod(0o755)
+    with pytest.raises(subprocess.CalledProcessError):
+        list(execute_clang_format(str(executable), file, "file"))
+
+
+def test_execute_clang_format_files_streams_replacements(tmpdir: Path, monkeypatch):
+    files = [Path(tmpdir) / f"{index}.cpp" for index in range(3)]
+    for file in files:
+        file.write_text("int a;\n")
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "2")
+    replacements = execute_clang_format_files(str(STUB_CLANG_FORMAT), files, "file")
+    # The replacements of the first file are available before the output of the others is parsed.
+    assert next(replacements) == (0, Replacement(0, 1, "  "))
+    assert list(replacements) == [(0, Replacement(64, 1, "  ")), (1, Replacement(0, 1, "  ")), (1, Replacement(64, 1, "  ")),
+                                  (2, Replacement(0, 1, "  ")), (2, Replacement(64, 1, "  "))]
+
+
+def test_create_chunks(tmpdir: Path):
+    files = list()
+    for index, size in enumerate([10, 10, 30, 5, 5, 5]):
+        files.append(Path(tmpdir) / f"{index}.cpp")
+        files[-1].write_bytes(b" " * size)
+    assert create_chunks(files, 20) == [files[:2], files[2:3], files[3:]]
+    assert create_chunks(files, 1000) == [files]
+    # The chunks are made smaller, such that every job gets work.
+    assert create_chunks(files, 1000, 2) == [files[:2], files[2:3], files[3:]]
+    assert create_chunks(list(), 20) == list()
+
+
+def test_iterate_clang_format_chunks(tmpdir: Path):
+    directory = Path(tmpdir)
+    executable = directory / "clang-format"
+    executable.write_text(f"#!/bin/sh\necho \"$@\" >> {directory / 'arguments.txt'}\n"
+                          f"STUB_CLANG_FORMAT_REPLACEMENTS=3 exec {STUB_CLANG_FORMAT} \"$@\"\n")
+    executable.chmod(0o755)
+    files = [directory / f"{index}.cpp" for index in range(5)]
+    for file in files:
+        file.write_bytes(b"int a;\n" * 20)
+    changed_lines = {str(files[2]): [(1, 1)]}
+    results = list(iterate_clang_format(str(executable), files, "file", False, changed_lines=changed_lines, chunk_size=1000))
+
+    # Files with changed lines are checked on their own, the others in chunks. The errors are reported in the order of the files.
+    assert [file for file, _ in results] == files
+    assert all(len(errors) == 3 for _, errors in results)
+    arguments = (directory / "arguments.txt").read_text().splitlines()
+    assert arguments == [f"--style=file --output-replacements-xml {files[0]} {files[1]}",
+                         f"--style=file --output-replacements-xml --lines=1:1 {files[2]}",
+                         f"--style=file --output-replacements-xml {files[3]} {files[4]}"]
+
+
+def test_fixes_are_not_replayed_from_shared_store(tmpdir: Path, monkeypatch):
+    directory = Path(tmpdir)
+    file = directory / "file.cpp"
+    file.write_bytes(b"int a;\n")
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "0")
+    fixed_replacements = list()
+    monkeypatch.setattr(sys.modules["run_clang_format_tool"], "fix_file",
+                        lambda file, file_content, replacements: fixed_replacements.append(replacements))
+
+    for chunk_size in [0, DEFAULT_CHUNK_SIZE]:
+        # Inject a replacement for the file into the shared store, under the key of its result.
+        shared_dir = directory / f"shared{chunk_size}"
+        other = ResultCache(directory / f"other{chunk_size}", shared_store=open_shared_store(str(shared_dir)))
+        key = hash_parts("clang-format", other.tool_version(str(STUB_CLANG_FORMAT)), read_style_config(directory, "file"),
+                         file.read_bytes(), None)
+        other.put(key, [[0, 6, "system(\"rm -rf /\");"]])
+
+        # Checking reports the shared result and copies it to the local cache.
+        cache = ResultCache(directory / f"cache{chunk_size}", shared_store=open_shared_store(str(shared_dir)))
+        assert list(iterate_clang_format(str(STUB_CLANG_FORMAT), [file], "file", False, cache=cache, chunk_size=chunk_size)) == \
+            [(file, [Error(line=0, column=0, found="int a;", expected="system(\"rm -rf /\");")])]
+        assert cache.shared_store.hits == 1
+
+        # Fixing runs clang-format instead of applying the shared result.
+        cache = ResultCache(directory / f"cache{chunk_size}", shared_store=open_shared_store(str(shared_dir)))
+        assert list(iterate_clang_format(str(STUB_CLANG_FORMAT), [file], "file", True, cache=cache, chunk_size=chunk_size)) == \
+            [(file, list())]
+        assert cache.shared_store.hits == 0
+    assert fixed_replacements == list()
+
+
+@pytest.mark.parametrize("chunk_size", [0, 1])
+def test_iterate_clang_format_reports_in_file_order(tmpdir: Path, chunk_size: int):
+    directory = Path(tmpdir)
+    executable = directory / "clang-format"
+    # The first file takes the longest, such that the files started after it finish first.
+    executable.write_text(f"#!/bin/sh\ncase \"$*\" in *0.cpp*) sleep 0.3 ;; esac\necho \"$@\" >> {directory / 'arguments.txt'}\n"
+                          f"STUB_CLANG_FORMAT_REPLACEMENTS=1 exec {STUB_CLANG_FORMAT} \"$@\"\n")
+    executable.chmod(0o755)
+    files = [directory / f"{index}.cpp" for index in range(4)]
+    for file in files:
+        file.write_bytes(b"int a;\n")
+    start_order = [files[0], files[3], files[2], files[1]]
+    results = list(iterate_clang_format(str(executable), files, "file", False, jobs=4, chunk_size=chunk_size, start_order=start_order))
+    assert [file for file, _ in results] == files
+    assert all(len(errors) == 1 for _, errors in results)
+    # The results of the other files were buffered until the first file finished.
+    assert (directory / "arguments.txt").read_text().splitlines()[-1].endswith("0.cpp")
+
+    # A single token of the pool runs the files one after the other, the first file is started first and finishes first.
+    (directory / "arguments.txt").unlink()
+    with TokenPool(1, makeflags="") as token_pool:
+        results = list(iterate_clang_format(str(executable), files, "file", False, jobs=4, chunk_size=chunk_size,
+                                            start_order=start_order, token_pool=token_pool))
+    assert [file for file, _ in results] == files
+    assert (directory / "arguments.txt").read_text().splitlines()[0].endswith("0.cpp")
+
+
+def test_report_covers_unchecked_files(tmpdir: Path, monkeypatch):
+    sources = [Path(tmpdir) / "a.cpp", Path(tmpdir) / "b.cpp"]
+    for source in sources:
+        source.write_text("int a;\n" * 40)
+    report_file = Path(tmpdir) / "report.sarif"
+    arguments = ["run_clang_format_tool.py", f"--clang-format={STUB_CLANG_FORMAT}", "--no-cache", "--no-timings",
+                 f"--report-file={report_file}", *map(str, sources)]
+    monkeypatch.setattr(sys, "argv", arguments)
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "2")
+    # The command of every source would replace the report of the others.
+    with pytest.raises(SystemExit, match="requires the batch mode"):
+        main()
+    assert not report_file.exists()
+
+    stamp_dir = Path(tmpdir) / "stamps"
+    stamp_dir.mkdir()
+    monkeypatch.setattr(sys, "argv", arguments + [f"--stamp-dir={stamp_dir}", "--project-name=project"])
+    main()
+    later = time.time() + 10
+    os.utime(sources[1], (later, later))
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "1")
+    # The unchanged file is not checked again, its errors are added from the record of its last check.
+    main()
+    results = json.loads(report_file.read_text())["runs"][0]["results"]
+    uris = sorted(result["locations"][0]["physicalLocation"]["artifactLocation"]["uri"] for result in results)
+    assert uris == [sources[0].as_uri()] * 2 + [sources[1].as_uri()]
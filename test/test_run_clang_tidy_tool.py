@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import json
+from pathlib import Path
+import re
+import sys
+
+import pytest
+import yaml
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from run_clang_tidy_tool import *
+from synthetic_workspace import STUB_CLANG_TIDY, generate_package
+
+
+def get_diagnostic(name: str, file_path: str, offset: int) -> dict:
+    return {"DiagnosticName": name,
+            "DiagnosticMessage": {"Message": name, "FilePath": file_path, "FileOffset": offset, "Replacements": []},
+            "Level": "Warning"}
+
+
+def test_merge_fixes_deduplicates(tmpdir: Path):
+    build_directory = Path(tmpdir)
+    header_diagnostic = get_diagnostic("misc-header", "/include/header.hpp", 10)
+    for source in ["a.cpp", "b.cpp"]:
+        source_path = build_directory / source
+        source_path.touch()
+        fixes = {"MainSourceFile": str(source_path),
+                 "Diagnostics": [header_diagnostic, get_diagnostic("misc-source", str(source_path), 1)]}
+        shard = get_fixes_shard_path(str(build_directory), source_path)
+        shard.parent.mkdir(parents=True, exist_ok=True)
+        shard.write_text(json.dumps(fixes))
+
+    merge_fixes(str(build_directory))
+    merged = yaml.safe_load((build_directory / FIXES_FILE).read_text())
+    names = sorted(diagnostic["DiagnosticName"] for diagnostic in merged["Diagnostics"])
+    assert names == ["misc-header", "misc-source", "misc-source"]
+
+
+def test_merge_fixes_drops_deleted_sources(tmpdir: Path):
+    build_directory = Path(tmpdir)
+    source_path = build_directory / "deleted.cpp"
+    shard = get_fixes_shard_path(str(build_directory), source_path)
+    shard.parent.mkdir(parents=True, exist_ok=True)
+    shard.write_text(json.dumps({"MainSourceFile": str(source_path), "Diagnostics": [get_diagnostic("misc", str(source_path), 1)]}))
+
+    merge_fixes(str(build_directory))
+    assert not shard.exists()
+    assert yaml.safe_load((build_directory / FIXES_FILE).read_text())["Diagnostics"] == []
+
+
+def test_get_owner_preference():
+    translation_units = ["/pkg/src/b.cpp", "/other/src/a.cpp", "/pkg/src/a.cpp", "/pkg/test/c.cpp", "/pkg/src/detail/d.cpp"]
+    assert get_owner_preference("/pkg/include/pkg/a.hpp", translation_units) == \
+        ["/pkg/src/a.cpp", "/other/src/a.cpp", "/pkg/src/b.cpp", "/pkg/src/detail/d.cpp", "/pkg/test/c.cpp"]
+    assert get_owner_preference("/pkg/src/detail/x.hpp", translation_units)[:2] == ["/pkg/src/detail/d.cpp", "/pkg/src/a.cpp"]
+
+
+def test_create_header_ownership_filters(tmpdir: Path):
+    directory = Path(tmpdir)
+    package = directory / "pkg"
+    for file in ["include/pkg/a.hpp", "include/pkg/b.hpp", "src/a.cpp", "src/b.cpp", "src/c.cpp"]:
+        (package / file).parent.mkdir(parents=True, exist_ok=True)
+        (package / file).write_text("")
+    (directory / "link").symlink_to(package / "include")
+    build_directory = package / "build"
+    build_directory.mkdir()
+    # The headers are included through a relative include directory, a '..' segment and a symbolic link.
+    depfiles = {"a": "../src/a.cpp ../include/pkg/a.hpp ../include/pkg/b.hpp", "b": "../src/b.cpp ../src/../include/pkg/b.hpp",
+                "c": f"../src/c.cpp {directory / 'link' / 'pkg' / 'b.hpp'}"}
+    entries = list()
+    for name, dependencies in depfiles.items():
+        (build_directory / f"{name}.d").write_text(f"{name}.o: {dependencies}\n")
+        entries.append({"directory": str(build_directory), "file": f"../src/{name}.cpp",
+                        "arguments": ["c++", "-I../include", "-MF", f"{name}.d", "-c", f"../src/{name}.cpp"]})
+    (build_directory / "compile_commands.json").write_text(json.dumps(entries))
+    sources = [package / "src" / f"{name}.cpp" for name in depfiles]
+    header_filter = create_header_filter("", [str(package / "include")], list())
+
+    # The headers of a file are owned by the source named like the header, whose dependencies are the only other ones needed.
+    compile_database = CompileDatabase.load(str(build_directory))
+    header_filters = create_header_ownership_filters(sources[2:], sources, compile_database, header_filter)
+    assert header_filters == {str(sources[2]): NO_HEADER_FILTER}
+    assert str(sources[0]) not in compile_database._dependencies
+
+    header_filters = create_header_ownership_filters(sources, sources, CompileDatabase.load(str(build_directory)), header_filter)
+    header_a, header_b = str(package / "include" / "pkg" / "a.hpp"), str(package / "include" / "pkg" / "b.hpp")
+    assert re.match(header_filters[str(sources[0])], header_a)
+    assert re.match(header_filters[str(sources[0])], "../include/pkg/a.hpp")
+    assert not re.match(header_filters[str(sources[0])], "../include/pkg/b.hpp")
+    assert re.match(header_filters[str(sources[1])], "../src/../include/pkg/b.hpp")
+    assert re.match(header_filters[str(sources[1])], header_b)
+    assert not re.match(header_filters[str(sources[1])], header_a)
+    assert header_filters[str(sources[2])] == NO_HEADER_FILTER
+
+
+def test_build_clang_tidy_command_arguments():
+    config = json.dumps({"Checks": "-*,misc-*", "CheckOptions": [{"key": "a", "value": "it's \"quoted\""}]})
+    command = build_clang_tidy_command("clang-tidy", [Path("/src/a b.cpp")], config, "/build", "^/src/", True, False, "")
+    assert command == ["clang-tidy", f"--config={config}", "-p=/build", "--header-filter=^/src/",
+                       "--export-fixes=/build/clang-tidy-fixes.yaml", "--extra-arg=-w", "--warnings-as-errors=*", "/src/a b.cpp"]
+
+
+def test_filter_changed_translation_units(tmpdir: Path):
+    package = generate_package(Path(tmpdir), source_count=4, header_count=4, include_depth=1, large_file_lines=10)
+    compile_database = CompileDatabase.load(str(package.build_directory))
+    # Sources 0 and 2 include the headers 0 and 2, which include the headers 1 and 3.
+    changed_lines = {str(package.sources[3]): [(1, 1)], str(package.headers[1]): None, str(package.sources[2]): []}
+    assert filter_changed_translation_units(package.sources, changed_lines, compile_database) == [package.sources[0],
+                                                                                                   package.sources[1],
+                                                                                                   package.sources[3]]
+
+
+def test_build_clang_tidy_command_line_filter():
+    command = build_clang_tidy_command("clang-tidy", [Path("/src/a.cpp")], "", "/build", "", False, False, "", "/fixes.yaml",
+                                       '[{"name":"/src/a.cpp","lines":[[1,2]]}]')
+    assert command[-2:] == ['--line-filter=[{"name":"/src/a.cpp","lines":[[1,2]]}]', "/src/a.cpp"]
+
+
+def test_build_clang_tidy_command_compile_database_directory():
+    command = build_clang_tidy_command("clang-tidy", [Path("/src/a.cpp")], "", "/build", "", False, False, "",
+                                       compile_database_directory="/build/clang-tidy-slim-0123")
+    assert "-p=/build/clang-tidy-slim-0123" in command
+    assert "--export-fixes=/build/clang-tidy-fixes.yaml" in command
+
+
+def test_dependencies_from_preprocessor(tmpdir: Path):
+    directory = Path(tmpdir)
+    # Preprocessor listing the headers of the system include directories only with '-M', like the compilers.
+    compiler = directory / "c++"
+    compiler.write_text('#!/bin/sh\nfor argument in "$@"; do\n  case "$argument" in\n'
+                        '    -M) echo "a.o: a.cpp include/a.hpp /opt/other/include/other.hpp"; exit 0 ;;\n'
+                        '    -MM) echo "a.o: a.cpp include/a.hpp"; exit 0 ;;\n  esac\ndone\nexit 1\n')
+    compiler.chmod(0o755)
+    # The dependency file of the compile command was not written yet.
+    arguments = [str(compiler), "-isystem", "/opt/other/include", "-MD", "-MF", "a.o.d", "-o", "a.o", "-c", "a.cpp"]
+    (directory / "compile_commands.json").write_text(json.dumps([{"directory": str(directory), "file": "a.cpp", "arguments": arguments}]))
+    compile_database = CompileDatabase.load(str(directory))
+    assert compile_database.dependencies(directory / "a.cpp") == [str(directory / "a.cpp"), str(directory / "include" / "a.hpp"),
+                                                                  "/opt/other/include/other.hpp"]
+
+
+def test_summary_covers_unchecked_translation_units(tmpdir: Path, monkeypatch, capsys):
+    package = generate_package(Path(tmpdir), source_count=2, header_count=1, large_file_lines=100)
+    summary_file = Path(tmpdir) / "summary.json"
+    arguments = ["run_clang_tidy_tool.py", f"--clang-tidy={STUB_CLANG_TIDY}", f"--build-directory={package.build_directory}",
+                 "--header-dirs=", "--exclude-header-dirs=", "--no-cache", "--no-timings", f"--summary-file={summary_file}",
+                 *map(str, package.sources)]
+    monkeypatch.setattr(sys, "argv", arguments)
+    # Every command of the per-source mode would replace the summary of the others.
+    with pytest.raises(SystemExit, match="requires the batch"):
+        main()
+
+    monkeypatch.setattr(sys, "argv", arguments + ["--incremental"])
+    for checked_count in [4, 0]:
+        with pytest.raises(SystemExit, match="0"):
+            main()
+        # The second run does not check the unchanged translation units again.
+        assert capsys.readouterr().out.count("stub diagnostic") == checked_count
+        assert json.loads(summary_file.read_text())["diagnostics"] == 4
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import sys
+
+import pytest
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from run_clang_tools_watch import *
+from synthetic_workspace import STUB_CLANG_FORMAT, STUB_CLANG_TIDY, generate_package
+
+
+@pytest.mark.parametrize("watcher_type", [InotifyWatcher, lambda files: PollingWatcher(files, 0.01)])
+def test_watcher(tmpdir: Path, watcher_type):
+    directory = Path(tmpdir)
+    watched, other = directory / "watched.cpp", directory / "other.cpp"
+    watched.write_text("int a;\n")
+    watcher = watcher_type([str(watched)])
+    try:
+        assert watcher.read(0.05) == set()
+        other.write_text("int b;\n")
+        # Editors saving to a temporary file rename it to the watched file.
+        (directory / "watched.cpp.tmp").write_text("int  a;\n")
+        (directory / "watched.cpp.tmp").rename(watched)
+        changed_files = set()
+        for _ in range(10):
+            changed_files |= watcher.read(0.1)
+        assert changed_files == {str(watched)}
+    finally:
+        watcher.close()
+
+
+def create_job(package, tool: str, arguments: List[str]) -> WorkspaceJob:
+    stamp_dir = package.build_directory / tool
+    stamp_dir.mkdir(exist_ok=True)
+    return WorkspaceJob("synthetic_package", tool, "unused", stamp_dir, arguments, list(), list(package.sources))
+
+
+def test_format_watch_job(tmpdir: Path, capsys):
+    package = generate_package(Path(tmpdir), source_count=4, header_count=6, include_depth=2, large_file_lines=100)
+    watch_job = FormatWatchJob(create_job(package, "clang_format", [f"--clang-format={STUB_CLANG_FORMAT}", "--no-cache"]))
+    assert watch_job.get_affected_files({str(package.sources[1]), str(package.headers[0])}) == [package.sources[1]]
+    assert watch_job.check([package.sources[1]])
+    assert capsys.readouterr().out.count("clang-format") == 10
+    assert not cmake_clang_tools_helpers.get_stale_files([package.sources[1]], watch_job.job.stamp_dir, "synthetic_package",
+                                                         "clang_format", list())
+
+
+def test_tidy_watch_job(tmpdir: Path, capsys):
+    package = generate_package(Path(tmpdir), source_count=4, header_count=6, include_depth=2, large_file_lines=100)
+    watch_job = TidyWatchJob(create_job(package, "clang_tidy", [f"--clang-tidy={STUB_CLANG_TIDY}", "--no-cache",
+                                                                f"--build-directory={package.build_directory}", "--config-file=",
+                                                                f"--header-dirs={package.headers[0].parent}"]))
+    # The headers of the project are watched, changed headers affect the translation units including them.
+    assert {str(header) for header in package.headers} <= watch_job.files
+    compile_database = CompileDatabase.load(str(package.build_directory))
+    includers = [source for source in package.sources if str(package.headers[2]) in compile_database.dependencies(source)]
+    assert includers
+    assert watch_job.get_affected_files({str(package.headers[2])}) == sorted(includers)
+    assert watch_job.get_affected_files({str(package.sources[3])}) == [package.sources[3]]
+
+    changed_count = check_changed_files([watch_job], {str(package.headers[2])})
+    assert changed_count == len(includers)
+    output = capsys.readouterr().out
+    assert output.count("warning: stub diagnostic") == 2 * len(includers)
+    assert f"[clang-tidy] {2 * len(includers)} diagnostics" in output
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from run_clang_tools_workspace import *
+from synthetic_workspace import STUB_CLANG_FORMAT
+
+
+def write_job_file(directory: Path, project: str, tool: str, sources: List[Path]) -> Path:
+    stamp_dir = directory / project / tool
+    stamp_dir.mkdir(parents=True)
+    job_file = stamp_dir / f"{project}-{tool}-workspace-job.txt"
+    lines = [f"project={project}", f"tool={tool}", "script=run.py", f"stamp_dir={stamp_dir}", "argument=--verbose",
+             "argument=--header-filter="] + [f"source={source}" for source in sources]
+    job_file.write_text("\n".join(lines) + "\n")
+    return job_file
+
+
+def test_parse_job_file(tmpdir: Path):
+    directory = Path(tmpdir)
+    job_file = write_job_file(directory, "project", "clang_tidy", [directory / "a.cpp", directory / "b.cpp"])
+    assert find_job_files([directory]) == [job_file]
+    job = parse_job_file(job_file)
+    assert job.project == "project"
+    assert job.tool == "clang_tidy"
+    assert job.arguments == ["--verbose", "--header-filter="]
+    assert job.sources == [directory / "a.cpp", directory / "b.cpp"]
+
+
+def test_collect_work_items(tmpdir: Path):
+    directory = Path(tmpdir)
+    small, large, other = directory / "small.cpp", directory / "large.cpp", directory / "other.cpp"
+    small.write_text("int a;\n")
+    large.write_text("int a;\n" * 100)
+    other.write_text("int a;\n" * 10)
+    jobs = [parse_job_file(write_job_file(directory, "first", "clang_format", [small, large])),
+            parse_job_file(write_job_file(directory, "first", "clang_tidy", [small, large])),
+            parse_job_file(write_job_file(directory, "second", "clang_tidy", [other]))]
+
+    work_items = collect_work_items(jobs, dict(), TOOL_NAMES, False)
+    # One work item per project and tool with all of its stale sources, the largest first.
+    assert [(work_item.job.project, work_item.job.tool) for work_item in work_items] == \
+        [("first", "clang_format"), ("first", "clang_tidy"), ("second", "clang_tidy")]
+    assert [work_item.sources for work_item in work_items] == [[small, large], [small, large], [other]]
+
+    work_items = collect_work_items(jobs, {"blacklist": ["first"]}, TOOL_NAMES, False)
+    assert [work_item.sources for work_item in work_items] == [[other]]
+    work_items = collect_work_items(jobs, {"whitelist": ["first"]}, ["clang_tidy"], False)
+    assert [work_item.sources for work_item in work_items] == [[small, large]]
+
+    # Sources with up to date proxy stamps are skipped, jobs without stale sources are not run.
+    cmake_clang_tools_helpers.touch_stamps([small], jobs[0].stamp_dir, "first", "clang_format")
+    work_items = collect_work_items(jobs[:1], dict(), TOOL_NAMES, False)
+    assert [work_item.sources for work_item in work_items] == [[large]]
+    cmake_clang_tools_helpers.touch_stamps([large], jobs[0].stamp_dir, "first", "clang_format")
+    work_items = collect_work_items(jobs[:1], dict(), TOOL_NAMES, False)
+    assert work_items == []
+    work_items = collect_work_items(jobs[:1], dict(), TOOL_NAMES, True)
+    assert [work_item.sources for work_item in work_items] == [[small, large]]
+
+
+def test_collect_work_items_longest_first(tmpdir: Path):
+    directory = Path(tmpdir)
+    sources = [directory / "small_slow.cpp", directory / "large_fast.cpp"]
+    sources[0].write_text("int a;\n")
+    sources[1].write_text("int a;\n" * 100)
+    jobs = [parse_job_file(write_job_file(directory, "fast", "clang_tidy", sources[1:])),
+            parse_job_file(write_job_file(directory, "slow", "clang_tidy", sources))]
+    with TimingDatabase(directory / "timings.sqlite") as timing_database:
+        timing_database.record("clang_tidy", sources[0], "config", 60.0)
+        timing_database.record("clang_tidy", sources[1], "config", 2.0)
+        work_items = collect_work_items(jobs, dict(), TOOL_NAMES, False, timing_database)
+    assert [(work_item.job.project, work_item.prediction) for work_item in work_items] == [("slow", 62.0), ("fast", 2.0)]
+
+
+def test_run_work_item(tmpdir: Path, monkeypatch):
+    directory = Path(tmpdir)
+    sources = [directory / "a.cpp", directory / "b.cpp"]
+    for source in sources:
+        source.write_text("int a;\n")
+    job_file = write_job_file(directory, "project", "clang_format", sources)
+    job = parse_job_file(job_file)._replace(script=str(Path(__file__).resolve().parent.parent / "bin" / "run_clang_format_tool.py"),
+                                            arguments=[f"--clang-format={STUB_CLANG_FORMAT}", "--no-cache"])
+    cmake_clang_tools_helpers.touch_stamps(sources[1:], job.stamp_dir, "project", "clang_format")
+    work_items = collect_work_items([job], dict(), TOOL_NAMES, True)
+
+    # A single process checks all sources of the project, its clang-format processes take the tokens of the pool.
+    command = build_command(work_items[0], 4, ["--no-timings"])
+    assert command[-3:] == ["--no-timings", str(sources[0]), str(sources[1])]
+    assert f"--stamp-dir={job.stamp_dir}" in command and "--jobs=4" in command
+
+    monkeypatch.setenv("STUB_CLANG_FORMAT_REPLACEMENTS", "0")
+    with TokenPool(4) as token_pool:
+        work_item, return_code, output, duration = run_work_item(work_items[0], token_pool, ["--no-timings"])
+    assert return_code == 0, output
+    # The script writes the stamps, the stamps of the forced sources were removed before.
+    assert cmake_clang_tools_helpers.get_stale_files(sources, job.stamp_dir, "project", "clang_format", list()) == []
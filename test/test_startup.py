@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+BIN_DIR = Path(__file__).resolve().parent.parent / "bin"
+SCRIPTS = ["run_clang_format_tool.py", "run_clang_tidy_tool.py"]
+# Modules that must not be imported if the scripts skip, since CMake runs them for every source file.
+HEAVY_MODULES = {"argparse", "concurrent", "json", "subprocess", "xml", "yaml"}
+# Import time budget of the skipping scripts in microseconds, on top of the interpreter startup.
+STARTUP_BUDGET_US = 20000
+
+
+def get_import_times(arguments: List[str]) -> Dict[str, int]:
+    """
+    Run Python with '-X importtime' and collect the cumulative import times of the top level imports.
+    :param arguments: Arguments passed to the interpreter.
+    :return: Dictionary mapping the module names to their cumulative import time in microseconds.
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", *arguments], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    import_times = dict()
+    for match in re.finditer(r"^import time:\s+\d+ \|\s+(\d+) \| (\S.*)$", output.stderr, re.MULTILINE):
+        import_times[match.group(2)] = int(match.group(1))
+    return import_times
+
+
+def test_skip_startup_budget(tmpdir: Path):
+    trigger_file = Path(tmpdir) / "trigger"
+    trigger_file.touch()
+    interpreter_imports = get_import_times(["-c", "pass"])
+    for script in SCRIPTS:
+        import_times = get_import_times([str(BIN_DIR / script), f"--trigger-file={trigger_file}", "source.cpp"])
+        script_imports = {module: time for module, time in import_times.items() if module not in interpreter_imports}
+        assert not HEAVY_MODULES & {module.split(".")[0] for module in script_imports}
+        assert sum(script_imports.values()) < STARTUP_BUDGET_US, script_imports
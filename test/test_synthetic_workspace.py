@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+from pathlib import Path
+import sys
+
+# Hack to avoid creating a module.
+sys.path.append(str(Path(__file__).resolve().parent.parent / "bin"))
+from cmake_clang_tools_compile_database import CompileDatabase
+from cmake_clang_tools_diagnostics import DiagnosticCollector
+from run_clang_format_tool import clang_format_check
+from run_clang_tidy_tool import execute_clang_tidy_shards
+from synthetic_workspace import *
+
+
+def test_generate_package_dependencies(tmpdir: Path):
+    package = generate_package(Path(tmpdir), source_count=4, header_count=6, include_depth=2, large_file_lines=100)
+    compile_database = CompileDatabase.load(str(package.build_directory))
+    # The dependency files cover the include chains, such that no compiler is needed.
+    assert compile_database.dependencies(package.sources[0]) == [str(package.sources[0])] + [str(header) for header in package.headers[:3]]
+    assert compile_database.dependencies(package.sources[3]) == [str(package.sources[3]), str(package.headers[3]), str(package.headers[4]),
+                                                                 str(package.headers[5])]
+
+
+def test_stubs(tmpdir: Path, capsys):
+    package = generate_package(Path(tmpdir), source_count=2, header_count=1, large_file_lines=100)
+    error_count, file_errors = clang_format_check(str(STUB_CLANG_FORMAT), package.sources, "file", False)
+    assert error_count == 20
+    results = execute_clang_tidy_shards(str(STUB_CLANG_TIDY), package.sources, "{}", str(package.build_directory), "", False, False,
+                                        False, "")
+    assert results == [0, 0]
+    assert capsys.readouterr().out.count("warning: stub diagnostic") == 4
+
+
+def test_stub_diagnostics_are_collected(tmpdir: Path, capsys):
+    package = generate_package(Path(tmpdir), source_count=2, header_count=1, large_file_lines=100)
+    collector = DiagnosticCollector()
+    # Both shards of the same source report the same diagnostics.
+    results = execute_clang_tidy_shards(str(STUB_CLANG_TIDY), package.sources[:1] * 2 + package.sources[1:], "{}",
+                                        str(package.build_directory), "", False, False, False, "", collector=collector)
+    assert results == [0, 0, 0]
+    assert capsys.readouterr().out == ""
+    assert len(collector.diagnostics) == 4
+    assert collector.duplicates == 2
+    assert collector.get_check_counts() == {"stub-check": 4}
+
+
+def test_stub_output_in_file_order(tmpdir: Path, capsys):
+    package = generate_package(Path(tmpdir), source_count=4, header_count=1, large_file_lines=100)
+    results = execute_clang_tidy_shards(str(STUB_CLANG_TIDY), package.sources, "{}", str(package.build_directory), "", False, False,
+                                        False, "", jobs=4, start_order=package.sources[::-1])
+    assert results == [0, 0, 0, 0]
+    output_files = [line.split(":")[0] for line in capsys.readouterr().out.splitlines() if "stub diagnostic 1" in line]
+    assert output_files == [str(source) for source in package.sources]